@@ -1,16 +1,47 @@
+import collections
+import contextlib
+import itertools
+import json
+import os
 import pathlib
 import sys
+import time
 
 import colorama
-import tqdm
 
+import alfeios.cache as ach
+import alfeios.exclusion as ax
 import alfeios.listing as al
+import alfeios.progress as ap
 import alfeios.serialize as asd
 import alfeios.tool as at
+import alfeios.trace as atr
 import alfeios.walker as aw
 
+# heavy modules only loaded by the commands that use them, so that the
+# command-line interface starts quickly
+ac = at.lazy_import('alfeios.columnar')  # loads numpy
+adg = at.lazy_import('alfeios.digest')  # loads numpy
+adm = at.lazy_import('alfeios.daemon')  # loads socketserver and threading
+asm = at.lazy_import('alfeios.summary')  # loads numpy
+athr = at.lazy_import('alfeios.throttle')  # loads ctypes
+tqdm = at.lazy_import('tqdm')
+# modules of a single command or option
+add = at.lazy_import('alfeios.dedupe')
+adf = at.lazy_import('alfeios.diff')
+ae = at.lazy_import('alfeios.external')  # with a memory budget
+aes = at.lazy_import('alfeios.estimate')  # loads statistics and random
+ao = at.lazy_import('alfeios.online')
+av = at.lazy_import('alfeios.verify')
+concurrent_futures = at.lazy_import('concurrent.futures')
 
-def index(path, exclusion=None, no_cache=False, progress_bar=False):
+
+def index(path, exclusion=None, no_cache=False, progress_bar=False,
+          resume=False, checkpoint_interval='10m', checkpoint_size=None,
+          max_duration=None, exclude_from=None, keep=None, keep_for=None,
+          progress_fd=None, xattr=False, archive_workers=None,
+          archive_space=None, trace=None, max_rate=None, max_files=None,
+          max_latency=None, low_priority=False):
     """
 
     - Index all file and directory contents in a root directory
@@ -21,18 +52,116 @@ def index(path, exclusion=None, no_cache=False, progress_bar=False):
        - A forbidden.json file that lists paths with no access
     - In case of no write access to the root directory, the output files are
       saved in a temp directory of the filesystem with a unique identifier
+    - The partial index is regularly saved as checkpoint files in the root
+      directory, as well as when the command is interrupted or fails,
+      so that a long index can be resumed later
+    - The tree.json file is saved as a delta of the last full index when
+      there are few changes, and old indexes can be removed according to a
+      retention policy
 
     Args:
         path (str or pathlib.Path): path to the root directory
-        exclusion (set of str): set of directories and files not to consider
+        exclusion (list of str): exclusion rules of the directories and files
+                                 not to consider - names, gitignore-style
+                                 glob patterns, re:<regex>, size<N, size>N,
+                                 age<D, age>D (see alfeios.exclusion)
+        exclude_from (str or pathlib.Path): file with one exclusion rule per
+                                            line
         no_cache: boolean to decide if we should use cache when it exists
+                  (the last index of the root directory, of its nearest
+                  indexed parent directory and of its indexed subdirectories)
         progress_bar: boolean to show command progress with a progress bar
+        progress_fd (int): file descriptor where progress events are written
+                           as json lines, for instance 2 for stderr
+                           default is None meaning no progress events
+        resume (bool): flag to carry the entries of the last checkpoint
+                       over to the new checkpoints until they are walked
+                       again - the last checkpoint is used as cache anyway
+                       default is False
+        checkpoint_interval (int or str): duration between 2 checkpoints,
+                                          in seconds or like '15m' or '1h'
+                                          default is '10m'
+        checkpoint_size (int or str): size to hash between 2 checkpoints,
+                                      in bytes or like '50GiB'
+                                      default is None meaning no size limit
+        max_duration (int or str): duration after which the index stops
+                                   cleanly, saving a checkpoint to be resumed
+                                   later, in seconds or like '2h'
+                                   default is None meaning no time limit
+        keep (int): number of indexes to keep in the root directory
+                    default is None meaning all of them
+        keep_for (int or str): age beyond which indexes are removed from the
+                               root directory, in seconds or like '30d'
+                               default is None meaning no age limit
+        xattr (bool): flag to cache hash-codes in the extended attributes of
+                      the files (Linux only), so that they are not hashed
+                      again when indexed from another root or after a copy
+                      preserving extended attributes
+                      default is False
+        archive_workers (int): number of processes unpacking compressed files
+                               while the walk goes on
+                               default is None meaning no process
+        archive_space (int or str): maximum total size of the compressed
+                                    files unpacked at the same time by the
+                                    processes, in bytes or like '20GiB'
+                                    default is None meaning no size limit
+        trace (str or pathlib.Path): path of a trace.json file where the
+                                     timeline of the run is saved, to be
+                                     opened in a trace viewer like
+                                     https://ui.perfetto.dev
+                                     default is None meaning no trace
+        max_rate (int or str): maximum rate of bytes read by the hashing per
+                               second, in bytes or like '50MiB'
+                               default is None meaning no limit
+        max_files (float): maximum number of files hashed per second
+                           default is None meaning no limit
+        max_latency (float or str): read latency, in seconds or like '50ms',
+                                    above which the hashing backs off as
+                                    the disk is busy
+                                    default is None meaning no back-off
+        low_priority (bool): flag to run with the lowest CPU priority and,
+                             on Linux, the idle I/O priority
+                             default is False
     """
 
-    _index(path, exclusion, no_cache, progress_bar, save_index=True)
+    exclusion = ax.build_exclusion(exclusion, exclude_from)
+    if low_priority and not athr.lower_priority():
+        print(colorama.Fore.YELLOW + 'Only the CPU priority is lowered, the'
+              ' I/O priority is not supported here', file=sys.stderr)
+    throttle = None
+    if max_rate is not None or max_files is not None \
+            or max_latency is not None:
+        throttle = athr.Throttle(_parse(max_rate, at.parse_natural_size),
+                                 _parse(max_files, float),
+                                 _parse(max_latency, at.parse_duration))
+    tracer = atr.Tracer() if trace is not None else None
+    try:
+        _index(path, exclusion, no_cache, progress_bar, save_index=True,
+               resume=resume, checkpoint=_Checkpoint(
+                   path, checkpoint_interval, checkpoint_size, max_duration),
+               progress_fd=progress_fd, tracer=tracer, walk_options=dict(
+                   use_xattr=xattr, archive_workers=archive_workers,
+                   archive_space=_parse(archive_space,
+                                        at.parse_natural_size),
+                   throttle=throttle))
+    finally:
+        # also saved when interrupted, to see where the run was stuck
+        if tracer is not None:
+            tracer.save(trace)
+            print(colorama.Fore.GREEN + f'{pathlib.Path(trace).name} written'
+                  f' with {len(tracer.events)} spans')
+    if (keep is not None or keep_for is not None) \
+            and pathlib.Path(path).is_dir():
+        removed = asd.prune_json_trees(pathlib.Path(path), keep,
+                                       _parse(keep_for, at.parse_duration))
+        if removed:
+            print(colorama.Fore.GREEN + f'{removed} old indexes removed')
 
 
-def duplicate(path, exclusion=None, no_cache=False, save_index=False):
+def duplicate(path, exclusion=None, no_cache=False, save_index=False,
+              min_size=0, top=None, include=None, memory_budget=None,
+              exclude_from=None, compare=False, estimate=False,
+              sample_size='1 GiB', online=False):
     """
 
     - List all duplicated files and directories in a root directory
@@ -42,144 +171,970 @@ def duplicate(path, exclusion=None, no_cache=False, save_index=False):
       directory, the tree is deserialized from the json file instead of
       being generated, which is significantly quicker but of course less up to
       date
+    - If several root directories or tree.json files are passed, they are
+      combined like in merge and the result is saved in their common root
+      directory
+    - Can restrict the result to the contents above a minimum size, to the
+      top groups with the largest potential space gain, and to the files
+      matching include rules - exclusion rules also apply to the result
+      when a tree.json file is passed
+    - Can run out-of-core with a memory budget, for trees larger than RAM
     - Can save the tree.json and forbidden.json files in the root directory
     - In case of no write access to the root directory, the output files are
       saved in a temp directory of the filesystem with a unique identifier
 
     Args:
-        path (str or pathlib.Path): path to the root directory to parse or the
-                                    tree.json file to deserialize
-        exclusion (set of str): set of directories and files not to consider
+        path (str or pathlib.Path or list): path to the root directory to
+                                            parse or the tree.json file to
+                                            deserialize - or a list of them
+        exclusion (list of str): exclusion rules of the directories and files
+                                 not to consider - names, gitignore-style
+                                 glob patterns, re:<regex>, size<N, size>N,
+                                 age<D, age>D (see alfeios.exclusion)
+        exclude_from (str or pathlib.Path): file with one exclusion rule per
+                                            line
         no_cache: boolean to decide if we should use cache when it exists
         save_index (bool): flag to save the tree.json and forbidden.json files
                            in the root directory
                            default is False
+        min_size (int or str): minimum size of the contents to report,
+                               in bytes or as a natural size like '1 MiB'
+                               default is 0
+        top (int): number of duplicate groups to report, those with the
+                   largest potential space gain
+                   default is None meaning all groups
+        include (list of str): rules of the files to report, with the same
+                               syntax as exclusion rules
+                               default is None meaning all files
+        memory_budget (int or str): memory used to sort the index, in bytes
+                                    or as a natural size like '2 GiB' - the
+                                    index is spilled to sorted run files on
+                                    disk instead of being held in memory
+                                    default is None meaning all in memory
+        compare (bool): flag to find the duplicates of a root directory by
+                        comparing the bytes of the files sharing their size,
+                        instead of hashing every file - quicker when few
+                        files share their size - the index is not saved
+                        default is False
+        estimate (bool): flag to only estimate the space gain of a root
+                         directory, by hashing a sample of the files sharing
+                         their size - their hash-codes are saved as a
+                         checkpoint, used as cache by the next index or
+                         duplicate - no listing is saved
+                         default is False
+        sample_size (int or str): number of bytes to hash for the estimate,
+                                  or a natural size like '1 GiB'
+                                  default is '1 GiB'
+        online (bool): flag to write each duplicate group to the standard
+                       output as a json line as soon as it is formed or
+                       grown during the index, with the running space gain
+                       - other messages are printed on the standard error
+                       and only the minimum size applies to these groups
+                       default is False
     """
 
-    path = pathlib.Path(path)
-    if path.is_file() and path.name.endswith('_tree.json'):
-        tree = asd.load_json_tree(path)
-        # todo fragile hypothesis that this is inside an .alfeios directory
-        path = path.parent.parent
-    else:
-        tree = _index(path, exclusion, no_cache, save_index=save_index)
+    if isinstance(min_size, str):
+        min_size = at.parse_natural_size(min_size)
+    exclusion = ax.build_exclusion(exclusion, exclude_from)
+    is_filtered = min_size or top is not None or include or exclusion
 
-    listing = al.tree_to_listing(tree)
-    duplicate_listing, size_gain = al.get_duplicate(listing)
+    if estimate:
+        paths = _as_paths(path)
+        if len(paths) == 1 and paths[0].is_dir():
+            _estimate_duplicate(paths[0], exclusion, no_cache, min_size,
+                                _parse(sample_size, at.parse_natural_size))
+            return
+        print(colorama.Fore.YELLOW + 'Estimation only applies to a single'
+              ' root directory - listing instead', file=sys.stderr)
 
-    if duplicate_listing:
-        f = asd.save_json_listing(path, duplicate_listing)
-        f = at.add_suffix(f, '_duplicate')
-        print(colorama.Fore.GREEN +
-              f'You can gain {at.natural_size(size_gain)} '
-              f'space by going through {f}')
+    if compare:
+        paths = _as_paths(path)
+        if len(paths) == 1 and paths[0].is_dir() and not save_index \
+                and memory_budget is None:
+            duplicate_listing, _ = _get_compared_duplicate(
+                paths[0], exclusion, no_cache, min_size)
+            if is_filtered:
+                duplicate_listing, _ = al.get_filtered_duplicate(
+                    duplicate_listing.items(), min_size=min_size, top=top,
+                    include=include, exclude=exclusion)
+            _save_duplicate(paths[0], duplicate_listing.items())
+            return
+        print(colorama.Fore.YELLOW + 'Byte comparison only applies to a'
+              ' single root directory without saving its index nor a memory'
+              ' budget - hashing instead', file=sys.stderr)
+
+    detector = None
+    if online:
+        if memory_budget is None:
+            detector = ao.OnlineDuplicate(_get_group_writer(sys.stdout),
+                                          min_size)
+        else:
+            print(colorama.Fore.YELLOW + 'Online duplicate groups are not'
+                  ' written with a memory budget', file=sys.stderr)
+
+    if memory_budget is not None:
+        with ae.SortedRuns(memory_budget) as runs:
+            _load_or_index(path, exclusion, no_cache, save_index, tree=runs)
+            duplicate_groups = ae.iter_duplicate(runs.sorted_records())
+            if is_filtered:
+                duplicate_listing, _ = al.get_filtered_duplicate(
+                    duplicate_groups, min_size=min_size, top=top,
+                    include=include, exclude=exclusion)
+                duplicate_groups = duplicate_listing.items()
+            _save_duplicate(_get_root(path), duplicate_groups)
+        return
+
+    if detector is not None:
+        # the standard output is kept for the duplicate groups
+        with contextlib.redirect_stdout(sys.stderr):
+            tree = _load_or_index(path, exclusion, no_cache, save_index,
+                                  tree=detector)
+            _save_tree_duplicate(path, tree, is_filtered, min_size, top,
+                                 include, exclusion)
+        return
+
+    if _is_single_json_tree(path):
+        # answered in milliseconds by the daemon when it is running
+        duplicate_groups = adm.query_duplicate(
+            _as_paths(path)[0], min_size=min_size, top=top, include=include,
+            exclusion=exclusion)
+        if duplicate_groups is not None:
+            _save_duplicate(_get_root(path), duplicate_groups)
+            return
+
+    tree = _load_or_index(path, exclusion, no_cache, save_index)
+    _save_tree_duplicate(path, tree, is_filtered, min_size, top, include,
+                         exclusion)
+
+
+def _save_tree_duplicate(path, tree, is_filtered, min_size, top, include,
+                         exclusion):
+    columns = ac.tree_to_columns(tree)
+    if is_filtered:
+        duplicate_listing, _ = al.get_filtered_duplicate(
+            ac.iter_duplicate(columns, min_size=min_size), top=top,
+            include=include, exclude=exclusion)
     else:
-        print(colorama.Fore.GREEN +
-              'Congratulations there is no duplicate here')
+        duplicate_listing, _ = ac.get_duplicate(columns)
+    _save_duplicate(_get_root(path), duplicate_listing.items())
+
+
+def _get_group_writer(file):
+    def write_group(event):
+        file.write(json.dumps(dict(
+            event._asdict(),
+            paths=[pathlib.PurePath(p).as_posix() for p in event.paths]))
+            + '\n')
+        file.flush()  # to be read while the index goes on
+    return write_group
 
 
 def missing(old_path, new_path, exclusion=None, no_cache=False,
-            save_index=False):
+            save_index=False, memory_budget=None, exclude_from=None):
     """
 
     - List all files and directories that are present in an old root directory
       and that are missing in a new one
     - Save result as a missing_listing.json file in the old root directory
     - Print the number of missing files
+    - The old and new root directories are indexed in parallel
+    - Can run out-of-core with a memory budget, for trees larger than RAM
     - If a tree.json file is passed as positional argument instead of a root
       directory, the corresponding tree is deserialized from the json file
       instead of being generated, which is significantly quicker but of course
-      less up to date
+      less up to date - exclusion rules then apply to its files
+    - Several old or new root directories or tree.json files can be passed,
+      separated by ';' - they are then combined like in merge
     - Can save the tree.json and forbidden.json files in the 2 root directories
+    - If a summary file (see summary) is passed as new path, for instance
+      exported from another machine, the old tree is checked against it in
+      one streaming pass
     - In case of no write access to the new root directory, the output files
       are saved in a temp directory of the filesystem with a unique identifier
 
     Args:
-        old_path (str or pathlib.Path): path to the old root directory to parse
-                                        or the tree.json file to deserialize
-        new_path (str or pathlib.Path): path to the new root directory to parse
-                                        or the tree.json file to deserialize
-        exclusion (set of str): set of directories and files not to consider
+        old_path (str or pathlib.Path or list): path to the old root directory
+                                                to parse or the tree.json file
+                                                to deserialize - or a list of
+                                                them
+        new_path (str or pathlib.Path or list): path to the new root directory
+                                                to parse or the tree.json file
+                                                to deserialize - or a list of
+                                                them - or a summary file
+        exclusion (list of str): exclusion rules of the directories and files
+                                 not to consider - names, gitignore-style
+                                 glob patterns, re:<regex>, size<N, size>N,
+                                 age<D, age>D (see alfeios.exclusion)
+        exclude_from (str or pathlib.Path): file with one exclusion rule per
+                                            line
         no_cache: boolean to decide if we should use cache when it exists
         save_index (bool): flag to save the tree.json and forbidden.json files
                            in the 2 root directories
                            default is False
+        memory_budget (int or str): memory used to sort each index, in bytes
+                                    or as a natural size like '2 GiB' - the
+                                    indexes are spilled to sorted run files
+                                    on disk instead of being held in memory
+                                    default is None meaning all in memory
+    """
+
+    exclusion = ax.build_exclusion(exclusion, exclude_from)
+    new_paths = _as_paths(new_path)
+    if len(new_paths) == 1 and asm.is_summary(new_paths[0]):
+        if _is_single_json_tree(old_path):
+            old_items = _iter_json_tree(_as_paths(old_path)[0], exclusion)
+        else:
+            old_items = _load_or_index(old_path, exclusion, no_cache,
+                                       save_index).items()
+        missing_listing = asm.get_missing(old_items, new_paths[0])
+        _save_missing(_get_root(old_path), missing_listing.items())
+        return
+
+    if memory_budget is not None:
+        if isinstance(memory_budget, str):
+            memory_budget = at.parse_natural_size(memory_budget)
+        # the 2 indexes are sorted at the same time: share the budget
+        with ae.SortedRuns(memory_budget // 2) as old_runs, \
+                ae.SortedRuns(memory_budget // 2) as new_runs:
+            _load_or_index_in_parallel(old_path, new_path, exclusion,
+                                       no_cache, save_index,
+                                       old_tree=old_runs, new_tree=new_runs)
+            missing_groups = ae.iter_missing(old_runs.sorted_records(),
+                                             new_runs.sorted_records())
+            _save_missing(_get_root(old_path), missing_groups)
+        return
+
+    if _is_single_json_tree(old_path) and _is_single_json_tree(new_path) \
+            and not exclusion:
+        # answered in milliseconds by the daemon when it is running
+        missing_groups = adm.query_missing(_as_paths(old_path)[0],
+                                           _as_paths(new_path)[0])
+        if missing_groups is not None:
+            _save_missing(_get_root(old_path), missing_groups)
+            return
+
+    old_tree, new_tree = _load_or_index_in_parallel(
+        old_path, new_path, exclusion, no_cache, save_index)
+    missing_listing = ac.get_missing(ac.tree_to_columns(old_tree),
+                                     ac.tree_to_columns(new_tree))
+    _save_missing(_get_root(old_path), missing_listing.items())
+
+
+def merge(paths, prefixes=None, output=None):
+    """
+
+    - Merge several indexes, for instance made per subdirectory or per
+      machine, into one combined index
+    - Each index is rebased under a path prefix in the combined index
+    - Indexes are streamed one after the other instead of being loaded in
+      memory
+    - Save the combined tree.json and forbidden.json files in the output
+      root directory
+    - In case of no write access to the output root directory, the output
+      files are saved in a temp directory of the filesystem with a unique
+      identifier
+
+    Args:
+        paths (list of str or pathlib.Path): tree.json files to merge, or root
+                                             directories whose last tree.json
+                                             file is merged
+        prefixes (list of str): path prefix of each index in the combined
+                                index
+                                default is None meaning the root directory
+                                of each index relative to the output root
+                                directory
+        output (str or pathlib.Path): root directory of the combined index
+                                      default is None meaning the common root
+                                      directory of all indexes
+    """
+
+    paths = [pathlib.Path(p) for p in paths]
+    tree_paths = []
+    for p in paths:
+        try:
+            tree_paths.append(p if _is_json_tree(p)
+                              else asd.find_last_json_tree(p))
+        except (ValueError, OSError):
+            print(colorama.Fore.RED + f'No index found in {p}'
+                  f' - run alfeios index first - exiting', file=sys.stderr)
+            return
+    output = _get_common_root(tree_paths) if output is None \
+        else pathlib.Path(output)
+    if prefixes is None:
+        prefixes = _get_default_prefixes(tree_paths, output)
+    elif len(prefixes) != len(tree_paths):
+        print(colorama.Fore.RED + f'{len(prefixes)} prefixes given for '
+              f'{len(tree_paths)} indexes - exiting', file=sys.stderr)
+        return
+
+    output.mkdir(parents=True, exist_ok=True)
+    tree = itertools.chain.from_iterable(
+        _rebase(asd.iter_json_tree(t), prefix)
+        for t, prefix in zip(tree_paths, prefixes))
+    forbidden = dict(itertools.chain.from_iterable(
+        _rebase(asd.load_json_forbidden(t).items(), prefix)
+        for t, prefix in zip(tree_paths, prefixes)))
+    f = asd.save_json_tree(output, tree, forbidden)
+    print(colorama.Fore.GREEN +
+          f'{len(tree_paths)} indexes merged in {f}')
+
+
+def diff(old_path, new_path=None, exclusion=None, no_cache=False,
+         save_index=False, exclude_from=None):
+    """
+
+    - List the changes between 2 indexes of a root directory: added,
+      removed, modified and moved files
+    - Compare 2 tree.json files, or a tree.json file and the live root
+      directory, with a sorted merge over paths
+    - Moves are detected on identical contents (hash-code and size)
+    - Changes are written to the standard output as a stream of json lines
+      and their number by kind is printed on the standard error
+
+    Args:
+        old_path (str or pathlib.Path): old tree.json file, or root directory
+                                        whose last tree.json file is used
+        new_path (str or pathlib.Path): new tree.json file, or root directory
+                                        to index
+                                        default is None meaning the root
+                                        directory of the old tree.json file
+        exclusion (list of str): exclusion rules of the directories and files
+                                 not to consider - names, gitignore-style
+                                 glob patterns, re:<regex>, size<N, size>N,
+                                 age<D, age>D (see alfeios.exclusion)
+        exclude_from (str or pathlib.Path): file with one exclusion rule per
+                                            line
+        no_cache: boolean to decide if we should use cache when it exists
+        save_index (bool): flag to save the tree.json and forbidden.json files
+                           of the new root directory, so that it becomes the
+                           old index of the next diff
+                           default is False
     """
 
+    exclusion = ax.build_exclusion(exclusion, exclude_from)
     old_path = pathlib.Path(old_path)
-    if old_path.is_file() and old_path.name.endswith('_tree.json'):
-        old_tree = asd.load_json_tree(old_path)
-        # todo fragile hypothesis that this is inside an .alfeios directory
-        old_path = old_path.parent.parent
+    try:
+        old_tree_path = old_path if _is_json_tree(old_path) \
+            else asd.find_last_json_tree(old_path)
+    except (ValueError, OSError):
+        print(colorama.Fore.RED + f'No index found in {old_path} - exiting',
+              file=sys.stderr)
+        return
+    new_path = _get_root(old_tree_path) if new_path is None \
+        else pathlib.Path(new_path)
+    if not (_is_json_tree(new_path) or new_path.is_dir()):
+        print(colorama.Fore.RED + f'{new_path} is not a valid path - exiting',
+              file=sys.stderr)
+        return
+
+    old_items = asd.load_raw_json_tree(old_tree_path).items()
+    if _is_json_tree(new_path):
+        new_items = asd.load_raw_json_tree(new_path).items()
     else:
-        old_tree = _index(old_path, exclusion, no_cache, save_index=save_index)
+        # the standard output is kept for the changes
+        with contextlib.redirect_stdout(sys.stderr):
+            new_items = _index(new_path, exclusion, no_cache,
+                               save_index=save_index).items()
+    if exclusion:
+        old_items = exclusion.filter_items(old_items)
+        new_items = exclusion.filter_items(new_items)
+
+    counter = collections.Counter()
+    for change in adf.iter_diff(adf.sort_items(old_items),
+                                adf.sort_items(new_items)):
+        counter[change.kind] += 1
+        sys.stdout.write(_change_to_json(change) + '\n')
+    sys.stdout.flush()
+    print(colorama.Fore.GREEN + ', '.join(
+        f'{counter[kind]} {kind}' for kind
+        in (adf.ADDED, adf.REMOVED, adf.MODIFIED, adf.MOVED)),
+        file=sys.stderr)
+
+
+def _change_to_json(change):
+    return json.dumps({field: value for field, value
+                       in change._asdict().items() if value is not None})
+
+
+def find(paths, root='.'):
+    """
+
+    - Find if files already exist somewhere in an indexed root directory
+    - Only the given files are hashed: their contents are looked up in the
+      digest index saved next to the last tree.json file of the root
+      directory, with a binary search on the memory-mapped index, without
+      loading the tree
+    - Print the paths in the root directory holding the same content as each
+      file, and the number of files found
+
+    Args:
+        paths (list of str or pathlib.Path): files to look for - the files
+                                             of a directory are all looked
+                                             for
+        root (str or pathlib.Path): path to the indexed root directory, or
+                                    to a tree.json file
+                                    default is the current working directory
+    """
+
+    root = pathlib.Path(root)
+    try:
+        tree_path = root if _is_json_tree(root) \
+            else asd.find_last_json_tree(root)
+    except (ValueError, OSError):
+        print(colorama.Fore.RED + f'No index found in {root}'
+              f' - run alfeios index first - exiting', file=sys.stderr)
+        return
+    digest_path = adg.get_digest_path(tree_path)
+    if not adg.is_up_to_date(digest_path, tree_path):
+        print(f'Building digest index of {tree_path.name}', file=sys.stderr)
+        adg.save_digest_index(asd.iter_json_tree(tree_path), digest_path)
+
+    searched = dict()
+    for path in (pathlib.Path(p) for p in paths):
+        if path.is_dir():
+            tree, _ = aw.walk(path, should_unzip=False)
+            searched.update(_rebase(tree.items(), path))
+        elif path.is_file():
+            searched[path] = aw.index_file(path)
+        else:
+            print(colorama.Fore.RED + f'{path} is not a valid path',
+                  file=sys.stderr)
+
+    found = adg.find(digest_path, {(c[aw.HASH], c[aw.SIZE])
+                                   for c in searched.values()})
+    for path, content in searched.items():
+        pointers = found.get((content[aw.HASH], content[aw.SIZE]))
+        if pointers:
+            matches = ', '.join(sorted(str(p) for p, _ in pointers))
+            print(colorama.Fore.GREEN + f'{path} found as {matches}')
+        else:
+            print(colorama.Fore.YELLOW + f'{path} not found')
+    nb_found = sum(1 for c in searched.values()
+                   if (c[aw.HASH], c[aw.SIZE]) in found)
+    print(colorama.Fore.GREEN +
+          f'{nb_found} of {len(searched)} files found in {root}')
+
+
+def serve(paths=None, socket_path=None, refresh_interval='10s', stop=False):
+    """
+
+    - Run a daemon that keeps indexes and their content groups in memory,
+      listening on a Unix socket, until it is interrupted
+    - The duplicate and missing commands on tree.json files are then
+      transparently answered by the daemon, in milliseconds instead of
+      reloading and regrouping the trees
+    - Indexes are loaded at the first query on them and reloaded when their
+      tree.json file, or the last tree.json of their root directory, changes
+
+    Args:
+        paths (list of str or pathlib.Path): tree.json files or root
+                                             directories whose last tree.json
+                                             is loaded at start
+                                             default is None meaning none
+        socket_path (str or pathlib.Path): path of the Unix socket
+                                           default is None meaning the
+                                           ALFEIOS_SOCKET environment
+                                           variable or a socket of the temp
+                                           directory of the filesystem
+        refresh_interval (int or str): duration between 2 checks of the
+                                       loaded indexes, in seconds or like '1m'
+                                       default is '10s'
+        stop (bool): flag to stop the running daemon instead
+                     default is False
+    """
+
+    if stop:
+        if adm.stop(socket_path):
+            print(colorama.Fore.GREEN + 'Daemon stopped')
+        else:
+            print(colorama.Fore.RED + 'No daemon is running',
+                  file=sys.stderr)
+        return
+    adm.serve(paths, socket_path, _parse(refresh_interval, at.parse_duration))
+
+
+def summary(path='.', output=None, false_positive_rate=None):
+    """
+
+    - Export a compact summary of the contents of an indexed root directory,
+      without their paths: their sorted (hash-code, size) in binary, or a
+      Bloom filter of them for a very small footprint
+    - The summary can be shipped to another machine and passed to missing as
+      new path, instead of a tree.json file
+    - Save it as a summary.bin file next to the last tree.json file, or
+      at the given output path
+
+    Args:
+        path (str or pathlib.Path): path to the indexed root directory, or to
+                                    a tree.json file
+                                    default is the current working directory
+        output (str or pathlib.Path): path of the summary file
+                                      default is None meaning next to the
+                                      tree.json file
+        false_positive_rate (float or str): rate of missing contents wrongly
+                                            found in a Bloom summary, like
+                                            0.01
+                                            default is None meaning an exact
+                                            summary
+    """
 
-    new_path = pathlib.Path(new_path)
-    if new_path.is_file() and new_path.name.endswith('_tree.json'):
-        new_tree = asd.load_json_tree(new_path)
+    path = pathlib.Path(path)
+    try:
+        tree_path = path if _is_json_tree(path) \
+            else asd.find_last_json_tree(path)
+    except (ValueError, OSError):
+        print(colorama.Fore.RED + f'No index found in {path}'
+              f' - run alfeios index first - exiting', file=sys.stderr)
+        return
+    if output is None:
+        tag = tree_path.name.removesuffix(asd.DELTA_SUFFIX).removesuffix(
+            asd.TREE_SUFFIX)
+        output = tree_path.with_name(tag + asm.SUFFIX)
+    output = pathlib.Path(output)
+    asm.save_summary(asd.iter_json_tree(tree_path), output,
+                     _parse(false_positive_rate, float))
+    print(colorama.Fore.GREEN + f'{output.name} written on {output.parent}'
+          f' ({at.natural_size(output.stat().st_size)})')
+
+
+def dedupe(path='.', dry_run=False, reflink_only=False, workers=8):
+    """
+
+    - Reclaim the space of duplicate files, without hashing them again: in
+      each duplicate group, the oldest file is kept and the others are
+      replaced by reflinks to it where the filesystem supports them (Btrfs,
+      XFS), or by hard links otherwise
+    - A file is only replaced if its size and modification time are still
+      the indexed ones - files inside compressed files or on another device
+      than the kept file are skipped
+    - Groups are processed by batches in parallel threads
+    - Print the space reclaimed, or that could be reclaimed in a dry run
+
+    Args:
+        path (str or pathlib.Path): duplicate listing.json file, tree.json
+                                    file, or root directory whose last
+                                    tree.json is used
+                                    default is the current working directory
+        dry_run (bool): flag to only report the space that could be
+                        reclaimed, without replacing any file
+                        default is False
+        reflink_only (bool): flag to never replace files by hard links, that
+                             share their permissions, times and content
+                             changes
+                             default is False
+        workers (int): number of threads
+                       default is 8
+    """
+
+    path = pathlib.Path(path)
+    try:
+        if path.is_dir():
+            root, tree_path = path, asd.find_last_json_tree(path)
+        else:  # in the .alfeios directory of its root directory
+            root, tree_path = path.parent.parent, path
+        if _is_json_tree(tree_path):
+            columns = ac.tree_to_columns(asd.load_json_tree(tree_path))
+            duplicate_groups = ac.iter_duplicate(columns)
+        else:
+            duplicate_groups = asd.load_json_listing(tree_path).items()
+    except (ValueError, OSError):
+        print(colorama.Fore.RED + f'No index nor listing found in {path}'
+              f' - exiting', file=sys.stderr)
+        return
+
+    files = collections.Counter()
+    sizes = collections.Counter()
+    nb_metadata_errors = 0
+    for outcome in add.iter_dedupe(root, duplicate_groups, dry_run=dry_run,
+                                   allow_hardlink=not reflink_only,
+                                   workers=workers):
+        files[outcome.kind] += 1
+        sizes[outcome.kind] += outcome.size
+        nb_metadata_errors += outcome.metadata_error is not None
+
+    if dry_run:
+        print(colorama.Fore.GREEN +
+              f'{at.natural_size(sizes[add.LINKABLE])} can be reclaimed by'
+              f' replacing {files[add.LINKABLE]} files')
     else:
-        new_tree = _index(new_path, exclusion, no_cache, save_index=save_index)
+        reclaimed = sizes[add.REFLINKED] + sizes[add.HARDLINKED]
+        print(colorama.Fore.GREEN +
+              f'{at.natural_size(reclaimed)} reclaimed by replacing'
+              f' {files[add.REFLINKED]} files by reflinks and'
+              f' {files[add.HARDLINKED]} files by hard links')
+    if nb_metadata_errors:
+        print(colorama.Fore.YELLOW +
+              f'{nb_metadata_errors} reflinks could not keep the permissions'
+              f' and times of the files they replaced', file=sys.stderr)
+    if files[add.SKIPPED]:
+        print(colorama.Fore.YELLOW +
+              f'{files[add.SKIPPED]} files skipped as changed since indexed,'
+              f' inside compressed files or not linkable', file=sys.stderr)
 
-    old_listing = al.tree_to_listing(old_tree)
-    new_listing = al.tree_to_listing(new_tree)
-    missing_listing = al.get_missing(old_listing, new_listing)
 
-    if missing_listing:
-        f = asd.save_json_listing(old_path, missing_listing)
+def _save_duplicate(path, duplicate_groups):
+    counter = {'size_gain': 0}
+
+    def count(groups):
+        for content, pointers in groups:
+            counter['size_gain'] += content[al.SIZE] * (len(pointers) - 1)
+            yield content, pointers
+
+    duplicate_groups = iter(duplicate_groups)
+    first_group = next(duplicate_groups, None)
+    if first_group is not None:
+        f = asd.save_json_listing(
+            path, count(itertools.chain([first_group], duplicate_groups)))
+        f = at.add_suffix(f, '_duplicate')
+        print(colorama.Fore.GREEN +
+              f'You can gain {at.natural_size(counter["size_gain"])} '
+              f'space by going through {f}')
+    else:
+        print(colorama.Fore.GREEN +
+              'Congratulations there is no duplicate here')
+
+
+def _save_missing(path, missing_groups):
+    counter = {'contents': 0}
+
+    def count(groups):
+        for content, pointers in groups:
+            counter['contents'] += 1
+            yield content, pointers
+
+    missing_groups = iter(missing_groups)
+    first_group = next(missing_groups, None)
+    if first_group is not None:
+        f = asd.save_json_listing(
+            path, count(itertools.chain([first_group], missing_groups)))
         f = at.add_suffix(f, '_missing')
         print(colorama.Fore.GREEN +
-              f'There are {len(missing_listing)} Old files missing in New'
+              f'There are {counter["contents"]} Old files missing in New'
               f' - please go through {f} in Old')
     else:
         print(colorama.Fore.GREEN +
               'Congratulations Old content is totally included in New')
 
 
+def _is_json_tree(path):
+    return path.is_file() and path.name.endswith('_tree.json')
+
+
+def _is_single_json_tree(path):
+    paths = _as_paths(path)
+    return len(paths) == 1 and _is_json_tree(paths[0])
+
+
+def _as_paths(path):
+    # several root directories or tree.json files can be passed as a list
+    # or as a string separated by ';'
+    if isinstance(path, str):
+        path = [path] if pathlib.Path(path).exists() else path.split(';')
+    elif isinstance(path, pathlib.PurePath):
+        path = [path]
+    return [pathlib.Path(p) for p in path]
+
+
+def _get_root(path):
+    paths = _as_paths(path)
+    if len(paths) > 1:
+        return _get_common_root(paths)
+    [path] = paths
+    if _is_json_tree(path):
+        # todo fragile hypothesis that this is inside an .alfeios directory
+        return path.parent.parent
+    return path
+
+
+def _get_common_root(paths):
+    roots = [_get_root(p).resolve() for p in paths]
+    return pathlib.Path(os.path.commonpath(roots))
+
+
+def _get_default_prefixes(paths, output):
+    prefixes = []
+    for path in paths:
+        root = _get_root(path).resolve()
+        if root.is_relative_to(output.resolve()):
+            prefixes.append(root.relative_to(output.resolve()))
+        else:
+            prefixes.append(pathlib.Path(root.name))
+    return prefixes
+
+
+def _rebase(items, prefix):
+    prefix = pathlib.Path(prefix)
+    for path, content in items:
+        yield prefix / path, content
+
+
+def _load_or_index(path, exclusion=None, no_cache=False, save_index=False,
+                   tree=None):
+    paths = _as_paths(path)
+    if len(paths) > 1:
+        # several indexes are combined like in merge
+        if tree is None:
+            tree = dict()
+        prefixes = _get_default_prefixes(paths, _get_common_root(paths))
+        for p, prefix in zip(paths, prefixes):
+            if _is_json_tree(p):
+                sub_tree = _iter_json_tree(p, exclusion)
+            else:
+                sub_tree = _index(p, exclusion, no_cache,
+                                  save_index=save_index).items()
+            tree.update(_rebase(sub_tree, prefix))
+        return tree
+
+    [path] = paths
+    if _is_json_tree(path):
+        if tree is None:
+            if not exclusion:
+                return asd.load_json_tree(path)
+            tree = dict()
+        tree.update(_iter_json_tree(path, exclusion))
+        return tree
+    else:
+        return _index(path, exclusion, no_cache, save_index=save_index,
+                      tree=tree)
+
+
+def _iter_json_tree(path, exclusion=None):
+    # a tree.json is filtered as if it had been indexed with the exclusion
+    items = asd.iter_json_tree(path)
+    return exclusion.filter_items(items) if exclusion else items
+
+
+def _get_compared_duplicate(path, exclusion=None, no_cache=False, min_size=0):
+    # files inside compressed files cannot be read again once unpacked:
+    # they are hashed while the other files are only stat'ed
+    cache = dict() if no_cache else ach.Cache(path)
+    tree, _ = aw.walk(path, exclusion=exclusion, cache=cache,
+                      should_unzip=False, should_hash=False)
+    for p in [p for p in tree if at.is_compressed_file(path / p)]:
+        try:
+            zt, _ = aw.walk_archive(path / p, exclusion)
+        except Exception:
+            continue  # not unpackable: the compressed file itself is kept
+        tree.update((p / zp, content) for zp, content in zt.items())
+    return av.get_duplicate(path, tree, min_size=min_size)
+
+
+def _estimate_duplicate(path, exclusion=None, no_cache=False, min_size=0,
+                        sample_size=None):
+    # compressed files are not unpacked: they count as regular files
+    previous = asd.load_last_json_checkpoint(path)
+    cache = dict() if no_cache else ach.Cache(path, checkpoint=previous)
+    tree, forbidden = aw.walk(path, exclusion=exclusion, cache=cache,
+                              should_unzip=False, should_hash=False)
+    estimate = aes.get_estimate(path, tree, sample_size=sample_size,
+                                min_size=min_size)
+    if estimate.hashed_size:
+        # the sampled hash-codes are kept as cache for the next walk
+        hashed = {p: c for p, c in tree.items() if c[aw.HASH]}
+        asd.save_json_checkpoint(path, {**previous, **hashed}, forbidden)
+
+    if estimate.hashed_groups == estimate.groups:
+        print(colorama.Fore.GREEN +
+              f'You can gain {at.natural_size(estimate.size_gain)} space'
+              f' - all {estimate.groups} groups of files sharing their'
+              f' size hashed')
+    else:
+        print(colorama.Fore.GREEN +
+              f'You can gain about {at.natural_size(estimate.size_gain)}'
+              f' space - between {at.natural_size(estimate.lower)} and'
+              f' {at.natural_size(estimate.upper)} with 95% confidence -'
+              f' {estimate.hashed_groups} of {estimate.groups} groups of'
+              f' files sharing their size hashed')
+    if estimate.hashed_size:
+        print(colorama.Fore.GREEN +
+              f'{at.natural_size(estimate.hashed_size)} hashed are saved as'
+              f' a checkpoint - they are reused by the next index or'
+              f' duplicate')
+
+
+def _load_or_index_in_parallel(old_path, new_path, exclusion=None,
+                               no_cache=False, save_index=False,
+                               old_tree=None, new_tree=None):
+    # old and new roots are usually on different drives: index them in
+    # parallel as the walker does not depend on the current working directory
+    with concurrent_futures.ThreadPoolExecutor(max_workers=2) as executor:
+        old_future = executor.submit(_load_or_index, old_path, exclusion,
+                                     no_cache, save_index, old_tree)
+        new_future = executor.submit(_load_or_index, new_path, exclusion,
+                                     no_cache, save_index, new_tree)
+        return old_future.result(), new_future.result()
+
+
 def _index(path, exclusion=None, no_cache=False, progress_bar=False,
-           save_index=False):
+           save_index=False, tree=None, resume=False, checkpoint=None,
+           progress_fd=None, tracer=None, walk_options=None):
     path = pathlib.Path(path)
     if not path.is_dir():
         print(colorama.Fore.RED + f'{path} is not a valid path - exiting',
               file=sys.stderr)
-        return {}
+        return {} if tree is None else tree
     else:
-        cache = dict() if no_cache else asd.load_last_json_tree(path)
-        if progress_bar:
-            tree, forbidden = _walk_with_progressbar(
-                path, exclusion=exclusion, cache=cache)
-        else:
-            tree, forbidden = _walk_without_progressbar(
-                path, exclusion=exclusion, cache=cache)
+        # a tree spilled to disk keeps its cache on disk as well, so that
+        # memory does not grow with the previous index
+        disk_entries = None
+        # (alfeios.external is only loaded for a tree that is not a dict)
+        if (tree is not None and not isinstance(tree, dict)
+                and isinstance(tree, ae.SortedRuns) and not no_cache):
+            disk_entries = ae.DiskDict(temp_dir=tree.temp_dir)
+        with _span(tracer, 'load cache', atr.CACHE):
+            previous = asd.load_last_json_checkpoint(path) if resume \
+                else dict()
+            # without resume the last checkpoint is still used as cache
+            cache = previous if no_cache \
+                else ach.Cache(path, checkpoint=previous if resume else None,
+                               entries=disk_entries)
+        if tree is None:
+            tree = dict()
+        forbidden = dict()
+        if checkpoint is not None:
+            checkpoint.start(tree, forbidden, previous)
+        sinks = []
+        if progress_fd is not None:
+            progress_file = open(progress_fd, mode='w', closefd=False)
+            sinks.append(ap.JsonLinesSink(progress_file))
+        walk_options = dict(walk_options or {}, tracer=tracer)
+        try:
+            if progress_bar:
+                _walk_with_progressbar(
+                    path, exclusion=exclusion, cache=cache, tree=tree,
+                    forbidden=forbidden, checkpoint=checkpoint, sinks=sinks,
+                    **walk_options)
+            else:
+                _walk_without_progressbar(
+                    path, exclusion=exclusion, cache=cache, tree=tree,
+                    forbidden=forbidden, checkpoint=checkpoint, sinks=sinks,
+                    **walk_options)
+        except aw.StopWalk:
+            checkpoint.save()
+            print(colorama.Fore.YELLOW +
+                  f'Maximum duration reached after {len(tree)} files'
+                  f' - run again with --resume to continue',
+                  file=sys.stderr)
+            return tree
+        except BaseException:
+            # interrupted (KeyboardInterrupt) or failed: keep hashing work
+            if checkpoint is not None:
+                checkpoint.save()
+            raise
+        finally:
+            if disk_entries is not None:
+                disk_entries.close()
         if save_index:
-            asd.save_json_tree(path, tree, forbidden)
+            with _span(tracer, 'save index', atr.SERIALIZE):
+                asd.save_json_tree(path, tree, forbidden)
+                asd.remove_json_checkpoints(path)
         return tree
 
 
-def _walk_without_progressbar(path, exclusion=None, cache=None):
-    tree, forbidden = aw.walk(path, exclusion=exclusion, cache=cache,
-                              should_unzip=True, should_hash=True,
-                              pbar=None)
-    return tree, forbidden
+def _span(tracer, name, category, **args):
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.span(name, category, **args)
+
+
+class _Checkpoint:
+    # callback of the walk that regularly saves the partial index
+    # and stops the walk when the maximum duration is reached
 
+    def __init__(self, path, interval=None, size=None, max_duration=None):
+        self.path = pathlib.Path(path)
+        self.interval = _parse(interval, at.parse_duration)
+        self.size = _parse(size, at.parse_natural_size)
+        self.max_duration = _parse(max_duration, at.parse_duration)
+        self.tree = None
+        self.forbidden = None
+        self.previous = None
+        self.start_time = self.last_time = time.monotonic()
+        self.hashed_size = 0
 
-def _walk_with_progressbar(path, exclusion=None, cache=None):
-    # todo move to walker by injecting pbar so that tqdm is not known by walker
+    def start(self, tree, forbidden, previous=None):
+        self.tree = tree
+        self.forbidden = forbidden
+        # entries of the resumed checkpoint are kept until walked again
+        self.previous = dict() if previous is None else previous
+        self.start_time = self.last_time = time.monotonic()
+        self.hashed_size = 0
 
+    def __call__(self, hashed_size):
+        self.hashed_size += hashed_size
+        now = time.monotonic()
+        # only stop after hashing so that each run makes some progress
+        if (self.max_duration is not None and hashed_size > 0
+                and now - self.start_time >= self.max_duration):
+            raise aw.StopWalk
+        if ((self.interval is not None
+             and now - self.last_time >= self.interval)
+                or (self.size is not None and self.hashed_size >= self.size)):
+            self.save()
+
+    def save(self):
+        if self.tree or self.previous:
+            not_walked_yet = ((p, c) for p, c in self.previous.items()
+                              if p not in self.tree)
+            asd.save_json_checkpoint(
+                self.path, itertools.chain(self.tree.items(), not_walked_yet),
+                self.forbidden)
+        self.last_time = time.monotonic()
+        self.hashed_size = 0
+
+
+def _parse(value, parser):
+    return parser(value) if isinstance(value, str) else value
+
+
+def _walk_without_progressbar(path, exclusion=None, cache=None, tree=None,
+                              forbidden=None, checkpoint=None, sinks=None,
+                              **walk_options):
+    # walk_options: other arguments of walker.walk
+    progress = ap.Progress(sinks) if sinks else None
+    try:
+        tree, forbidden = aw.walk(path, exclusion=exclusion, cache=cache,
+                                  should_unzip=True, should_hash=True,
+                                  progress=progress, tree=tree,
+                                  forbidden=forbidden, checkpoint=checkpoint,
+                                  **walk_options)
+    finally:
+        if progress is not None:
+            progress.close()
+    return tree, forbidden
+
+
+def _walk_with_progressbar(path, exclusion=None, cache=None, tree=None,
+                           forbidden=None, checkpoint=None, sinks=None,
+                           **walk_options):
+    # walk_options: other arguments of walker.walk
     # First walk without hashing, just to get the total size to hash
     pbar_nb_files = tqdm.tqdm(total=1, desc='Exploring',
                               unit=' files', unit_scale=False)
+    progress = ap.Progress([ap.TqdmSink(pbar_nb_files, 'files')])
     t, f = aw.walk(path, exclusion=exclusion, cache=dict(),
                    should_unzip=True, should_hash=False,
-                   pbar=pbar_nb_files)
+                   progress=progress,
+                   archive_workers=walk_options.get('archive_workers'),
+                   archive_space=walk_options.get('archive_space'))
+    progress.close()
     path_size = sum(c[aw.SIZE] for c in t.values())
     pbar_nb_files.close()
 
     # Second walk with hashing and progress bar based on the total size to hash
+    # - files found in cache count as indexed bytes
     pbar_size = tqdm.tqdm(total=path_size, desc='Indexing ',
                           unit='B', unit_scale=True, unit_divisor=1024)
-    tree, forbidden = aw.walk(path, exclusion=exclusion, cache=cache,
-                              should_unzip=True, should_hash=True,
-                              pbar=pbar_size)
-    pbar_size.close()
+    progress = ap.Progress([ap.TqdmSink(pbar_size, 'bytes')]
+                           + list(sinks or []))
+    try:
+        tree, forbidden = aw.walk(path, exclusion=exclusion, cache=cache,
+                                  should_unzip=True, should_hash=True,
+                                  progress=progress, tree=tree,
+                                  forbidden=forbidden, checkpoint=checkpoint,
+                                  **walk_options)
+    finally:
+        progress.close()
+        pbar_size.close()
 
     return tree, forbidden
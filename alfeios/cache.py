@@ -0,0 +1,112 @@
+import collections.abc
+import pathlib
+import sys
+
+import colorama
+
+import alfeios.serialize as asd
+
+
+class Cache(collections.abc.Mapping):
+    """ Previous indexes of a root directory, to be used as walk cache
+
+    Besides the last index saved in the root directory itself, it reuses:
+    - the slice of the last index of the nearest ancestor directory
+      (only the entries below the root directory are kept in memory)
+    - the last indexes of descendant directories, that are loaded lazily,
+      only when the walk reaches a directory containing a .alfeios folder
+
+    All entries are re-based to be relative to the root directory.
+    Entries of the last checkpoint take precedence over the ones of the root
+    directory index, that take precedence over the ones of
+    the ancestor index, that take precedence over the ones of the descendant
+    indexes.
+
+    Args:
+        path (pathlib.Path): path to the root directory
+        checkpoint (dict = {pathlib.Path: (hash, int, int)}): last checkpoint
+                       of an index that has been interrupted, to resume it
+                       default is None meaning the last checkpoint saved in
+                       the root directory if any - by an interrupted index
+                       or by the estimate of duplicate
+        entries (collections.abc.MutableMapping): mapping holding the
+            entries, for instance an alfeios.external.DiskDict to keep them
+            on disk for a tree larger than RAM
+            default is None meaning a new dict
+    """
+
+    def __init__(self, path, checkpoint=None, entries=None):
+        self.root = pathlib.Path(path)
+        self.entries = dict() if entries is None else entries
+        self.visited = {pathlib.Path()}  # directories already looked at
+
+        sources = []
+        if checkpoint is None:
+            checkpoint = asd.load_last_json_checkpoint(self.root)
+        if checkpoint:
+            self.entries.update(checkpoint)
+            sources.append(checkpoint)
+        own_tree_path = _find_last_json_tree(self.root)
+        if own_tree_path is not None:
+            self._update(asd.iter_json_tree(own_tree_path))
+            sources.append(own_tree_path)
+        ancestor_tree_path, relative_root = self._find_ancestor_tree()
+        if ancestor_tree_path is not None:
+            self._update(_slice(asd.iter_json_tree(ancestor_tree_path),
+                                relative_root))
+            sources.append(ancestor_tree_path)
+        if not sources:
+            print(colorama.Fore.RED +
+                  f'No cache readable in {self.root.name} or its parents',
+                  file=sys.stderr)
+
+    def __contains__(self, path):
+        self._load_descendants(path)
+        return path in self.entries
+
+    def __getitem__(self, path):
+        self._load_descendants(path)
+        return self.entries[path]
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _update(self, items):
+        for path, content in items:
+            self.entries.setdefault(path, content)
+
+    def _find_ancestor_tree(self):
+        root = self.root.resolve()
+        for ancestor in root.parents:
+            tree_path = _find_last_json_tree(ancestor)
+            if tree_path is not None:
+                return tree_path, root.relative_to(ancestor)
+        return None, None
+
+    def _load_descendants(self, path):
+        # look for indexes in all the directories above path, top-down
+        for directory in reversed(pathlib.Path(path).parents):
+            if directory not in self.visited:
+                self.visited.add(directory)
+                tree_path = _find_last_json_tree(self.root / directory)
+                if tree_path is not None:
+                    self._update((directory / p, c) for p, c
+                                 in asd.iter_json_tree(tree_path))
+
+
+def _find_last_json_tree(dir_path):
+    if not (dir_path / '.alfeios').is_dir():
+        return None
+    try:
+        return asd.find_last_json_tree(dir_path)
+    except (ValueError, OSError):
+        return None
+
+
+def _slice(items, relative_root):
+    for path, content in items:
+        if path.is_relative_to(relative_root):
+            yield path.relative_to(relative_root), content
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import argparse
 import sys
 
 import colorama
@@ -39,6 +40,13 @@ def main():
   alfeios index
   alfeios idx -n D:/Pictures
   alfeios i
+  alfeios i -r --max-duration 8h D:/Pictures
+  alfeios i -x node_modules/ -x '*.tmp' -x 'size<4k' D:/Pictures
+  alfeios i --keep 30 --keep-for 90d D:/Pictures
+  alfeios i --progress-json 3 D:/Pictures 3>progress.jsonl
+  alfeios i --archive-workers 8 --archive-space 20GiB D:/Backups
+  alfeios i --trace trace.json D:/Pictures
+  alfeios i --low-priority --max-rate 50MiB --max-latency 20ms /srv/data
 ''',
         formatter_class=dsargparse.RawTextHelpFormatter
     )
@@ -56,6 +64,88 @@ def main():
         '-p', '--progress-bar', action='store_true',
         help='show command progress with a progress bar'
     )
+    parser_i.add_argument(
+        '--progress-json', type=int, dest='progress_fd', metavar='FD',
+        help='write progress events as json lines to the file descriptor FD'
+             ' - for example 2 for stderr'
+    )
+    parser_i.add_argument(
+        '--xattr', action='store_true',
+        help='cache hash-codes in the extended attributes of the files'
+             ' (Linux only), reused from any root and after copies'
+    )
+    parser_i.add_argument(
+        '--archive-workers', type=int, metavar='N',
+        help='unpack compressed files in N processes while the walk goes on'
+    )
+    parser_i.add_argument(
+        '--archive-space', metavar='SIZE',
+        help='maximum total size of the compressed files unpacked at the'
+             ' same time by the processes - for example 20GiB'
+    )
+    parser_i.add_argument(
+        '--trace', metavar='FILE',
+        help='save the timeline of the run in FILE, to be opened in a trace'
+             ' viewer like https://ui.perfetto.dev'
+    )
+    parser_i.add_argument(
+        '--max-rate', metavar='SIZE',
+        help='maximum size read per second by the hashing - for example'
+             ' 50MiB'
+    )
+    parser_i.add_argument(
+        '--max-files', type=float, metavar='N',
+        help='maximum number of files hashed per second'
+    )
+    parser_i.add_argument(
+        '--max-latency', metavar='DURATION',
+        help='back off while reading a block takes longer than this'
+             ' duration, as the disk is busy - for example 20ms'
+    )
+    parser_i.add_argument(
+        '--low-priority', action='store_true',
+        help='run with the lowest CPU priority and, on Linux, the idle I/O'
+             ' priority'
+    )
+    parser_i.add_argument(
+        '-x', '--exclude', action='append', dest='exclusion', metavar='RULE',
+        help='do not consider files and directories matching this rule'
+             ' - can be repeated - a rule is a name, a gitignore-style glob'
+             ' pattern (*.tmp, node_modules/, **/cache/**), re:<regex>,'
+             ' size<N, size>N, age<D, age>D or !<rule> to re-include'
+    )
+    parser_i.add_argument(
+        '--exclude-from', metavar='FILE',
+        help='read exclusion rules from FILE, one per line'
+    )
+    parser_i.add_argument(
+        '-r', '--resume', action='store_true',
+        help='resume an interrupted index from its last checkpoint'
+    )
+    parser_i.add_argument(
+        '--checkpoint-interval', default='10m', metavar='DURATION',
+        help='save a checkpoint of the partial index at this interval'
+             ' - for example 600, 15m or 1h - default is 10m'
+    )
+    parser_i.add_argument(
+        '--checkpoint-size', metavar='SIZE',
+        help='save a checkpoint of the partial index each time this size'
+             ' has been hashed - for example 50GiB'
+    )
+    parser_i.add_argument(
+        '--max-duration', metavar='DURATION',
+        help='stop cleanly after this duration, saving a checkpoint to be'
+             ' resumed later - for example 2h'
+    )
+    parser_i.add_argument(
+        '--keep', type=int, metavar='N',
+        help='only keep the N last indexes in the .alfeios directory'
+    )
+    parser_i.add_argument(
+        '--keep-for', metavar='DURATION',
+        help='remove the indexes older than this duration from the .alfeios'
+             ' directory - for example 30d'
+    )
 
     # create the parser for the duplicate command
     parser_d = subparsers_factory.add_parser(
@@ -66,14 +156,19 @@ def main():
   alfeios duplicate
   alfeios dup -ns D:/Pictures
   alfeios d D:/Pictures/.alfeios/2020_01_29_10_29_39_tree.json
+  alfeios d --min-size 1MiB --top 100 -x '*.tmp' -x .DS_Store D:/Pictures
+  alfeios d --compare D:/Pictures
+  alfeios d --estimate --sample-size 10GiB //nas/share
+  alfeios d --online D:/Pictures > groups.jsonl
 ''',
         formatter_class=dsargparse.RawTextHelpFormatter
     )
     parser_d.add_argument(
         'path',
-        nargs='?', default='.',
+        nargs='*', default='.',
         help='path to the root directory (or tree.json) - '
-             'default is current working directory'
+             'default is current working directory - '
+             'several ones are combined like in merge'
     )
     parser_d.add_argument(
         '-n', '--no-cache', action='store_true',
@@ -83,6 +178,58 @@ def main():
         '-s', '--save-index', action='store_true',
         help='save tree.json and forbidden.json files in the root directory'
     )
+    parser_d.add_argument(
+        '-x', '--exclude', action='append', dest='exclusion', metavar='RULE',
+        help='do not consider files and directories matching this rule'
+             ' - can be repeated - a rule is a name, a gitignore-style glob'
+             ' pattern (*.tmp, node_modules/, **/cache/**), re:<regex>,'
+             ' size<N, size>N, age<D, age>D or !<rule> to re-include'
+    )
+    parser_d.add_argument(
+        '--exclude-from', metavar='FILE',
+        help='read exclusion rules from FILE, one per line'
+    )
+    parser_d.add_argument(
+        '-m', '--memory-budget',
+        help='sort the index out-of-core within this memory budget'
+             ' - for example 2GiB - for trees larger than RAM'
+    )
+    parser_d.add_argument(
+        '--min-size', default=0,
+        help='only report contents of at least this size'
+             ' - for example 512, 10k or 1.5MiB'
+    )
+    parser_d.add_argument(
+        '-t', '--top', type=_positive_int,
+        help='only report the TOP duplicate groups with the largest'
+             ' potential space gain'
+    )
+    parser_d.add_argument(
+        '--include', action='append', metavar='RULE',
+        help='only report files matching this rule, with the same syntax as'
+             ' exclusion rules - can be repeated'
+    )
+    parser_d.add_argument(
+        '-c', '--compare', action='store_true',
+        help='compare the bytes of the files sharing their size instead of'
+             ' hashing every file - quicker when few files share their size'
+    )
+    parser_d.add_argument(
+        '-e', '--estimate', action='store_true',
+        help='only estimate the space gain, with confidence bounds, by'
+             ' hashing a sample of the files sharing their size - the'
+             ' hash-codes are saved as a checkpoint, used as cache by the'
+             ' next index or duplicate'
+    )
+    parser_d.add_argument(
+        '--sample-size', default='1GiB', metavar='SIZE',
+        help='size to hash for the estimate - default is 1GiB'
+    )
+    parser_d.add_argument(
+        '--online', action='store_true',
+        help='write each duplicate group to the standard output as a json'
+             ' line as soon as it is formed or grown during the index'
+    )
 
     # create the parser for the missing command
     parser_m = subparsers_factory.add_parser(
@@ -94,16 +241,20 @@ def main():
   alfeios missing D:/Pictures E:/AllPictures
   alfeios mis -ns D:/Pictures E:/AllPictures
   alfeios m D:/Pictures/.alfeios/2020_01_29_10_29_39_tree.json E:/AllPics
+  alfeios m D:/Pictures nas_2020_01_29_10_29_39_summary.bin
 ''',
         formatter_class=dsargparse.RawTextHelpFormatter
     )
     parser_m.add_argument(
         'old_path',
         help='path to the old root directory (or old tree.json)'
+             " - several ones can be separated by ';'"
     )
     parser_m.add_argument(
         'new_path',
-        help='path to the new root directory (or new tree.json)'
+        help='path to the new root directory (or new tree.json, or summary'
+             " exported by alfeios summary) - several ones can be separated"
+             " by ';'"
     )
     parser_m.add_argument(
         '-n', '--no-cache', action='store_true',
@@ -114,6 +265,217 @@ def main():
         help='save the tree.json and forbidden.json files in the 2 root'
              ' directories'
     )
+    parser_m.add_argument(
+        '-x', '--exclude', action='append', dest='exclusion', metavar='RULE',
+        help='do not consider files and directories matching this rule'
+             ' - can be repeated - a rule is a name, a gitignore-style glob'
+             ' pattern (*.tmp, node_modules/, **/cache/**), re:<regex>,'
+             ' size<N, size>N, age<D, age>D or !<rule> to re-include'
+    )
+    parser_m.add_argument(
+        '--exclude-from', metavar='FILE',
+        help='read exclusion rules from FILE, one per line'
+    )
+    parser_m.add_argument(
+        '-m', '--memory-budget',
+        help='sort the 2 indexes out-of-core within this memory budget'
+             ' - for example 2GiB - for trees larger than RAM'
+    )
+
+    # create the parser for the diff command
+    parser_f = subparsers_factory.add_parser(
+        func=alfeios.api.diff,
+        aliases=['dif', 'df'],
+        help='list the changes between 2 indexes of a root directory',
+        epilog='''examples:
+  alfeios diff D:/Pictures
+  alfeios dif -s D:/Pictures > changes.jsonl
+  alfeios df D:/Pictures/.alfeios/2020_01_29_10_29_39_tree.json E:/Pictures
+''',
+        formatter_class=dsargparse.RawTextHelpFormatter
+    )
+    parser_f.add_argument(
+        'old_path',
+        help='path to the old tree.json (or root directory whose last'
+             ' tree.json is used)'
+    )
+    parser_f.add_argument(
+        'new_path',
+        nargs='?',
+        help='path to the new tree.json (or root directory to index)'
+             ' - default is the root directory of the old tree.json'
+    )
+    parser_f.add_argument(
+        '-n', '--no-cache', action='store_true',
+        help='do not use cache already saved in .alfeios directory'
+    )
+    parser_f.add_argument(
+        '-s', '--save-index', action='store_true',
+        help='save tree.json and forbidden.json files in the new root'
+             ' directory'
+    )
+    parser_f.add_argument(
+        '-x', '--exclude', action='append', dest='exclusion', metavar='RULE',
+        help='do not consider files and directories matching this rule'
+             ' - can be repeated - a rule is a name, a gitignore-style glob'
+             ' pattern (*.tmp, node_modules/, **/cache/**), re:<regex>,'
+             ' size<N, size>N, age<D, age>D or !<rule> to re-include'
+    )
+    parser_f.add_argument(
+        '--exclude-from', metavar='FILE',
+        help='read exclusion rules from FILE, one per line'
+    )
+
+    # create the parser for the find command
+    parser_n = subparsers_factory.add_parser(
+        func=alfeios.api.find,
+        aliases=['fnd', 'f'],
+        help='find if files already exist in an indexed root directory',
+        epilog='''examples:
+  alfeios find -r D:/Pictures E:/Camera/IMG_0001.JPG E:/Camera/IMG_0002.JPG
+  alfeios fnd -r D:/Pictures E:/Camera
+  alfeios f photo.jpg
+''',
+        formatter_class=dsargparse.RawTextHelpFormatter
+    )
+    parser_n.add_argument(
+        'paths',
+        nargs='+',
+        help='files to look for (or directories whose files are all looked'
+             ' for)'
+    )
+    parser_n.add_argument(
+        '-r', '--root', default='.',
+        help='path to the indexed root directory (or tree.json)'
+             ' - default is current working directory'
+    )
+
+    # create the parser for the summary command
+    parser_u = subparsers_factory.add_parser(
+        func=alfeios.api.summary,
+        aliases=['sum'],
+        help='export a compact summary of the contents of an indexed root'
+             ' directory, for missing on another machine',
+        epilog='''examples:
+  alfeios summary E:/AllPictures
+  alfeios sum -o nas_summary.bin --bloom 0.001 E:/AllPictures
+''',
+        formatter_class=dsargparse.RawTextHelpFormatter
+    )
+    parser_u.add_argument(
+        'path',
+        nargs='?', default='.',
+        help='path to the indexed root directory (or tree.json)'
+             ' - default is current working directory'
+    )
+    parser_u.add_argument(
+        '-o', '--output',
+        help='path of the summary file - default is next to the tree.json'
+    )
+    parser_u.add_argument(
+        '--bloom', dest='false_positive_rate', metavar='RATE', type=_rate,
+        help='save a Bloom filter with this false positive rate, like 0.01,'
+             ' instead of the exact contents - much smaller, but a missing'
+             ' content is wrongly found at this rate'
+    )
+
+    # create the parser for the dedupe command
+    parser_e = subparsers_factory.add_parser(
+        func=alfeios.api.dedupe,
+        aliases=['ddp'],
+        help='reclaim the space of duplicate files with reflinks or hard'
+             ' links',
+        epilog='''examples:
+  alfeios dedupe --dry-run D:/Pictures
+  alfeios ddp D:/Pictures/.alfeios/2020_01_29_10_29_39_listing_duplicate.json
+  alfeios ddp --reflink-only -w 16 /mnt/btrfs/backups
+''',
+        formatter_class=dsargparse.RawTextHelpFormatter
+    )
+    parser_e.add_argument(
+        'path',
+        nargs='?', default='.',
+        help='path to the duplicate listing.json, tree.json or root directory'
+             ' whose last tree.json is used - default is current working'
+             ' directory'
+    )
+    parser_e.add_argument(
+        '-d', '--dry-run', action='store_true',
+        help='only report the space that could be reclaimed'
+    )
+    parser_e.add_argument(
+        '--reflink-only', action='store_true',
+        help='never replace files by hard links, that share permissions,'
+             ' times and content changes'
+    )
+    parser_e.add_argument(
+        '-w', '--workers', type=int, default=8,
+        help='number of threads - default is 8'
+    )
+
+    # create the parser for the serve command
+    parser_s = subparsers_factory.add_parser(
+        func=alfeios.api.serve,
+        aliases=['srv', 's'],
+        help='keep indexes in memory to answer queries on tree.json files'
+             ' in milliseconds',
+        epilog='''examples:
+  alfeios serve D:/Pictures E:/AllPictures &
+  alfeios srv -i 1m
+  alfeios s --stop
+''',
+        formatter_class=dsargparse.RawTextHelpFormatter
+    )
+    parser_s.add_argument(
+        'paths',
+        nargs='*',
+        help='tree.json files (or root directories whose last tree.json is'
+             ' used) to load at start - others are loaded at first query'
+    )
+    parser_s.add_argument(
+        '--socket', dest='socket_path', metavar='PATH',
+        help='path of the Unix socket - default is the ALFEIOS_SOCKET'
+             ' environment variable, or a socket in XDG_RUNTIME_DIR, or'
+             ' in a private directory of the temp directory'
+    )
+    parser_s.add_argument(
+        '-i', '--refresh-interval', default='10s', metavar='DURATION',
+        help='check the loaded indexes at this interval to reload the new'
+             ' snapshots - default is 10s'
+    )
+    parser_s.add_argument(
+        '--stop', action='store_true',
+        help='stop the running daemon'
+    )
+
+    # create the parser for the merge command
+    parser_g = subparsers_factory.add_parser(
+        func=alfeios.api.merge,
+        aliases=['mrg', 'g'],
+        help='merge several indexes into one combined index',
+        epilog='''examples:
+  alfeios merge D:/Pictures/2019 D:/Pictures/2020
+  alfeios mrg -o D:/Pictures host1_tree.json host2_tree.json -p 2019 -p 2020
+''',
+        formatter_class=dsargparse.RawTextHelpFormatter
+    )
+    parser_g.add_argument(
+        'paths',
+        nargs='+',
+        help='tree.json files to merge (or root directories whose last'
+             ' tree.json is merged)'
+    )
+    parser_g.add_argument(
+        '-p', '--prefix', action='append', dest='prefixes',
+        help='path prefix of each index in the combined index, in the order'
+             ' of the paths - default is the root directory of each index'
+             ' relative to the output directory'
+    )
+    parser_g.add_argument(
+        '-o', '--output',
+        help='root directory of the combined index'
+             ' - default is the common root directory of all indexes'
+    )
 
     # parse command line and call appropriate function
     if len(sys.argv) == 1 or sys.argv[1] in ['help', 'h']:
@@ -128,6 +490,26 @@ Process interrupted''', file=sys.stderr)
         sys.exit(1)
 
 
+def _positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid int value: {text!r}')
+    if value < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1: {text}')
+    return value
+
+
+def _rate(text):
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid rate value: {text!r}')
+    if not 0 < value < 1:
+        raise argparse.ArgumentTypeError(f'must be between 0 and 1: {text}')
+    return value
+
+
 # to debug real use cases, set in your Debug Configuration something like:
 # Parameters = duplicate D:/Pictures -d
 #
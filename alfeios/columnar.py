@@ -0,0 +1,213 @@
+import collections
+
+import numpy as np
+
+import alfeios.walker as aw
+
+# Columns data
+DIGEST = 'digest'  # content md5 hashcode as fixed-width ascii bytes
+SIZE = 'size'      # content size in bytes as int64
+
+DIGEST_WIDTH = 32  # length of a md5 hexdigest
+KEY_DTYPE = np.dtype([(DIGEST, f'S{DIGEST_WIDTH}'), (SIZE, '>i8')])
+
+Columns = collections.namedtuple('Columns',
+                                 ['digest', 'size', 'mtime', 'paths'])
+
+
+def tree_to_columns(tree):
+    """ Converts a directory tree index to a columnar representation:
+    one NumPy array per content field, aligned on the path ids
+
+    Args:
+        tree: dict = {pathlib.Path: (hash-code, int, float)}
+              directory index
+
+    Returns:
+        Columns = (digest : np.ndarray of fixed-width bytes,
+                   size   : np.ndarray of int64,
+                   mtime  : np.ndarray of float64,
+                   paths  : list of pathlib.Path indexed by path id)
+    """
+
+    n = len(tree)
+    paths = list(tree.keys())
+    contents = tree.values()
+    digest = np.array([c[aw.HASH] for c in contents],
+                      dtype=f'S{DIGEST_WIDTH}').reshape(n)
+    size = np.fromiter((c[aw.SIZE] for c in contents), dtype=np.int64,
+                       count=n)
+    # modification times are kept as float64 and not int64 to stay exactly
+    # equal to the ones of the tree (they have sub-second precision)
+    mtime = np.fromiter((c[aw.MTIME] for c in contents), dtype=np.float64,
+                        count=n)
+    return Columns(digest, size, mtime, paths)
+
+
+def tree_to_listing(tree):
+    """ Same as alfeios.listing.tree_to_listing, using a columnar grouping
+    """
+
+    columns = tree_to_columns(tree)
+    groups = group(columns)
+    # contents in order of first appearance like a listing
+    return _groups_to_listing(columns, groups,
+                              np.argsort(groups.first, kind='stable'))
+
+
+def get_duplicate(columns):
+    """ Same as alfeios.listing.get_duplicate, but computed on columns
+    instead of on a listing
+
+    Args:
+        columns (Columns): columnar directory index
+
+    Returns:
+        duplicate : collections.defaultdict(set) =
+                    {(hash-code, int): {(pathlib.Path, float)}}
+                    sorted by decreasing content size
+        size_gain : int
+    """
+
+    groups = group(columns)
+    duplicated = _get_duplicated(columns, groups)
+    sizes = columns.size[groups.first[duplicated]]
+    size_gain = int(np.sum(sizes * (groups.counts[duplicated] - 1)))
+    result = _groups_to_listing(columns, groups, duplicated)
+    return result, size_gain
+
+
+def iter_duplicate(columns, min_size=0, groups=None):
+    """ Lazily yields the duplicate groups of get_duplicate, one at a time,
+    so that only the groups consumed by the caller are ever built
+
+    Args:
+        columns (Columns): columnar directory index
+        min_size (int): minimum content size in bytes - default is 0
+        groups (Groups): content groups of columns, to reuse them
+                         default is None meaning they are computed
+
+    Yields:
+        ((hash-code, int), {(pathlib.Path, float)})
+        by decreasing content size
+    """
+
+    if groups is None:
+        groups = group(columns)
+    duplicated = _get_duplicated(columns, groups, min_size)
+    for g in duplicated:
+        yield _get_group(columns, groups, g)
+
+
+def get_missing(old_columns, new_columns, old_groups=None, new_groups=None):
+    """ Same as alfeios.listing.get_missing, but computed on columns
+    instead of on listings
+
+    Args:
+        old_columns (Columns): columnar index of the old root directory
+        new_columns (Columns): columnar index of the new root directory
+        old_groups (Groups): content groups of old_columns, to reuse them
+                             default is None meaning they are computed
+        new_groups (Groups): content groups of new_columns, to reuse them
+                             default is None meaning they are computed
+
+    Returns:
+        collections.defaultdict(set) =
+            {(hash-code, int): {(pathlib.Path, float)}}
+    """
+
+    if old_groups is None:
+        old_groups = group(old_columns)
+    new_keys = np.unique(_keys(new_columns)) if new_groups is None \
+        else new_groups.keys
+    non_included = np.flatnonzero(~np.isin(old_groups.keys, new_keys,
+                                           assume_unique=True))
+    return _groups_to_listing(old_columns, old_groups, non_included)
+
+
+def lookup(columns, groups, contents):
+    """ Finds contents in a columnar directory index with a binary search
+    on its sorted content keys
+
+    Args:
+        columns (Columns): columnar directory index
+        groups (Groups): content groups of columns
+        contents (iterable of (hash-code, int)): contents to look up
+
+    Returns:
+        collections.defaultdict(set) =
+            {(hash-code, int): {(pathlib.Path, float)}}
+            for the contents found, in the order of contents
+    """
+
+    contents = list(contents)
+    searched = np.empty(len(contents), dtype=KEY_DTYPE)
+    searched[DIGEST] = [c[0] for c in contents]
+    searched[SIZE] = [c[1] for c in contents]
+    searched = searched.view(f'S{KEY_DTYPE.itemsize}').reshape(-1)
+    positions = np.searchsorted(groups.keys, searched)
+    positions = np.minimum(positions, len(groups.keys) - 1)
+    found = positions[groups.keys[positions] == searched] \
+        if len(groups.keys) else positions[:0]
+    return _groups_to_listing(columns, groups, found)
+
+
+# Content groups of a columnar directory index, in the order of their
+# sorted content keys:
+# - keys   : unique content keys
+# - first  : id of the first path of each group
+# - counts : number of paths of each group
+# - starts : start of each group in members
+# - members: path ids sorted by group
+Groups = collections.namedtuple('Groups', [
+    'keys', 'first', 'counts', 'starts', 'members'])
+
+
+def group(columns):
+    """
+    Args:
+        columns (Columns): columnar directory index
+
+    Returns:
+        Groups: content groups, that can be computed once and reused
+    """
+
+    keys = _keys(columns)
+    unique_keys, first, inverse, counts = np.unique(
+        keys, return_index=True, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    members = np.argsort(inverse, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return Groups(unique_keys, first, counts, starts, members)
+
+
+def _keys(columns):
+    # content keys (digest, size) packed into a single fixed-width bytes
+    # array so that they can be sorted, uniqued and searched in one pass
+    keys = np.empty(len(columns.paths), dtype=KEY_DTYPE)
+    keys[DIGEST] = columns.digest
+    keys[SIZE] = columns.size
+    return keys.view(f'S{KEY_DTYPE.itemsize}')
+
+
+def _get_duplicated(columns, groups, min_size=0):
+    sizes = columns.size[groups.first]
+    duplicated = np.flatnonzero((groups.counts >= 2) & (sizes >= min_size))
+    # decreasing size, ties kept in order of first appearance like a listing
+    order = np.lexsort((groups.first[duplicated], -sizes[duplicated]))
+    return duplicated[order]
+
+
+def _get_group(columns, groups, g):
+    first = groups.first[g]
+    content = (columns.digest[first].decode(), int(columns.size[first]))
+    start = groups.starts[g]
+    members = groups.members[start:start + groups.counts[g]]
+    pointers = {(columns.paths[i], m) for i, m
+                in zip(members.tolist(), columns.mtime[members].tolist())}
+    return content, pointers
+
+
+def _groups_to_listing(columns, groups, group_ids):
+    return collections.defaultdict(set, (_get_group(columns, groups, g)
+                                         for g in group_ids))
@@ -0,0 +1,344 @@
+import collections
+import getpass
+import json
+import os
+import pathlib
+import socket
+import socketserver
+import stat as st
+import sys
+import tempfile
+import threading
+
+import colorama
+
+import alfeios.exclusion as ax
+import alfeios.listing as al
+import alfeios.serialize as asd
+import alfeios.tool as at
+
+ac = at.lazy_import('alfeios.columnar')  # loads numpy
+
+SOCKET_ENV = 'ALFEIOS_SOCKET'  # environment variable overriding the socket
+SOCKET_NAME = 'alfeios.sock'
+TIMEOUT = 600  # seconds to wait for a daemon answer
+
+# Index held in memory: the tree it was loaded from, the stamp of its files
+# to detect a new snapshot, its columns and their content groups
+_Entry = collections.namedtuple('_Entry', [
+    'tree_path', 'stamp', 'columns', 'groups'])
+
+
+def get_socket_path():
+    """
+    Returns:
+        pathlib.Path: path of the daemon Unix socket - it can be set with the
+                      ALFEIOS_SOCKET environment variable, else it is in the
+                      XDG_RUNTIME_DIR directory of the user if set, else in a
+                      directory of the temp directory only the user can
+                      access
+    """
+
+    if os.environ.get(SOCKET_ENV):
+        return pathlib.Path(os.environ[SOCKET_ENV])
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return pathlib.Path(os.environ['XDG_RUNTIME_DIR']) / SOCKET_NAME
+    return _private_dir() / SOCKET_NAME
+
+
+def serve(paths=None, socket_path=None, refresh_interval=10):
+    """ Runs the daemon until it is interrupted
+
+    Args:
+        paths (list of str or pathlib.Path): tree.json files or root
+                                             directories whose last tree.json
+                                             is loaded at start
+                                             default is None meaning none
+        socket_path (str or pathlib.Path): path of the Unix socket
+                                           default is None meaning
+                                           get_socket_path()
+        refresh_interval (float): seconds between 2 checks of the loaded
+                                  indexes, to reload the ones whose snapshot
+                                  has changed
+    """
+
+    socket_path = get_socket_path() if socket_path is None \
+        else pathlib.Path(socket_path)
+    if not hasattr(socket, 'AF_UNIX'):
+        print(colorama.Fore.RED + 'Unix sockets are not supported on this'
+              ' platform - exiting', file=sys.stderr)
+        return
+    if socket_path.parent == _private_dir() \
+            and not _make_private_dir(socket_path.parent):
+        print(colorama.Fore.RED + f'{socket_path.parent} can be accessed by'
+              f' other users - exiting', file=sys.stderr)
+        return
+    if request({'query': 'ping'}, socket_path) is not None:
+        print(colorama.Fore.RED + f'A daemon is already listening on'
+              f' {socket_path} - exiting', file=sys.stderr)
+        return
+    socket_path.unlink(missing_ok=True)  # left by a daemon that crashed
+
+    store = _Store()
+    for path in paths or []:
+        store.get(_absolute(path))
+    # the socket is created without permissions for the other users, as a
+    # chmod after it is bound would leave a window to connect
+    umask = os.umask(0o077)
+    try:
+        server = _Server(str(socket_path), store)
+    finally:
+        os.umask(umask)
+    stop = threading.Event()
+    refresher = threading.Thread(target=_refresh_loop,
+                                 args=(store, refresh_interval, stop),
+                                 daemon=True)
+    refresher.start()
+    print(colorama.Fore.GREEN + f'Listening on {socket_path} with'
+          f' {len(store.entries)} indexes loaded')
+    try:
+        server.serve_forever()
+    finally:
+        stop.set()
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+
+
+def request(message, socket_path=None):
+    """ Sends a query to the daemon
+
+    Args:
+        message (dict): query, with its name under the 'query' key
+        socket_path (str or pathlib.Path): path of the Unix socket
+                                           default is None meaning
+                                           get_socket_path()
+
+    Returns:
+        the result of the query, or None if no daemon is listening or if it
+        could not answer the query
+    """
+
+    socket_path = get_socket_path() if socket_path is None \
+        else pathlib.Path(socket_path)
+    if not hasattr(socket, 'AF_UNIX') or not _is_own(socket_path):
+        return None  # a socket of another user could answer anything
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(TIMEOUT)
+            client.connect(str(socket_path))
+            with client.makefile('rwb') as stream:
+                stream.write((json.dumps(message) + '\n').encode())
+                stream.flush()
+                response = json.loads(stream.readline())
+    except (OSError, ValueError):
+        return None
+    if 'error' in response:
+        print(colorama.Fore.RED + f'Daemon could not answer: '
+              f'{response["error"]}', file=sys.stderr)
+        return None
+    return response['result']
+
+
+def stop(socket_path=None):
+    """ Stops the daemon
+
+    Returns:
+        bool: True if a daemon was listening
+    """
+
+    return request({'query': 'stop'}, socket_path) is not None
+
+
+def query_duplicate(path, min_size=0, top=None, include=None,
+                    exclusion=None):
+    """ Same as the duplicate groups of alfeios.api.duplicate for a tree.json
+    file, answered by the daemon
+
+    Returns:
+        list of ((hash-code, int), {(pathlib.Path, float)}), or None if no
+        daemon could answer
+    """
+
+    result = request({'query': 'duplicate', 'path': _absolute(path),
+                      'min_size': min_size, 'top': top,
+                      'include': _rules(include),
+                      'exclusion': _rules(exclusion)})
+    return None if result is None else _decode_groups(result)
+
+
+def query_missing(old_path, new_path):
+    """ Same as the missing groups of alfeios.api.missing for 2 tree.json
+    files, answered by the daemon
+
+    Returns:
+        list of ((hash-code, int), {(pathlib.Path, float)}), or None if no
+        daemon could answer
+    """
+
+    result = request({'query': 'missing', 'old_path': _absolute(old_path),
+                      'new_path': _absolute(new_path)})
+    return None if result is None else _decode_groups(result)
+
+
+def query_lookup(path, contents):
+    """ Finds contents in a tree.json file, or in the last tree.json of a root
+    directory, answered by the daemon
+
+    Args:
+        path (str or pathlib.Path): tree.json file or root directory
+        contents (iterable of (hash-code, int)): contents to look up
+
+    Returns:
+        list of ((hash-code, int), {(pathlib.Path, float)}) for the contents
+        found, or None if no daemon could answer
+    """
+
+    result = request({'query': 'lookup', 'path': _absolute(path),
+                      'contents': [list(c) for c in contents]})
+    return None if result is None else _decode_groups(result)
+
+
+class _Store:
+    # indexes held in memory, by the path they have been queried with
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = dict()
+
+    def get(self, path):
+        tree_path = _find_tree(path)
+        stamp = _stamp(tree_path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if (entry is None or entry.tree_path != tree_path
+                    or entry.stamp != stamp):
+                columns = ac.tree_to_columns(asd.load_json_tree(tree_path))
+                entry = _Entry(tree_path, stamp, columns, ac.group(columns))
+                self.entries[path] = entry
+            return entry
+
+    def refresh(self):
+        for path in list(self.entries):
+            try:
+                self.get(path)
+            except (OSError, ValueError):
+                with self.lock:  # the snapshot has been removed
+                    self.entries.pop(path, None)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # one json query per line, answered by one json line
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+                response = {'result': _answer(self.server.store, message)}
+            except Exception as e:
+                message = dict()
+                response = {'error': f'{type(e).__name__}: {e}'}
+            self.wfile.write((json.dumps(response) + '\n').encode())
+            self.wfile.flush()
+            if message.get('query') == 'stop':
+                # shutdown waits for serve_forever: not from its own thread
+                threading.Thread(target=self.server.shutdown).start()
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class _Server(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, socket_path, store):
+            super().__init__(socket_path, _Handler)
+            self.store = store
+
+
+def _answer(store, message):
+    query = message['query']
+    if query in ('ping', 'stop'):
+        return query
+    if query == 'duplicate':
+        entry = store.get(message['path'])
+        include = ax.build_exclusion(message['include'])
+        exclusion = ax.build_exclusion(message['exclusion'])
+        groups = ac.iter_duplicate(entry.columns, message['min_size'],
+                                   groups=entry.groups)
+        if message['min_size'] or message['top'] is not None or include \
+                or exclusion:
+            listing, _ = al.get_filtered_duplicate(
+                groups, top=message['top'], include=include,
+                exclude=exclusion)
+            groups = listing.items()
+        return _encode_groups(groups)
+    if query == 'missing':
+        old = store.get(message['old_path'])
+        new = store.get(message['new_path'])
+        return _encode_groups(ac.get_missing(
+            old.columns, new.columns, old.groups, new.groups).items())
+    if query == 'lookup':
+        entry = store.get(message['path'])
+        contents = [tuple(c) for c in message['contents']]
+        return _encode_groups(ac.lookup(entry.columns, entry.groups,
+                                        contents).items())
+    raise ValueError(f'unknown query {query!r}')
+
+
+def _private_dir():
+    return pathlib.Path(tempfile.gettempdir()) / \
+        f'alfeios-{getpass.getuser()}'
+
+
+def _make_private_dir(path):
+    # True if the directory is only accessible by the user, so that no one
+    # else can replace the socket in it
+    path.mkdir(mode=0o700, exist_ok=True)
+    stat = path.lstat()
+    return (st.S_ISDIR(stat.st_mode) and stat.st_uid == os.getuid()
+            and st.S_IMODE(stat.st_mode) & 0o077 == 0)
+
+
+def _is_own(socket_path):
+    try:
+        return os.stat(socket_path).st_uid == os.getuid()
+    except OSError:  # no daemon
+        return False
+
+
+def _refresh_loop(store, interval, stop):
+    while not stop.wait(interval):
+        store.refresh()
+
+
+def _find_tree(path):
+    path = pathlib.Path(path)
+    return path if path.is_file() else asd.find_last_json_tree(path)
+
+
+def _stamp(tree_path):
+    # the base of a delta is never rewritten once the delta exists
+    stat = tree_path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _absolute(path):
+    return str(pathlib.Path(path).resolve())
+
+
+def _rules(rules):
+    if rules is None:
+        return []
+    if isinstance(rules, ax.Exclusion):
+        return rules.rules_text
+    return list(rules)
+
+
+def _encode_groups(groups):
+    return [[list(content), [[pathlib.PurePath(p).as_posix(), m]
+                             for p, m in pointers]]
+            for content, pointers in groups]
+
+
+def _decode_groups(groups):
+    return [((content[0], content[1]),
+             {(pathlib.Path(p), m) for p, m in pointers})
+            for content, pointers in groups]
@@ -0,0 +1,176 @@
+import collections
+import concurrent.futures
+import itertools
+import os
+import shutil
+import stat as st
+
+import alfeios.listing as al
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+FICLONE = 0x40049409  # Linux ioctl sharing the extents of a file (reflink)
+
+# Outcome kinds
+REFLINKED = 'reflinked'  # replaced by a reflink: a copy sharing its extents
+HARDLINKED = 'hardlinked'  # replaced by a hard link: the same file
+LINKABLE = 'linkable'  # would be replaced, in a dry run
+ALREADY_LINKED = 'already linked'  # already the same file as the kept one
+SKIPPED = 'skipped'  # changed since indexed, inside a compressed file,
+#                      on another device or not replaceable
+
+# metadata_error is the OSError raised while copying the permissions, owner
+# and times of a replaced file to its reflink, which is kept anyway
+Outcome = collections.namedtuple('Outcome',
+                                 ['kind', 'path', 'size', 'metadata_error'],
+                                 defaults=[None])
+
+
+def iter_dedupe(root, duplicate_groups, dry_run=False, allow_hardlink=True,
+                workers=8, batch_size=1000):
+    """ Reclaims the space of duplicate files, without hashing them again:
+    in each duplicate group, the oldest file is kept and the others are
+    replaced by reflinks to it where the filesystem supports them
+    (Btrfs, XFS), or by hard links otherwise
+
+    - a file is only replaced if its size and modification time are still
+      the indexed ones, as well as the ones of the kept file
+    - a reflink keeps the permissions and times of the replaced file, while
+      a hard link shares the ones of the kept file - if they cannot be
+      copied, the reflink is kept and the error is set in its outcome
+    - groups are processed by batches in parallel threads
+
+    Args:
+        root (pathlib.Path): root directory the paths are relative to
+        duplicate_groups (iterable of ((hash-code, int),
+                                       {(pathlib.Path, float)})):
+            duplicate groups, like the items of a duplicate listing
+        dry_run (bool): flag to only check the files, without replacing them
+                        default is False
+        allow_hardlink (bool): flag to replace files by hard links where
+                               reflinks are not supported
+                               default is True
+        workers (int): number of threads
+                       default is 8
+        batch_size (int): number of groups processed per task
+                          default is 1000
+
+    Yields:
+        Outcome = (kind, path, size, metadata_error) for each duplicate file
+                  but the kept ones
+    """
+
+    batches = _batched(duplicate_groups, batch_size)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        # at most 2 batches per thread in flight, for millions of groups
+        futures = collections.deque(
+            pool.submit(_dedupe_batch, root, batch, dry_run, allow_hardlink)
+            for batch in itertools.islice(batches, 2 * workers))
+        while futures:
+            outcomes = futures.popleft().result()
+            batch = next(batches, None)
+            if batch is not None:
+                futures.append(pool.submit(_dedupe_batch, root, batch,
+                                           dry_run, allow_hardlink))
+            yield from outcomes
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _dedupe_batch(root, batch, dry_run, allow_hardlink):
+    outcomes = []
+    for content, pointers in batch:
+        outcomes.extend(_dedupe_group(root, content, pointers, dry_run,
+                                      allow_hardlink))
+    return outcomes
+
+
+def _dedupe_group(root, content, pointers, dry_run, allow_hardlink):
+    size = content[al.SIZE]
+    kept, kept_stat = None, None
+    outcomes = []
+    for path, mtime in sorted(pointers, key=lambda p: (p[al.MTIME],
+                                                       str(p[al.PATH]))):
+        stat = _get_unchanged_stat(root / path, size, mtime)
+        if stat is None:
+            outcomes.append(Outcome(SKIPPED, path, size))
+        elif kept is None:
+            kept, kept_stat = path, stat  # the oldest unchanged file
+        elif (stat.st_dev, stat.st_ino) == (kept_stat.st_dev,
+                                            kept_stat.st_ino):
+            outcomes.append(Outcome(ALREADY_LINKED, path, size))
+        elif stat.st_dev != kept_stat.st_dev or size == 0:
+            outcomes.append(Outcome(SKIPPED, path, size))
+        elif dry_run:
+            outcomes.append(Outcome(LINKABLE, path, size))
+        else:
+            kind, metadata_error = _replace(root / kept, root / path,
+                                            allow_hardlink)
+            outcomes.append(Outcome(kind, path, size, metadata_error))
+    return outcomes
+
+
+def _get_unchanged_stat(full_path, size, mtime):
+    try:
+        stat = os.stat(full_path, follow_symlinks=False)
+    except OSError:  # removed, or inside a compressed file
+        return None
+    if not st.S_ISREG(stat.st_mode) or stat.st_size != size \
+            or stat.st_mtime != mtime:
+        return None
+    return stat
+
+
+def _replace(source, target, allow_hardlink):
+    # the target is replaced atomically by a temp file next to it
+    temp = target.with_name(f'.{target.name}.alfeios.tmp')
+    try:
+        if fcntl is not None and _clone(source, temp):
+            metadata_error = _copy_metadata(target, temp)
+            os.replace(temp, target)
+            return REFLINKED, metadata_error
+        if allow_hardlink:
+            os.link(source, temp)
+            os.replace(temp, target)
+            return HARDLINKED, None
+    except OSError:
+        temp.unlink(missing_ok=True)
+    return SKIPPED, None
+
+
+def _clone(source, temp):
+    try:
+        with source.open(mode='rb') as s, temp.open(mode='xb') as t:
+            fcntl.ioctl(t.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:  # not supported by the filesystem
+        temp.unlink(missing_ok=True)
+        return False
+
+
+def _copy_metadata(source, target):
+    # a failure is returned instead of raised: the clone is still a valid
+    # reflink, and falling back to a hard link would not keep more metadata
+    try:
+        _copy_owner(source, target)
+        shutil.copystat(source, target)
+    except OSError as e:
+        return e
+    return None
+
+
+def _copy_owner(source, target):
+    # the clone belongs to the user running dedupe, which is only allowed to
+    # give it away when running as root
+    stat = source.stat()
+    try:
+        os.chown(target, stat.st_uid, stat.st_gid)
+    except PermissionError:
+        pass
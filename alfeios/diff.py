@@ -0,0 +1,100 @@
+import collections
+
+import alfeios.walker as aw
+
+# Change kinds
+ADDED = 'added'        # path only in the new index
+REMOVED = 'removed'    # path only in the old index
+MODIFIED = 'modified'  # path in both indexes with different contents
+MOVED = 'moved'        # content removed from a path and added to another one
+
+Change = collections.namedtuple('Change', [
+    'kind', 'path', 'content', 'old_path', 'old_content'])
+
+
+def iter_diff(old_items, new_items):
+    """ Compares 2 indexes of a root directory path by path, with a merge of
+    the 2 streams of items sorted by path
+
+    - contents are compared on their hash-code and size, so that a file only
+      touched (new modification time, same content) is not reported
+    - a content removed from a path and added to another path is reported as
+      a move - when several paths share the same content, they are paired in
+      path order
+    - modifications are yielded during the merge, while additions and
+      removals are kept until the end of the merge to pair them in moves:
+      memory scales with the number of changes, not with the index size
+
+    Args:
+        old_items (iterable of (str, content)): items of the old tree
+                                                sorted by posix path
+        new_items (iterable of (str, content)): items of the new tree
+                                                sorted by posix path
+
+    Yields:
+        Change = (kind, path, content, old_path, old_content)
+        - path and content are None for a removal
+        - old_path and old_content are None for an addition
+        - old_path is None for a modification
+    """
+
+    removed = collections.defaultdict(list)  # {content key: [(path, content)]}
+    added = collections.defaultdict(list)
+    old_items = iter(old_items)
+    new_items = iter(new_items)
+    old = next(old_items, None)
+    new = next(new_items, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            removed[_key(old[1])].append(old)
+            old = next(old_items, None)
+        elif old is None or new[0] < old[0]:
+            added[_key(new[1])].append(new)
+            new = next(new_items, None)
+        else:
+            if _key(old[1]) != _key(new[1]):
+                yield Change(MODIFIED, new[0], new[1], None, old[1])
+            old = next(old_items, None)
+            new = next(new_items, None)
+
+    yield from _pair_moves(removed, added)
+
+
+def sort_items(tree):
+    """
+    Args:
+        tree (dict or iterable of (path, content)): directory index
+
+    Returns:
+        list of (str, content) sorted by posix path, as expected by iter_diff
+    """
+
+    items = tree.items() if hasattr(tree, 'items') else tree
+    return sorted((p if isinstance(p, str) else p.as_posix(), c)
+                  for p, c in items)
+
+
+def _key(content):
+    return content[aw.HASH], content[aw.SIZE]
+
+
+def _pair_moves(removed, added):
+    moves = []
+    for key in removed.keys() & added.keys():
+        old_items = sorted(removed.pop(key))
+        new_items = sorted(added.pop(key))
+        n = min(len(old_items), len(new_items))
+        moves.extend(Change(MOVED, new[0], new[1], old[0], old[1])
+                     for old, new in zip(old_items[:n], new_items[:n]))
+        if old_items[n:]:
+            removed[key] = old_items[n:]
+        if new_items[n:]:
+            added[key] = new_items[n:]
+
+    yield from sorted(moves, key=lambda c: c.path)
+    yield from sorted((Change(REMOVED, None, None, p, c)
+                       for items in removed.values() for p, c in items),
+                      key=lambda c: c.old_path)
+    yield from sorted((Change(ADDED, p, c, None, None)
+                       for items in added.values() for p, c in items),
+                      key=lambda c: c.path)
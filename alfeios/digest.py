@@ -0,0 +1,149 @@
+import collections
+import mmap
+import os
+import pathlib
+import struct
+
+import numpy as np
+
+import alfeios.walker as aw
+
+# Digest index file layout, all integers big-endian:
+# - header  : magic, number of records
+# - records : sorted by (md5 digest, size) so that they can be binary
+#             searched as raw bytes - (digest, size, mtime, path offset,
+#             path length)
+# - paths   : utf-8 posix paths, referenced by the records
+MAGIC = b'ALFEIOS-DIGEST-1'
+HEADER = struct.Struct('>16sQ')
+RECORD = struct.Struct('>16sqdQI')
+KEY_SIZE = 24  # digest and size: the sort key of the records
+RECORD_DTYPE = np.dtype([('digest', 'S16'), ('size', '>i8'),
+                         ('mtime', '>f8'), ('offset', '>u8'),
+                         ('length', '>u4')])
+
+SUFFIX = '.digest'
+
+
+def get_digest_path(tree_path):
+    """
+    Args:
+        tree_path (pathlib.Path): path of a json serialized tree
+
+    Returns:
+        pathlib.Path: path of its digest index, next to it
+    """
+
+    return tree_path.with_suffix(SUFFIX)
+
+
+def is_up_to_date(digest_path, tree_path):
+    """
+    Returns:
+        bool: True if the digest index exists and is not older than its tree
+    """
+
+    try:
+        return digest_path.stat().st_mtime >= tree_path.stat().st_mtime
+    except OSError:
+        return False
+
+
+def save_digest_index(tree, file_path):
+    """ Saves the contents of a tree sorted by digest, so that they can be
+    looked up with a binary search over the memory-mapped file
+    - the file is written next to its final path then renamed, so that it is
+      never read partially written
+
+    Args:
+        tree (dict = {pathlib.Path: (hash, int, int)}): tree to index - can
+                                                        also be an iterable
+                                                        of (path, content)
+        file_path (pathlib.Path): path of the digest index
+    """
+
+    items = tree.items() if hasattr(tree, 'items') else tree
+    digests, sizes, mtimes, paths = [], [], [], []
+    for path, content in items:
+        if not content[aw.HASH]:
+            continue  # not hashed: it cannot be looked up
+        digests.append(bytes.fromhex(content[aw.HASH]))
+        sizes.append(content[aw.SIZE])
+        mtimes.append(content[aw.MTIME])
+        paths.append(str(pathlib.PurePosixPath(path)).encode())
+
+    records = np.empty(len(paths), dtype=RECORD_DTYPE)
+    records['digest'] = digests
+    records['size'] = sizes
+    records['mtime'] = mtimes
+    lengths = np.fromiter(map(len, paths), dtype=np.int64, count=len(paths))
+    records['length'] = lengths
+    records['offset'] = np.cumsum(lengths) - lengths
+    records = records[np.argsort(records, order=['digest', 'size'],
+                                 kind='stable')]
+
+    temp_path = file_path.with_name(file_path.name + '.tmp')
+    with temp_path.open(mode='wb') as file:
+        file.write(HEADER.pack(MAGIC, len(records)))
+        file.write(records.tobytes())
+        for path in paths:
+            file.write(path)
+    os.replace(temp_path, file_path)
+
+
+def find(file_path, contents):
+    """ Looks contents up in a digest index, without loading it in memory
+    - contents that have not been hashed are never found
+
+    Args:
+        file_path (pathlib.Path): path of the digest index
+        contents (iterable of (hash-code, int)): contents to look up
+
+    Returns:
+        collections.defaultdict(set) =
+            {(hash-code, int): {(pathlib.Path, float)}}
+            for the contents found
+
+    Raises:
+        ValueError: if the file is not a digest index
+    """
+
+    result = collections.defaultdict(set)
+    with file_path.open(mode='rb') as file:
+        if os.fstat(file.fileno()).st_size < HEADER.size:
+            raise ValueError(f'{file_path} is not a digest index')
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as index:
+            magic, count = HEADER.unpack_from(index, 0)
+            if magic != MAGIC:
+                raise ValueError(f'{file_path} is not a digest index')
+            paths_start = HEADER.size + count * RECORD.size
+            for content in contents:
+                if not content[0]:
+                    continue
+                key = bytes.fromhex(content[0]) + struct.pack('>q',
+                                                              content[1])
+                i = _bisect_left(index, count, key)
+                while i < count and _read_key(index, i) == key:
+                    _, _, mtime, offset, length = RECORD.unpack_from(
+                        index, HEADER.size + i * RECORD.size)
+                    start = paths_start + offset
+                    path = index[start:start + length].decode()
+                    result[tuple(content)].add((pathlib.Path(path), mtime))
+                    i += 1
+    return result
+
+
+def _read_key(index, i):
+    position = HEADER.size + i * RECORD.size
+    return index[position:position + KEY_SIZE]
+
+
+def _bisect_left(index, count, key):
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if _read_key(index, middle) < key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
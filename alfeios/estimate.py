@@ -0,0 +1,119 @@
+import collections
+import itertools
+import math
+import random
+import statistics
+
+import alfeios.walker as aw
+
+SAMPLE_SIZE = 1 << 30  # ie 1 GiB hashed at most, once MIN_DRAWS are reached
+MIN_DRAWS = 30  # draws needed for the normal approximation of the interval
+MAX_DRAWS = 100_000  # groups already hashed are drawn again at no cost
+
+Estimate = collections.namedtuple('Estimate', [
+    'size_gain',      # estimated space gain in bytes
+    'lower',          # lower bound of the confidence interval
+    'upper',          # upper bound of the confidence interval
+    'max_size_gain',  # gain if all the files sharing their size were equal
+    'groups',         # number of groups of files sharing their size
+    'hashed_groups',  # number of these groups hashed
+    'hashed_size'])   # number of bytes hashed
+
+
+def get_estimate(root, tree, sample_size=SAMPLE_SIZE, min_size=0,
+                 confidence=0.95, seed=None):
+    """ Estimates the space gain of the duplicates of a tree indexed without
+    hashing, by hashing only a sample of the files sharing their size
+
+    - groups of files sharing their size are drawn with replacement, with a
+      probability proportional to their maximum gain (size times number of
+      files minus one), until sample_size bytes are hashed
+    - all the files of a drawn group are hashed: the ratio of its actual
+      gain to its maximum gain, averaged over the draws, estimates the ratio
+      of the total gain to the total maximum gain (Hansen-Hurwitz estimator)
+    - the confidence interval is the normal one of this mean, narrowed by
+      the gain of the groups already hashed, that is known exactly
+    - if all the groups fit in sample_size, the gain is exact
+    - the hash-codes are written in the tree, so that it can be used as
+      cache by a later index
+
+    Args:
+        root (pathlib.Path): root directory the paths of the tree are
+                             relative to
+        tree (dict = {pathlib.Path: (hash-code, int, float)}): directory index
+                                                               where
+                                                               hash-code may
+                                                               be empty
+        sample_size (int): number of bytes to hash
+                           default is SAMPLE_SIZE
+        min_size (int): size of the smallest files to consider
+                        default is 0
+        confidence (float): confidence level of the interval
+                            default is 0.95
+        seed (int): seed of the random draws, for reproducible estimates
+                    default is None
+
+    Returns:
+        Estimate
+    """
+
+    by_size = collections.defaultdict(list)
+    for path, content in tree.items():
+        if content[aw.SIZE] >= min_size:
+            by_size[content[aw.SIZE]].append(path)
+    groups = [(size, paths) for size, paths in by_size.items()
+              if len(paths) >= 2 and size > 0]
+    max_gains = [size * (len(paths) - 1) for size, paths in groups]
+    max_size_gain = sum(max_gains)
+
+    to_hash = sum(size for size, paths in groups for p in paths
+                  if not tree[p][aw.HASH])
+    gains = dict()  # actual gain of the hashed groups, by index
+    hashed_size = 0
+    if to_hash <= sample_size:
+        for i, (size, paths) in enumerate(groups):
+            gains[i], size_hashed = _hash_group(root, tree, size, paths)
+            hashed_size += size_hashed
+        size_gain = sum(gains.values())
+        return Estimate(size_gain, size_gain, size_gain, max_size_gain,
+                        len(groups), len(groups), hashed_size)
+
+    rng = random.Random(seed)
+    cum_weights = list(itertools.accumulate(max_gains))
+    ratios = []
+    while len(ratios) < MAX_DRAWS and (hashed_size < sample_size
+                                       or len(ratios) < MIN_DRAWS):
+        [i] = rng.choices(range(len(groups)), cum_weights=cum_weights)
+        if i not in gains:
+            size, paths = groups[i]
+            gains[i], size_hashed = _hash_group(root, tree, size, paths)
+            hashed_size += size_hashed
+        ratios.append(gains[i] / max_gains[i])
+
+    mean = statistics.fmean(ratios)
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    margin = z * statistics.stdev(ratios) / math.sqrt(len(ratios))
+    known_gain = sum(gains.values())
+    unknown_max_gain = max_size_gain - sum(max_gains[i] for i in gains)
+    lower = max(known_gain, round(max_size_gain * (mean - margin)))
+    upper = min(known_gain + unknown_max_gain,
+                round(max_size_gain * (mean + margin)))
+    size_gain = min(max(round(max_size_gain * mean), lower), upper)
+    return Estimate(size_gain, lower, upper, max_size_gain, len(groups),
+                    len(gains), hashed_size)
+
+
+def _hash_group(root, tree, size, paths):
+    # returns the actual gain of a group of same size files and the number
+    # of bytes hashed - files that cannot be read are not counted
+    counter = collections.Counter()
+    hashed_size = 0
+    for path in paths:
+        if not tree[path][aw.HASH]:
+            try:
+                tree[path] = aw.index_file(root / path)
+            except OSError:
+                continue
+            hashed_size += size
+        counter[tree[path][aw.HASH]] += 1
+    return size * sum(n - 1 for n in counter.values()), hashed_size
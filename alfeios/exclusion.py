@@ -0,0 +1,269 @@
+import collections
+import pathlib
+import re
+import time
+
+import alfeios.tool as at
+
+# Directories that are never indexed
+INTERNAL_RULES = ['.alfeios', '.alfeios_expected']
+
+# Rule kinds
+NAME = 'name'  # exact file or directory name
+GLOB = 'glob'  # gitignore-style glob pattern
+REGEX = 'regex'  # regular expression searched in the relative path
+SIZE = 'size'  # file size comparison
+AGE = 'age'  # file age (from its modification time) comparison
+
+_Rule = collections.namedtuple('_Rule', [
+    'kind', 'negated', 'dir_only', 'anchored', 'value', 'operator'])
+
+# Minimal stat interface used by size and age rules
+Stat = collections.namedtuple('Stat', ['st_size', 'st_mtime'])
+
+
+class Exclusion:
+    """ Compiled exclusion rules
+
+    Each rule is a string in one of these forms:
+    - name           : exact file or directory name, at any depth
+    - glob pattern   : gitignore-style pattern with *, ?, [...] and **
+                       * a pattern without '/' matches names at any depth
+                       * a pattern with a leading or middle '/' matches the
+                         path relative to the root directory
+                       * a trailing '/' only matches directories
+    - re:<regex>     : regular expression searched in the relative path
+    - size<N, size>N : files smaller or larger than a natural size like 10k
+    - age<D, age>D   : files modified less or more than a duration like 30d
+                       ago
+    - !<rule>        : re-include what a previous rule excluded
+    Like in gitignore, the last matching rule wins and nothing can be
+    re-included below an excluded directory, as it is never walked.
+
+    Args:
+        rules (iterable of str): exclusion rules
+                                 default is None meaning no rule
+    """
+
+    def __init__(self, rules=None):
+        self.rules_text = [] if rules is None else list(rules)
+        self.now = time.time()
+        self.rules = [_compile(r) for r in self.rules_text]
+        self.has_negation = any(r.negated for r in self.rules)
+        self.has_stat = any(r.kind in (SIZE, AGE) for r in self.rules)
+        # fast path: exact names are looked up in a set
+        self.names = {r.value for r in self.rules
+                      if r.kind == NAME and not r.dir_only}
+
+    def __bool__(self):
+        return len(self.rules) > 0
+
+    def with_rules(self, rules):
+        """
+        Returns:
+            Exclusion: a new exclusion with rules appended to these ones
+        """
+
+        return Exclusion(self.rules_text + list(rules))
+
+    def excludes(self, path, entry):
+        """ Decides if a directory entry met during a walk must be excluded
+        - files are only stat'ed if there are size or age rules
+
+        Args:
+            path (pathlib.Path): path of the entry relative to the root
+            entry (os.DirEntry): directory entry
+
+        Returns:
+            bool
+        """
+
+        if not self.has_negation and entry.name in self.names:
+            return True
+        is_dir = entry.is_dir(follow_symlinks=False)
+        stat = None
+        if self.has_stat and not is_dir:
+            stat = entry.stat(follow_symlinks=False)
+        return self.matches(path, is_dir, stat)
+
+    def matches(self, path, is_dir=False, stat=None):
+        """
+        Args:
+            path (pathlib.Path): path relative to the root directory
+            is_dir (bool): flag telling if path is a directory
+            stat (os.stat_result or Stat): stat of a file - size and age
+                rules are ignored when it is None
+
+        Returns:
+            bool: True if the last rule that applies is not a negated one
+        """
+
+        path = pathlib.PurePath(path)
+        name = path.name
+        posix_path = path.as_posix()
+        excluded = False
+        for rule in self.rules:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.kind == NAME:
+                matched = name == rule.value
+            elif rule.kind == GLOB:
+                matched = rule.value.fullmatch(
+                    posix_path if rule.anchored else name) is not None
+            elif rule.kind == REGEX:
+                matched = rule.value.search(posix_path) is not None
+            elif stat is None or is_dir:
+                continue
+            elif rule.kind == SIZE:
+                matched = _compare(stat.st_size, rule.operator, rule.value)
+            else:  # AGE
+                matched = _compare(self.now - stat.st_mtime, rule.operator,
+                                   rule.value)
+            if matched:
+                excluded = not rule.negated
+        return excluded
+
+    def filter_items(self, items):
+        """ Filters the items of a tree that has already been indexed, as if
+        it had been walked with these rules: an item is dropped if its file
+        or one of its parent directories is excluded
+
+        Args:
+            items (iterable of (path, content)): tree items whose paths are
+                                                 pathlib.Path or posix str
+
+        Yields:
+            (path, content) items that are not excluded
+        """
+
+        excluded_dirs = dict()  # memo of the parent directories
+        for path, content in items:
+            # content is (hash-code, size, modification-time)
+            stat = Stat(content[1], content[2])
+            if not self.matches_item(path, stat, excluded_dirs):
+                yield path, content
+
+    def matches_item(self, path, stat=None, memo=None):
+        """ Decides if a file of a tree that has already been indexed
+        matches, itself or through one of its parent directories
+
+        Args:
+            path (pathlib.Path or str): path of the file relative to the root
+            stat (os.stat_result or Stat): same as matches
+            memo (dict): decisions on the parent directories, to be shared
+                         by the calls on the files of a same tree
+                         default is None meaning no memo
+
+        Returns:
+            bool
+        """
+
+        if memo is None:
+            memo = dict()
+        pure_path = pathlib.PurePosixPath(path)
+        if any(self._excludes_dir(d, memo)
+               for d in reversed(list(pure_path.parents)[:-1])):
+            return True
+        return self.matches(pure_path, stat=stat)
+
+    def _excludes_dir(self, path, memo):
+        if path not in memo:
+            memo[path] = self.matches(path, is_dir=True)
+        return memo[path]
+
+
+def build_exclusion(exclusion=None, exclude_from=None):
+    """
+    Args:
+        exclusion (Exclusion or iterable of str): exclusion or rules
+        exclude_from (str or pathlib.Path): file with one rule per line
+                                            - empty lines and lines starting
+                                            with # are ignored
+
+    Returns:
+        Exclusion
+    """
+
+    if not isinstance(exclusion, Exclusion):
+        exclusion = Exclusion(exclusion)
+    if exclude_from is not None:
+        exclusion = exclusion.with_rules(read_rules(exclude_from))
+    return exclusion
+
+
+def read_rules(file_path):
+    lines = pathlib.Path(file_path).read_text().splitlines()
+    return [line.strip() for line in lines
+            if line.strip() and not line.lstrip().startswith('#')]
+
+
+def _compile(text):
+    negated = text.startswith('!')
+    if negated:
+        text = text[1:]
+
+    if text.startswith('re:'):
+        return _Rule(REGEX, negated, False, True, re.compile(text[3:]), None)
+
+    match = re.fullmatch(r'(size|age)\s*([<>])\s*(.+)', text)
+    if match is not None:
+        kind, operator, value = match.groups()
+        if kind == SIZE:
+            return _Rule(SIZE, negated, False, False,
+                         at.parse_natural_size(value), operator)
+        return _Rule(AGE, negated, False, False, at.parse_duration(value),
+                     operator)
+
+    dir_only = text.endswith('/')
+    text = text.rstrip('/')
+    anchored = '/' in text
+    text = text.lstrip('/')
+    if not anchored and not any(c in text for c in '*?['):
+        return _Rule(NAME, negated, dir_only, False, text, None)
+    return _Rule(GLOB, negated, dir_only, anchored,
+                 re.compile(_glob_to_regex(text)), None)
+
+
+def _glob_to_regex(pattern):
+    regex = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            regex.append('/.*')
+            i += 3
+        elif pattern.startswith('**', i):
+            regex.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            regex.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            regex.append('[^/]')
+            i += 1
+        elif pattern[i] == '[':
+            # like fnmatch: a leading ! or ] is part of the set, and a [
+            # without closing bracket is a literal
+            start = i + 2 if pattern.startswith('!', i + 1) else i + 1
+            if pattern.startswith(']', start):
+                start += 1
+            end = pattern.find(']', start)
+            if end < 0:
+                regex.append(re.escape('['))
+                i += 1
+                continue
+            content = pattern[i + 1:end]
+            if content.startswith('!'):
+                content = '^' + content[1:]
+            regex.append('[' + content.replace('\\', '\\\\') + ']')
+            i = end + 1
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(regex)
+
+
+def _compare(value, operator, threshold):
+    return value < threshold if operator == '<' else value > threshold
@@ -0,0 +1,278 @@
+import collections.abc
+import heapq
+import itertools
+import json
+import pathlib
+
+import alfeios.listing as al
+import alfeios.tool as at
+import alfeios.walker as aw
+
+# only loaded with a memory budget
+shutil = at.lazy_import('shutil')
+sqlite3 = at.lazy_import('sqlite3')
+tempfile = at.lazy_import('tempfile')
+
+# Record data - records are sorted by decreasing size then by hash-code
+# so that contents are grouped and listings come sorted by decreasing size
+NEG_SIZE = 0  # opposite of the content size in bytes
+HASH = 1      # content md5 hashcode
+PATH = 2      # filesystem path as a posix string
+MTIME = 3     # last modification time
+
+# Approximate memory footprint of a buffered record in bytes, path excluded:
+# the record tuple, its size, hash-code and time objects and the list slot,
+# as measured with tracemalloc on a 64-bit CPython 3.11 - so the memory
+# budget is an estimate, not a hard limit
+RECORD_OVERHEAD = 264
+
+# Maximum number of run files merged at once, well below the usual limit of
+# 1024 open files per process
+MAX_FAN_IN = 64
+
+
+class SortedRuns:
+    """ Out-of-core sorter of (hash-code, size, path, modification-time)
+    records
+
+    Records are buffered in memory until the memory budget is reached, then
+    sorted and spilled to a run file in a temporary directory.
+    Sorted records are read back with a k-way merge of the run files, after
+    intermediate merges of max_fan_in runs at a time if there are more.
+    It can be filled like a tree, in particular by alfeios.walker.walk:
+    runs[path] = (hash-code, size, modification-time)
+
+    Args:
+        memory_budget (int or str): memory used to buffer records, in bytes
+                                    or as a natural size like '1 GiB'
+        temp_dir (pathlib.Path): directory where run files are spilled
+                                 default is None meaning a new temporary
+                                 directory of the filesystem
+        max_fan_in (int): maximum number of run files open at once
+                          default is MAX_FAN_IN
+    """
+
+    def __init__(self, memory_budget, temp_dir=None, max_fan_in=MAX_FAN_IN):
+        if isinstance(memory_budget, str):
+            memory_budget = at.parse_natural_size(memory_budget)
+        self.memory_budget = memory_budget
+        self.temp_dir = pathlib.Path(tempfile.mkdtemp(dir=temp_dir))
+        self.max_fan_in = max_fan_in
+        self.run_paths = []
+        self.run_count = 0  # for unique run file names
+        self.buffer = []
+        self.buffer_size = 0
+        self.length = 0
+
+    def __setitem__(self, path, content):
+        path = str(pathlib.PurePosixPath(path))
+        self.buffer.append((-content[aw.SIZE], content[aw.HASH], path,
+                            content[aw.MTIME]))
+        self.buffer_size += RECORD_OVERHEAD + len(path)
+        self.length += 1
+        if self.buffer_size >= self.memory_budget:
+            self._spill()
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def update(self, items):
+        for path, content in items:
+            self[path] = content
+
+    def sorted_records(self):
+        """
+        Yields:
+            (int, hash-code, str, float) records sorted on their 3 first
+            fields: (-size, hash-code, path)
+        """
+
+        # the buffer is merged in memory along with the last runs
+        while len(self.run_paths) >= self.max_fan_in:
+            self._merge_runs()
+        self.buffer.sort()
+        runs = [_iter_run(p) for p in self.run_paths]
+        return heapq.merge(*runs, iter(self.buffer))
+
+    def items(self):
+        """ Yields the records as tree items: (path, content)
+        """
+
+        for record in self.sorted_records():
+            yield pathlib.Path(record[PATH]), (record[HASH],
+                                               -record[NEG_SIZE],
+                                               record[MTIME])
+
+    def close(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _spill(self):
+        self.buffer.sort()
+        self._write_run(self.buffer)
+        self.buffer = []
+        self.buffer_size = 0
+
+    def _merge_runs(self):
+        # merges the oldest runs into a new one, at the end of the list
+        merged_paths = self.run_paths[:self.max_fan_in]
+        del self.run_paths[:self.max_fan_in]
+        self._write_run(heapq.merge(*[_iter_run(p) for p in merged_paths]))
+        for run_path in merged_paths:
+            run_path.unlink()
+
+    def _write_run(self, records):
+        run_path = self.temp_dir / f'{self.run_count}.run'
+        self.run_count += 1
+        with run_path.open(mode='w', encoding='utf-8') as run_file:
+            for record in records:
+                run_file.write(json.dumps(record) + '\n')
+        self.run_paths.append(run_path)
+
+
+class DiskDict(collections.abc.MutableMapping):
+    """ Mapping of paths to contents kept in a SQLite database on disk
+    instead of in memory, for instance to hold the walk cache of a tree
+    larger than RAM - only the pages in use are kept in memory
+
+    Args:
+        temp_dir (pathlib.Path): directory where the database is created
+                                 default is None meaning a new temporary
+                                 directory of the filesystem
+    """
+
+    def __init__(self, temp_dir=None):
+        self.temp_dir = pathlib.Path(tempfile.mkdtemp(dir=temp_dir))
+        self.connection = sqlite3.connect(self.temp_dir / 'cache.db')
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute('CREATE TABLE entries'
+                                ' (path TEXT PRIMARY KEY, content TEXT)')
+
+    def __getitem__(self, path):
+        row = self.connection.execute(
+            'SELECT content FROM entries WHERE path = ?',
+            (_to_key(path),)).fetchone()
+        if row is None:
+            raise KeyError(path)
+        return tuple(json.loads(row[0]))
+
+    def __setitem__(self, path, content):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO entries VALUES (?, ?)',
+            (_to_key(path), json.dumps(list(content))))
+
+    def __delitem__(self, path):
+        if self.connection.execute('DELETE FROM entries WHERE path = ?',
+                                   (_to_key(path),)).rowcount == 0:
+            raise KeyError(path)
+
+    def __contains__(self, path):
+        return self.connection.execute(
+            'SELECT 1 FROM entries WHERE path = ?',
+            (_to_key(path),)).fetchone() is not None
+
+    def __iter__(self):
+        for (path,) in self.connection.execute('SELECT path FROM entries'):
+            yield pathlib.Path(path)
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def setdefault(self, path, content):
+        # single statement instead of a lookup then an insert - content is
+        # required as only (hash, size, mtime) tuples can be stored
+        self.connection.execute('INSERT OR IGNORE INTO entries VALUES (?, ?)',
+                                (_to_key(path), json.dumps(list(content))))
+        return self[path]
+
+    def close(self):
+        self.connection.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+def iter_listing(records):
+    """ Groups sorted records by content
+
+    Args:
+        records (iterable of records): sorted as by SortedRuns.sorted_records
+
+    Yields:
+        ((hash-code, int), {(pathlib.Path, float)})
+        by decreasing content size
+    """
+
+    for key, group in itertools.groupby(records, key=_content_key):
+        content = (key[1], -key[0])
+        pointers = {(pathlib.Path(r[PATH]), r[MTIME]) for r in group}
+        yield content, pointers
+
+
+def iter_duplicate(records):
+    """ Same as alfeios.listing.get_duplicate but computed with a merge
+    group-by on sorted records, yielding duplicate groups as a stream
+
+    Args:
+        records (iterable of records): sorted as by SortedRuns.sorted_records
+
+    Yields:
+        ((hash-code, int), {(pathlib.Path, float)})
+        by decreasing content size
+    """
+
+    for content, pointers in iter_listing(records):
+        if len(pointers) >= 2:
+            yield content, pointers
+
+
+def iter_missing(old_records, new_records):
+    """ Same as alfeios.listing.get_missing but computed with a merge
+    anti-join of 2 sorted record streams, yielding missing contents as a
+    stream
+
+    Args:
+        old_records (iterable of records): sorted as by
+                                           SortedRuns.sorted_records
+        new_records (iterable of records): sorted as by
+                                           SortedRuns.sorted_records
+
+    Yields:
+        ((hash-code, int), {(pathlib.Path, float)})
+        by decreasing content size
+    """
+
+    new_keys = (key for key, _ in itertools.groupby(new_records,
+                                                    key=_content_key))
+    new_key = next(new_keys, None)
+    for content, pointers in iter_listing(old_records):
+        old_key = (-content[al.SIZE], content[al.HASH])
+        while new_key is not None and new_key < old_key:
+            new_key = next(new_keys, None)
+        if new_key != old_key:
+            yield content, pointers
+
+
+def _content_key(record):
+    return record[NEG_SIZE], record[HASH]
+
+
+def _to_key(path):
+    return str(pathlib.PurePosixPath(path))
+
+
+def _iter_run(run_path):
+    with run_path.open(encoding='utf-8') as run_file:
+        for line in run_file:
+            yield tuple(json.loads(line))
@@ -1,5 +1,8 @@
 import collections
+import heapq
+import itertools
 
+import alfeios.exclusion as ax
 import alfeios.walker as aw
 
 # Content data
@@ -59,3 +62,81 @@ def get_missing(old_listing, new_listing):
                     in old_listing.items() if content not in new_listing}
     result = collections.defaultdict(set, non_included)
     return result
+
+
+def get_filtered_duplicate(duplicate_groups, min_size=0, top=None,
+                           include=None, exclude=None):
+    """ Selects duplicate groups out of a stream of candidate groups
+    keeping only the relevant ones, with a memory that scales with top
+    instead of with the number of candidate groups
+
+    Args:
+        duplicate_groups (iterable of (content, pointers)): stream of
+            duplicate groups, like get_duplicate(listing)[0].items()
+        min_size (int): minimum content size in bytes - default is 0
+        top (int): number of groups to keep, those with the largest
+                   reclaimable size - default is None meaning all groups
+        include (Exclusion or list of str): rules a pointer must match to be
+                                            kept (see alfeios.exclusion)
+                                            - default is None meaning all
+                                            pointers
+        exclude (Exclusion or list of str): rules of pointers not to keep
+                                            (see alfeios.exclusion)
+                                            - default is None meaning no
+                                            pointer
+
+    Returns:
+        duplicate : collections.defaultdict(set) =
+                    {(hash-code, int): {(pathlib.Path, int)}}
+                    sorted by decreasing reclaimable size
+        size_gain : int - reclaimable size of the selected groups
+
+    Raises:
+        ValueError: if top is lower than 1
+    """
+
+    if top is not None and top < 1:
+        raise ValueError(f'top must be at least 1, not {top}')
+
+    include = ax.build_exclusion(include)
+    exclude = ax.build_exclusion(exclude)
+
+    include_dirs, exclude_dirs = dict(), dict()  # memos of the parents
+    selected = []  # min heap on reclaimable size when top is set
+    counter = itertools.count()  # tie-breaker: first groups are kept
+    for content, pointers in duplicate_groups:
+        if content[SIZE] < min_size:
+            continue
+        if include or exclude:
+            pointers = {p for p in pointers
+                        if _is_selected(content, p, include, exclude,
+                                        include_dirs, exclude_dirs)}
+        if len(pointers) < 2:
+            continue
+        gain = content[SIZE] * (len(pointers) - 1)
+        item = (gain, -next(counter), content, pointers)
+        if top is None:
+            selected.append(item)
+        elif len(selected) < top:
+            heapq.heappush(selected, item)
+        elif item[:2] > selected[0][:2]:
+            heapq.heapreplace(selected, item)
+
+    selected.sort(key=lambda i: i[:2], reverse=True)
+    result = collections.defaultdict(set, {
+        content: pointers for _, _, content, pointers in selected})
+    size_gain = sum(gain for gain, _, _, _ in selected)
+    return result, size_gain
+
+
+def _is_selected(content, pointer, include, exclude, include_dirs,
+                 exclude_dirs):
+    # a file is selected through its parent directories as well, like in
+    # a walk: an excluded directory excludes all its files
+    stat = ax.Stat(content[SIZE], pointer[MTIME])
+    if include and not include.matches_item(pointer[PATH], stat,
+                                            include_dirs):
+        return False
+    if exclude and exclude.matches_item(pointer[PATH], stat, exclude_dirs):
+        return False
+    return True
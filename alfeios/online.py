@@ -0,0 +1,73 @@
+import collections
+import collections.abc
+
+import alfeios.walker as aw
+
+# Group event kinds
+FORMED = 'formed'  # a second file with the content of another one
+GROWN = 'grown'    # one more file with the content of a duplicate group
+
+GroupEvent = collections.namedtuple('GroupEvent', [
+    'kind', 'hash', 'size', 'count', 'paths', 'size_gain'])
+
+
+class OnlineDuplicate(collections.abc.Mapping):
+    """ Duplicate detector filled like a tree, in particular by
+    alfeios.walker.walk: detector[path] = (hash-code, size, modification-time)
+
+    It is the mapping of the tree filled so far, and it keeps a listing of
+    its contents to tell each newly formed or grown duplicate group as soon
+    as the file that forms or grows it is indexed, so that the biggest
+    duplicates can be reviewed long before the end of the walk.
+    Empty files and files not hashed are not grouped.
+
+    Args:
+        on_group (callable): called as on_group(event) for each group
+                             formed or grown, with a GroupEvent =
+                             (kind, hash, size, count, paths, size_gain)
+                             where paths are the paths added to the group -
+                             both paths for a formed group - count is the
+                             number of files in the group and size_gain the
+                             running space gain of all the groups
+        min_size (int): size of the smallest files to group
+                        default is 0
+    """
+
+    def __init__(self, on_group, min_size=0):
+        self.on_group = on_group
+        self.min_size = max(min_size, 1)  # empty files have no gain
+        self.tree = dict()
+        self.listing = collections.defaultdict(set)
+        self.size_gain = 0
+
+    def __setitem__(self, path, content):
+        self.tree[path] = content
+        size = content[aw.SIZE]
+        if not content[aw.HASH] or size < self.min_size:
+            return
+        pointers = self.listing[(content[aw.HASH], size)]
+        pointers.add((path, content[aw.MTIME]))
+        if len(pointers) < 2:
+            return
+        self.size_gain += size
+        if len(pointers) == 2:
+            paths = sorted(p for p, _ in pointers)
+            kind = FORMED
+        else:
+            paths = [path]
+            kind = GROWN
+        self.on_group(GroupEvent(kind, content[aw.HASH], size, len(pointers),
+                                 paths, self.size_gain))
+
+    def __getitem__(self, path):
+        return self.tree[path]
+
+    def __iter__(self):
+        return iter(self.tree)
+
+    def __len__(self):
+        return len(self.tree)
+
+    def update(self, items):
+        for path, content in items:
+            self[path] = content
@@ -0,0 +1,121 @@
+import collections
+import json
+import time
+
+# Event kinds
+PROGRESS = 'progress'  # published at most once per interval during a walk
+DONE = 'done'          # published once at the end of a walk
+
+Event = collections.namedtuple('Event', [
+    'kind',           # PROGRESS or DONE
+    'files',          # number of files indexed
+    'bytes',          # size of the files indexed, hashed or from cache
+    'hashed_bytes',   # size of the files actually hashed
+    'skipped_bytes',  # size of the holes of sparse files, hashed without I/O
+    'cache_hits',     # number of files indexed from cache
+    'errors',         # number of paths that could not be indexed
+    'path',           # last path indexed
+    'elapsed',        # seconds since the start of the walk
+])
+
+
+class Progress:
+    """ Publisher of the progress events of a walk to pluggable sinks
+
+    The walker reports each file once, whatever its size, and events are
+    published at most once per interval, so that the cost of progress
+    reporting is bounded per file and not per block read.
+
+    Args:
+        sinks (iterable of callables): called with each Event - for instance
+                                       TqdmSink, JsonLinesSink
+                                       default is None meaning no sink
+        interval (float): minimum number of seconds between 2 events
+                          default is 0.1
+    """
+
+    def __init__(self, sinks=None, interval=0.1):
+        self.sinks = [] if sinks is None else list(sinks)
+        self.interval = interval
+        self.files = 0
+        self.bytes = 0
+        self.hashed_bytes = 0
+        self.skipped_bytes = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.path = None
+        self.start_time = self.last_time = time.monotonic()
+
+    def file_indexed(self, path, size, hashed_size=0, from_cache=False):
+        self.files += 1
+        self.bytes += size
+        self.hashed_bytes += hashed_size
+        self.cache_hits += from_cache
+        self.path = path
+        self._publish_if_due()
+
+    def holes_skipped(self, size):
+        # counted with the next event, published when the file is indexed
+        self.skipped_bytes += size
+
+    def error(self, path):
+        self.errors += 1
+        self.path = path
+        self._publish_if_due()
+
+    def close(self):
+        self._publish(DONE, time.monotonic())
+
+    def _publish_if_due(self):
+        now = time.monotonic()
+        if now - self.last_time >= self.interval:
+            self._publish(PROGRESS, now)
+
+    def _publish(self, kind, now):
+        self.last_time = now
+        event = Event(kind, self.files, self.bytes, self.hashed_bytes,
+                      self.skipped_bytes, self.cache_hits, self.errors,
+                      self.path, now - self.start_time)
+        for sink in self.sinks:
+            sink(event)
+
+
+class TqdmSink:
+    """ Shows progress events on a progress bar
+
+    Args:
+        bar (tqdm.tqdm): progress bar
+        field (str): Event field the bar counts - default is 'bytes'
+    """
+
+    def __init__(self, bar, field='bytes'):
+        self.bar = bar
+        self.field = field
+        self.count = 0
+
+    def __call__(self, event):
+        count = getattr(event, self.field)
+        self.bar.update(count - self.count)
+        self.count = count
+        if event.path is not None:
+            self.bar.set_postfix(file=str(event.path)[-10:], refresh=False)
+
+
+class JsonLinesSink:
+    """ Writes progress events as json lines, for instance for another
+    process orchestrating alfeios
+
+    Args:
+        file (text file): file where events are written - for instance
+                          sys.stderr or open(fd, 'w', closefd=False)
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    def __call__(self, event):
+        record = event._asdict()
+        if event.path is not None:
+            record['path'] = str(event.path)
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
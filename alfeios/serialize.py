@@ -1,16 +1,30 @@
 import ast
 import collections
+import collections.abc
+import datetime
+import os
 import sys
 
 import colorama
 import json
 import pathlib
-import tempfile
 
 import alfeios.listing as al
 import alfeios.tool as at
 import alfeios.walker as aw
 
+adg = at.lazy_import('alfeios.digest')  # loads numpy
+tempfile = at.lazy_import('tempfile')  # only to write elsewhere on failure
+
+# Snapshot history - a tree is saved either as a full snapshot or as a delta
+# of the changed entries relative to the last full snapshot (its base)
+TREE_SUFFIX = '_tree.json'
+DELTA_SUFFIX = '_delta_tree.json'
+MANIFEST_NAME = 'manifest.json'  # points at the latest snapshot
+# a full snapshot is saved instead of a delta when the delta would hold more
+# entries than this ratio of its base entries (compaction)
+COMPACTION_RATIO = 0.5
+
 
 def save_json_tree(dir_path, tree, forbidden=None):
     """
@@ -18,11 +32,20 @@ def save_json_tree(dir_path, tree, forbidden=None):
     tagged with the current date and time, in a .alfeios subdirectory,
     inside the directory passed as first argument
 
+    The tree is saved as a delta of the last full snapshot (the base) when
+    there is one and the changes are few enough, otherwise as a new full
+    snapshot. A manifest pointing at the saved tree is updated, so that the
+    last tree is found without scanning the .alfeios subdirectory.
+    A digest index of the tree (see alfeios.digest) is saved next to it,
+    replacing the one of the previous tree.
+
     Args:
         dir_path (pathlib.Path): path to the directory where the index will be
             saved (in a .alfeios subdirectory)
         tree (dict = {pathlib.Path: (hash, int, int)}):
-            tree to serialize
+            tree to serialize - can also be an iterable of (path, content)
+            items that is then written as a stream, always as a full
+            snapshot
         forbidden (dict = {pathlib.Path: type(Exception)}):
             forbidden to serialize
 
@@ -36,13 +59,42 @@ def save_json_tree(dir_path, tree, forbidden=None):
 
     tag = at.build_current_datetime_tag()
 
-    tree_path = path / (tag + '_tree.json')
-    _save_json_tree(tree, tree_path)
+    delta = None
+    base_path = _find_last(path)[1]
+    # a base of the same second would be overwritten: save a full one
+    if (isinstance(tree, collections.abc.Mapping) and base_path is not None
+            and not base_path.name.startswith(tag)):
+        delta = _build_delta(tree, base_path)
+
+    if delta is not None:
+        tree_path = path / (tag + DELTA_SUFFIX)
+        _write_text(json.dumps(delta), tree_path)
+    else:
+        tree_path = base_path = path / (tag + TREE_SUFFIX)
+        _save_json_tree(tree, tree_path)
+        # only one snapshot per tag
+        delta_path = path / (tag + DELTA_SUFFIX)
+        delta_path.unlink(missing_ok=True)
+        adg.get_digest_path(delta_path).unlink(missing_ok=True)
+
+    # only the last tree has a digest index, so that the .alfeios
+    # subdirectory does not grow with a full index per delta
+    digest_path = adg.get_digest_path(tree_path)
+    for previous_digest_path in path.glob('*' + adg.SUFFIX):
+        if previous_digest_path != digest_path:
+            previous_digest_path.unlink(missing_ok=True)
+    if isinstance(tree, collections.abc.Mapping):
+        # digest index of the tree for quick lookups, built while in memory
+        try:
+            adg.save_digest_index(tree, digest_path)
+        except OSError:
+            pass  # it is built later, at first lookup
 
-    if len(forbidden) > 0:
+    if forbidden:
         forbidden_path = path / (tag + '_forbidden.json')
         _save_json_forbidden(forbidden, forbidden_path)
 
+    _write_manifest(path, tree_path, base_path)
     return tree_path
 
 
@@ -50,13 +102,13 @@ def load_json_tree(file_path):
     """
     Args:
         file_path (pathlib.Path): path to an existing json serialized tree
+                                  (full snapshot or delta)
 
     Returns:
         dict = {pathlib.Path: (hash, int, int)}
     """
 
-    text_tree = file_path.read_text()
-    json_tree = json.loads(text_tree)
+    json_tree = load_raw_json_tree(file_path)
     tree = {pathlib.Path(path): (content[aw.HASH],
                                  content[aw.SIZE],
                                  content[aw.MTIME])
@@ -64,6 +116,58 @@ def load_json_tree(file_path):
     return tree
 
 
+def load_raw_json_tree(file_path):
+    """
+    Same as load_json_tree but keeping paths as posix strings and contents as
+    lists, which is several times quicker for large trees as no
+    pathlib.Path is built
+
+    Args:
+        file_path (pathlib.Path): path to an existing json serialized tree
+                                  (full snapshot or delta)
+
+    Returns:
+        dict = {str: [hash, int, int]}
+    """
+
+    json_tree = json.loads(file_path.read_text())
+    if _is_delta(file_path):
+        delta = json_tree
+        json_tree = json.loads(_get_base_path(file_path, delta).read_text())
+        for path in delta['removed']:
+            json_tree.pop(path, None)
+        json_tree.update(delta['changed'])
+    return json_tree
+
+
+def iter_json_tree(file_path, chunk_size=1 << 20):
+    """
+    Streams the items of a json serialized tree without loading the whole
+    file in memory - for a delta, only the changed entries are loaded in
+    memory while its base is streamed
+
+    Args:
+        file_path (pathlib.Path): path to an existing json serialized tree
+                                  (full snapshot or delta)
+        chunk_size (int): number of characters read at once
+
+    Yields:
+        (pathlib.Path, (hash, int, int))
+    """
+
+    if _is_delta(file_path):
+        delta = json.loads(file_path.read_text())
+        items = _iter_patched(
+            _iter_json_object(_get_base_path(file_path, delta), chunk_size),
+            delta)
+    else:
+        items = _iter_json_object(file_path, chunk_size)
+    for path, content in items:
+        yield pathlib.Path(path), (content[aw.HASH],
+                                   content[aw.SIZE],
+                                   content[aw.MTIME])
+
+
 def load_last_json_tree(dir_path):
     """
     Args:
@@ -75,14 +179,7 @@ def load_last_json_tree(dir_path):
     """
 
     try:
-        cache_path = dir_path / '.alfeios'
-        times = []
-        for tree_path in cache_path.glob('*_tree.json'):
-            times.append(at.read_datetime_tag(tree_path.name[:19]))
-        max_time = max(times)
-        max_time_tag = at.build_datetime_tag(max_time)
-        last_json_tree = cache_path / (max_time_tag + '_tree.json')
-        return load_json_tree(last_json_tree)
+        return load_json_tree(find_last_json_tree(dir_path))
     except (ValueError, IndexError, Exception) as e:
         print(colorama.Fore.RED +
               f'No cache readable in {dir_path.name}'
@@ -90,6 +187,154 @@ def load_last_json_tree(dir_path):
         return dict()
 
 
+def find_last_json_tree(dir_path):
+    """
+    The manifest is read first - the .alfeios subdirectory is only scanned
+    when there is no manifest or when it points at a snapshot that has been
+    removed
+
+    Args:
+        dir_path (pathlib.Path): path to a root directory where previous
+            index might have been saved (in a .alfeios subdirectory)
+
+    Returns:
+        pathlib.Path: path of the last serialized tree (full snapshot or
+                      delta)
+
+    Raises:
+        ValueError: if no tree has been saved in the root directory
+    """
+
+    tree_path, _ = _find_last(dir_path / '.alfeios')
+    if tree_path is None:
+        raise ValueError(f'no tree saved in {dir_path}')
+    return tree_path
+
+
+def prune_json_trees(dir_path, keep=None, keep_for=None):
+    """
+    Remove the old trees (and their forbidden) of a root directory according
+    to a retention policy - the last tree is always kept, as well as the
+    base of each kept delta
+
+    Args:
+        dir_path (pathlib.Path): path to a root directory where previous
+            indexes have been saved (in a .alfeios subdirectory)
+        keep (int): number of trees to keep
+                    default is None meaning no limit on the number
+        keep_for (float): age in seconds beyond which trees are removed
+                          default is None meaning no limit on the age
+
+    Returns:
+        int: number of removed trees
+    """
+
+    cache_path = dir_path / '.alfeios'
+    tree_paths = _list_json_trees(cache_path)
+    now = datetime.datetime.now()
+    kept = set()
+    for i, tree_path in enumerate(tree_paths):
+        age = (now - at.read_datetime_tag(tree_path.name[:19])).total_seconds()
+        if i == 0 or ((keep is None or i < keep)
+                      and (keep_for is None or age <= keep_for)):
+            kept.add(tree_path)
+            if _is_delta(tree_path):
+                kept.add(_get_base_path(tree_path))
+
+    removed = [p for p in tree_paths if p not in kept]
+    for tree_path in removed:
+        tree_path.unlink(missing_ok=True)
+        _get_forbidden_path(tree_path).unlink(missing_ok=True)
+        adg.get_digest_path(tree_path).unlink(missing_ok=True)
+    return len(removed)
+
+
+def load_json_forbidden(tree_path):
+    """
+    Args:
+        tree_path (pathlib.Path): path to an existing json serialized tree
+
+    Returns:
+        dict = {pathlib.Path: str} - the forbidden saved with this tree
+               or an empty dict if nothing was forbidden
+    """
+
+    forbidden_path = _get_forbidden_path(tree_path)
+    if not forbidden_path.is_file():
+        return dict()
+    json_forbidden = json.loads(forbidden_path.read_text())
+    return {pathlib.Path(path): excep
+            for path, excep in json_forbidden.items()}
+
+
+def save_json_checkpoint(dir_path, tree, forbidden=None):
+    """
+    Save a partial index (tree and forbidden) as json checkpoint files tagged
+    with the current date and time, in a .alfeios subdirectory, inside the
+    directory passed as first argument - previous checkpoints are removed
+
+    Args:
+        dir_path (pathlib.Path): path to the directory where the checkpoint
+            will be saved (in a .alfeios subdirectory)
+        tree (dict = {pathlib.Path: (hash, int, int)}):
+            partial tree to serialize
+        forbidden (dict = {pathlib.Path: type(Exception)}):
+            partial forbidden to serialize
+
+    Returns:
+        pathlib.Path: serialized checkpoint tree path
+    """
+
+    path = dir_path / '.alfeios'
+    if not pathlib.Path(path).is_dir():
+        pathlib.Path(path).mkdir()
+
+    previous_checkpoints = list(path.glob('*.checkpoint.json'))
+    tag = at.build_current_datetime_tag()
+
+    tree_path = path / (tag + '_tree.checkpoint.json')
+    _save_json_tree(tree, tree_path)
+
+    if forbidden:
+        forbidden_path = path / (tag + '_forbidden.checkpoint.json')
+        _save_json_forbidden(forbidden, forbidden_path)
+
+    for previous_checkpoint in previous_checkpoints:
+        if not previous_checkpoint.name.startswith(tag):
+            previous_checkpoint.unlink(missing_ok=True)
+
+    return tree_path
+
+
+def load_last_json_checkpoint(dir_path):
+    """
+    Args:
+        dir_path (pathlib.Path): path to a root directory where a checkpoint
+            might have been saved (in a .alfeios subdirectory)
+
+    Returns:
+        dict = {pathlib.Path: (hash, int, int)} - the checkpoint tree
+               or an empty dict if there is no checkpoint
+    """
+
+    checkpoints = sorted((dir_path / '.alfeios').glob(
+        '*_tree.checkpoint.json'))
+    if not checkpoints:
+        return dict()
+    return load_json_tree(checkpoints[-1])
+
+
+def remove_json_checkpoints(dir_path):
+    """
+    Args:
+        dir_path (pathlib.Path): path to a root directory where checkpoints
+            might have been saved (in a .alfeios subdirectory)
+    """
+
+    for checkpoint in (dir_path / '.alfeios').glob('*.checkpoint.json'):
+        checkpoint.unlink(missing_ok=True)
+
+
 def save_json_listing(dir_path, listing):
     """
     Save listing as json file, tagged with the current date and time,
@@ -100,7 +345,8 @@ def save_json_listing(dir_path, listing):
             be saved (in a .alfeios subdirectory)
         listing (collections.defaultdict(set) =
                 {(hash, int): {(pathlib.Path, int)}}):
-                listing to serialize
+                listing to serialize - can also be an iterable of
+                (content, pointers) items that is then written as a stream
 
     Returns:
         pathlib.Path: serialized listing path
@@ -117,7 +363,6 @@ def save_json_listing(dir_path, listing):
 
 
 def load_json_listing(file_path):
-    # todo: used only by tests -> move it to tests ?
     """
     Args:
         file_path (pathlib.Path): path to an existing json serialized listing
@@ -142,11 +387,109 @@ def load_json_listing(file_path):
     return listing
 
 
+def _is_delta(tree_path):
+    return tree_path.name.endswith(DELTA_SUFFIX)
+
+
+def _get_base_path(delta_path, delta=None):
+    if delta is None:
+        delta = json.loads(delta_path.read_text())
+    return delta_path.with_name(delta['base'])
+
+
+def _get_forbidden_path(tree_path):
+    suffix = DELTA_SUFFIX if _is_delta(tree_path) else TREE_SUFFIX
+    return tree_path.with_name(
+        tree_path.name[:-len(suffix)] + '_forbidden.json')
+
+
+def _build_delta(tree, base_path):
+    # returns None when a full snapshot is worth saving instead
+    try:
+        base = json.loads(base_path.read_text())
+    except (OSError, ValueError):
+        return None
+    base_size = len(base)
+    changed = dict()
+    for path, content in tree.items():
+        path = str(pathlib.PurePosixPath(path))
+        content = list(content)
+        if base.pop(path, None) != content:
+            changed[path] = content
+    removed = list(base)  # base entries not found in the tree
+    if len(changed) + len(removed) > COMPACTION_RATIO * base_size:
+        return None
+    return {'base': base_path.name, 'changed': changed, 'removed': removed}
+
+
+def _iter_patched(base_items, delta):
+    removed = set(delta['removed'])
+    changed = dict(delta['changed'])
+    for path, content in base_items:
+        if path in changed:
+            yield path, changed.pop(path)
+        elif path not in removed:
+            yield path, content
+    yield from changed.items()  # entries added since the base
+
+
+def _find_last(cache_path):
+    # returns the last tree and its base (itself for a full snapshot)
+    # or (None, None) if there is no loadable tree
+    manifest = _read_manifest(cache_path)
+    if manifest is not None:
+        tree_path = cache_path / manifest['latest']
+        base_path = cache_path / manifest['base']
+        if tree_path.is_file() and base_path.is_file():
+            return tree_path, base_path
+    # no manifest, or it points at a removed snapshot: scan the directory
+    for tree_path in _list_json_trees(cache_path):
+        try:
+            base_path = _get_base_path(tree_path) if _is_delta(tree_path) \
+                else tree_path
+        except (OSError, ValueError, KeyError):
+            continue
+        if base_path.is_file():
+            return tree_path, base_path
+    return None, None
+
+
+def _list_json_trees(cache_path):
+    # tagged trees, from the most recent to the oldest
+    tree_paths = []
+    for tree_path in cache_path.glob('*' + TREE_SUFFIX):
+        try:
+            at.read_datetime_tag(tree_path.name[:19])
+        except ValueError:
+            continue
+        tree_paths.append(tree_path)
+    return sorted(tree_paths, key=lambda p: p.name, reverse=True)
+
+
+def _read_manifest(cache_path):
+    try:
+        manifest = json.loads((cache_path / MANIFEST_NAME).read_text())
+        return {'latest': manifest['latest'], 'base': manifest['base']}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write_manifest(cache_path, tree_path, base_path):
+    manifest = {'latest': tree_path.name, 'base': base_path.name}
+    # written in a temporary file then renamed, so that it is never partial
+    temp_path = cache_path / (MANIFEST_NAME + '.tmp')
+    try:
+        temp_path.write_text(json.dumps(manifest))
+        os.replace(temp_path, cache_path / MANIFEST_NAME)
+    except OSError:
+        pass  # the last tree is then found by scanning the directory
+
+
 def _save_json_tree(tree, file_path):
-    serializable_tree = {str(pathlib.PurePosixPath(path)): list(content)
-                         for path, content in tree.items()}
-    json_tree = json.dumps(serializable_tree)
-    _write_text(json_tree, file_path)
+    items = tree.items() if hasattr(tree, 'items') else tree
+    serializable_items = ((str(pathlib.PurePosixPath(path)), list(content))
+                          for path, content in items)
+    _write_json_items(serializable_items, file_path)
 
 
 def _save_json_forbidden(forbidden, file_path):
@@ -157,19 +500,106 @@ def _save_json_forbidden(forbidden, file_path):
 
 
 def _save_json_listing(listing, file_path):
-    serializable_listing = {
-        str((content[al.HASH], content[al.SIZE])): [
+    items = listing.items() if hasattr(listing, 'items') else listing
+    serializable_items = (
+        (str((content[al.HASH], content[al.SIZE])), [
             [str(pathlib.PurePosixPath(pointer[al.PATH])), pointer[al.MTIME]]
-            for pointer in pointers]
-        for content, pointers in listing.items()}
-    json_listing = json.dumps(serializable_listing)
-    _write_text(json_listing, file_path)
+            for pointer in pointers])
+        for content, pointers in items)
+    _write_json_items(serializable_items, file_path)
+
+
+def _write_json_items(items, file_path):
+    # writes a json object item by item
+    # the result is the same as json.dumps(dict(items))
+    def chunks():
+        yield '{'
+        separator = ''
+        for key, value in items:
+            yield f'{separator}{json.dumps(key)}: {json.dumps(value)}'
+            separator = ', '
+        yield '}'
+
+    _write_chunks(chunks(), file_path)
+
+
+def _iter_json_object(file_path, chunk_size):
+    # reads a json object item by item, the inverse of _write_json_items
+    with file_path.open() as file:
+        stream = _JsonStream(file, chunk_size)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.decode()
+            stream.expect(':')
+            value = stream.decode()
+            yield key, value
+            if stream.expect(',}') == '}':
+                return
+
+
+class _JsonStream:
+    # minimal incremental reader of json structural characters and values
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+
+    def peek(self):
+        self._skip_whitespaces()
+        return self.buffer[self.position:self.position + 1]
+
+    def expect(self, characters):
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f'unexpected {character!r} in {self.file.name}'
+                             f' - expecting one of {characters!r}')
+        self.position += 1
+        return character
+
+    def decode(self):
+        self._skip_whitespaces()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer,
+                                                     self.position)
+                # a value ending the buffer might be truncated (e.g. number)
+                if end < len(self.buffer):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                pass
+            if not self._read():
+                value, self.position = self.decoder.raw_decode(
+                    self.buffer, self.position)
+                return value
+
+    def _read(self):
+        chunk = self.file.read(self.chunk_size)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return len(chunk) > 0
+
+    def _skip_whitespaces(self):
+        while True:
+            while (self.position < len(self.buffer)
+                   and self.buffer[self.position].isspace()):
+                self.position += 1
+            if self.position < len(self.buffer) or not self._read():
+                return
 
 
 def _write_text(content_string, file_path):
+    _write_chunks([content_string], file_path)
+
+
+def _write_chunks(chunks, file_path):
     try:
-        file_path.write_text(content_string)
-        print(f'{file_path.name} written on {file_path.parent}')
+        file = file_path.open(mode='w')
     except (PermissionError, Exception) as e:
         print(colorama.Fore.RED +
               f'Not authorized to write {file_path.name}'
@@ -178,11 +608,16 @@ def _write_text(content_string, file_path):
                                           suffix=file_path.suffix)[1]
         temp_file_path = pathlib.Path(temp_file_path)
         try:
-            temp_file_path.write_text(content_string)
-            print(f'{temp_file_path.name} written on {temp_file_path.parent}')
+            file = temp_file_path.open(mode='w')
         except (PermissionError, Exception) as e:
             print(colorama.Fore.RED +
                   f'Not authorized to write {temp_file_path.name}'
                   f' on {temp_file_path.parent}: {type(e)}', file=sys.stderr)
             print(colorama.Fore.RED +
                   f'{file_path.name} not written', file=sys.stderr)
+            return
+        file_path = temp_file_path
+    with file:
+        for chunk in chunks:
+            file.write(chunk)
+    print(f'{file_path.name} written on {file_path.parent}')
@@ -0,0 +1,178 @@
+import collections
+import contextlib
+import hashlib
+import itertools
+import math
+import mmap
+import os
+import struct
+
+import numpy as np
+
+import alfeios.walker as aw
+
+# Summary file layout, all integers big-endian:
+# - header : magic, number of contents, number of bits of the Bloom filter
+#            (0 for an exact summary), number of hash functions
+# - body   : exact summary - contents sorted as (md5 digest, size) keys of
+#            KEY_SIZE bytes, so that they can be binary searched as raw bytes
+#            Bloom summary - the bits of the Bloom filter of these keys
+MAGIC = b'ALFEIOS-SUMMARY1'
+HEADER = struct.Struct('>16sQQI')
+KEY_SIZE = 24  # md5 digest and size
+KEY_DTYPE = np.dtype(f'S{KEY_SIZE}')
+CHUNK_SIZE = 100_000  # contents looked up at once
+
+SUFFIX = '_summary.bin'
+
+
+def save_summary(tree, file_path, false_positive_rate=None):
+    """ Saves the contents of a tree, without their paths, in a compact
+    binary file - to check on another machine which contents are missing
+    from this tree
+
+    Args:
+        tree (dict = {pathlib.Path: (hash, int, int)}): tree to summarize -
+                                                        can also be an
+                                                        iterable of
+                                                        (path, content)
+        file_path (pathlib.Path): path of the summary
+        false_positive_rate (float): rate of contents wrongly found in the
+                                     summary, to save a Bloom filter of about
+                                     1.44 * log2(1 / rate) bits per content
+                                     (10 bits for 0.01) instead of 24 bytes
+                                     per content
+                                     default is None meaning an exact summary
+
+    Raises:
+        ValueError: if the false positive rate is not between 0 and 1
+    """
+
+    if false_positive_rate is not None and not 0 < false_positive_rate < 1:
+        raise ValueError('false positive rate must be between 0 and 1,'
+                         f' not {false_positive_rate}')
+
+    items = tree.items() if hasattr(tree, 'items') else tree
+    keys = bytearray()
+    for _, content in items:
+        if content[aw.HASH]:  # not hashed: it cannot be looked up
+            keys += _key(content)
+    keys = np.unique(np.frombuffer(bytes(keys), dtype=KEY_DTYPE))
+
+    if false_positive_rate is None:
+        header = HEADER.pack(MAGIC, len(keys), 0, 0)
+        body = keys.tobytes()
+    else:
+        nb_bits, nb_hashes = _get_bloom_parameters(len(keys),
+                                                   false_positive_rate)
+        bits = bytearray((nb_bits + 7) // 8)
+        for key in keys:
+            for position in _get_bloom_positions(key.ljust(KEY_SIZE, b'\0'),
+                                                 nb_bits, nb_hashes):
+                bits[position >> 3] |= 1 << (position & 7)
+        header = HEADER.pack(MAGIC, len(keys), nb_bits, nb_hashes)
+        body = bits
+
+    temp_path = file_path.with_name(file_path.name + '.tmp')
+    with temp_path.open(mode='wb') as file:
+        file.write(header)
+        file.write(body)
+    os.replace(temp_path, file_path)
+
+
+def is_summary(path):
+    """
+    Returns:
+        bool: True if path is a summary file
+    """
+
+    if not path.is_file():
+        return False
+    with path.open(mode='rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def get_missing(old_items, file_path):
+    """ Finds the contents of an old tree missing from a summary, in one
+    streaming pass over the old tree - with a Bloom summary, a missing
+    content is wrongly found at the false positive rate of the summary
+
+    Args:
+        old_items (iterable of (path, content)): items of the old tree
+        file_path (pathlib.Path): path of the summary
+
+    Returns:
+        collections.defaultdict(set) =
+            {(hash-code, int): {(pathlib.Path, float)}}
+            for the contents missing from the summary
+
+    Raises:
+        ValueError: if the file is not a summary
+    """
+
+    missing = collections.defaultdict(set)
+    with file_path.open(mode='rb') as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{file_path} is not a summary')
+        _, count, nb_bits, nb_hashes = HEADER.unpack(header)
+        with contextlib.ExitStack() as stack:
+            summary = None  # empty summary: every content is missing
+            if count:
+                summary = stack.enter_context(mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ))
+            old_items = iter(old_items)
+            while chunk := list(itertools.islice(old_items, CHUNK_SIZE)):
+                if summary is None:
+                    found = [False] * len(chunk)
+                elif nb_bits:
+                    found = _find_in_bloom(summary, nb_bits, nb_hashes, chunk)
+                else:
+                    found = _find_in_keys(summary, count, chunk)
+                for (path, content), is_found in zip(chunk, found):
+                    if not is_found:
+                        missing[(content[aw.HASH], content[aw.SIZE])].add(
+                            (path, content[aw.MTIME]))
+    return missing
+
+
+def _key(content):
+    return bytes.fromhex(content[aw.HASH]) + struct.pack('>q',
+                                                         content[aw.SIZE])
+
+
+def _find_in_keys(summary, count, chunk):
+    keys = np.frombuffer(summary, dtype=KEY_DTYPE, count=count,
+                         offset=HEADER.size)
+    hashed = np.array([bool(c[aw.HASH]) for _, c in chunk], dtype=bool)
+    searched = np.array([_key(c) if c[aw.HASH] else b'' for _, c in chunk],
+                        dtype=KEY_DTYPE)
+    positions = np.minimum(np.searchsorted(keys, searched), count - 1)
+    return (keys[positions] == searched) & hashed
+
+
+def _find_in_bloom(summary, nb_bits, nb_hashes, chunk):
+    found = []
+    for _, content in chunk:
+        found.append(bool(content[aw.HASH]) and all(
+            summary[HEADER.size + (p >> 3)] >> (p & 7) & 1
+            for p in _get_bloom_positions(_key(content), nb_bits,
+                                          nb_hashes)))
+    return found
+
+
+def _get_bloom_parameters(count, false_positive_rate):
+    # optimal number of bits and of hash functions
+    count = max(count, 1)
+    nb_bits = max(8, math.ceil(-count * math.log(false_positive_rate)
+                               / math.log(2) ** 2))
+    nb_hashes = max(1, round(nb_bits / count * math.log(2)))
+    return nb_bits, nb_hashes
+
+
+def _get_bloom_positions(key, nb_bits, nb_hashes):
+    # double hashing: positions h1 + i * h2 of the bits of a key
+    digest = hashlib.blake2b(key, digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'big')
+    h2 = int.from_bytes(digest[8:], 'big') | 1
+    return ((h1 + i * h2) % nb_bits for i in range(nb_hashes))
@@ -0,0 +1,130 @@
+import ctypes
+import os
+import platform
+import sys
+import threading
+import time
+
+BURST = 1.0  # seconds of rate that can be consumed at once after a pause
+MIN_BACKOFF = 0.01  # first pause after a slow read, in seconds
+MAX_BACKOFF = 1.0  # longest pause after consecutive slow reads, in seconds
+
+# I/O priority of Linux (see man ioprio_set)
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3  # only served when no other process uses the disk
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_SET = {'x86_64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30,
+              'armv7l': 314, 'ppc64le': 273}  # syscall numbers
+
+
+class Throttle:
+    """ Limits the I/O of the hashing of files, so that an index can run on
+    a live host without hurting the latency of its workload
+
+    - bytes_per_second and files_per_second are token buckets: the hashing
+      waits when it gets ahead of the rate, and up to BURST seconds of rate
+      are consumed at once after a pause
+    - when a block takes longer than max_latency to be read, the disk is
+      considered busy: the hashing pauses, twice longer at each consecutive
+      slow read up to MAX_BACKOFF, and the pause shrinks again with fast
+      reads (reads served from the page cache are fast)
+
+    It is shared by all the threads of a process.
+
+    Args:
+        bytes_per_second (int): maximum rate of bytes read
+                                default is None meaning no limit
+        files_per_second (float): maximum rate of files hashed
+                                  default is None meaning no limit
+        max_latency (float): read latency of a block, in seconds, above
+                             which the hashing backs off
+                             default is None meaning no back-off
+    """
+
+    def __init__(self, bytes_per_second=None, files_per_second=None,
+                 max_latency=None):
+        self.bytes = _bucket(bytes_per_second)
+        self.files = _bucket(files_per_second)
+        self.max_latency = max_latency
+        self.backoff = 0
+        self.lock = threading.Lock()
+
+    def file_started(self):
+        """ Waits until a new file can be hashed
+        """
+
+        if self.files is not None:
+            self.files.take(1)
+
+    def block_read(self, size, latency):
+        """ Waits after a block of size bytes has been read in latency
+        seconds, until the next one can be read
+        """
+
+        if self.bytes is not None:
+            self.bytes.take(size)
+        if self.max_latency is not None:
+            with self.lock:
+                if latency > self.max_latency:
+                    self.backoff = min(max(2 * self.backoff, MIN_BACKOFF),
+                                       MAX_BACKOFF)
+                    backoff = self.backoff
+                else:
+                    self.backoff = self.backoff / 2 \
+                        if self.backoff > MIN_BACKOFF else 0
+                    backoff = 0
+            if backoff:
+                time.sleep(backoff)
+
+
+class _TokenBucket:
+
+    def __init__(self, rate, burst=BURST):
+        self.rate = rate
+        self.capacity = rate * burst
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, amount):
+        # tokens can go negative: the debt is paid by waiting
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _bucket(rate):
+    return _TokenBucket(rate) if rate else None
+
+
+def lower_priority():
+    """ Lowers the CPU priority (nice) of the current process to the lowest
+    one, and on Linux its I/O priority to the idle class, honored by the
+    BFQ I/O scheduler - inherited by the processes and threads it starts
+
+    Returns:
+        bool: False if the I/O priority could not be lowered
+    """
+
+    if hasattr(os, 'nice'):
+        try:
+            os.nice(19)  # capped to the lowest priority
+        except OSError:
+            pass
+    if not sys.platform.startswith('linux'):
+        return False
+    number = IOPRIO_SET.get(platform.machine())
+    if number is None:
+        return False
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.syscall(number, IOPRIO_WHO_PROCESS, 0,
+                            IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) == 0
+    except (OSError, AttributeError):
+        return False
@@ -1,26 +1,58 @@
 import datetime
+import importlib
 import os
-import pathlib
-import shutil
+import re
+import sys
 import time
-import zipfile
 
 
 DATE_FORMAT = '%Y_%m_%d_%H_%M_%S'
 
 
+def lazy_import(name):
+    """ Imports a module on first attribute access, so that heavy modules
+    (numpy, tqdm) are only loaded by the commands that use them and the
+    command-line interface starts quickly
+
+    Args:
+        name (str): absolute name of the module, like 'alfeios.columnar'
+
+    Returns:
+        module, or a stand-in importing it on first attribute access - safe
+        to use from several threads, unlike importlib.util.LazyLoader before
+        Python 3.12
+    """
+
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)
+
+
+class _LazyModule:
+    # every attribute access goes through importlib.import_module, that
+    # returns the module from sys.modules once loaded and otherwise waits
+    # for the lock of its import, so that no thread sees it half-executed
+
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.__name), attr)
+
+    def __repr__(self):
+        return f'<lazy module {self.__name!r}>'
+
+
+# only loaded to unpack compressed files
+shutil = lazy_import('shutil')
+zipfile = lazy_import('zipfile')
+
+
 def is_compressed_file(path):
     return path.is_file() and path.suffix in [
         '.zip', '.tar', '.gztar', '.bztar', '.xztar']
 
 
-def change_dir_relative(path):
-    original_cwd = os.getcwd()
-    os.chdir(path)
-    path = pathlib.Path()
-    return path, original_cwd
-
-
 def add_suffix(file_path, suffix):
     return file_path.rename(file_path.with_stem(file_path.stem + suffix))
 
@@ -47,6 +79,28 @@ def natural_size(num, unit='B'):
     return result
 
 
+def parse_natural_size(text):
+    # inverse of natural_size: '1.5 MiB', '10k', '2G' or '512' -> bytes
+    match = re.fullmatch(r'\s*([0-9]*\.?[0-9]+)\s*([kmgtpezy]?)(i?b?)\s*',
+                         text, flags=re.IGNORECASE)
+    if match is None:
+        raise ValueError(f'invalid size: {text}')
+    number, prefix = float(match.group(1)), match.group(2).lower()
+    exponent = '_kmgtpezy'.index(prefix) if prefix else 0
+    return int(number * 1024 ** exponent)
+
+
+def parse_duration(text):
+    # '90', '90s', '50ms', '15m', '2h', '1.5d' or '1w' -> seconds
+    match = re.fullmatch(r'\s*([0-9]*\.?[0-9]+)\s*(ms|[smhdw]?)\s*', text,
+                         flags=re.IGNORECASE)
+    if match is None:
+        raise ValueError(f'invalid duration: {text}')
+    number, unit = float(match.group(1)), match.group(2).lower()
+    return number * {'': 1, 's': 1, 'ms': 0.001, 'm': 60, 'h': 3600,
+                     'd': 86400, 'w': 604800}[unit]
+
+
 def unpack_archive_and_restore_mtime(path, extract_dir):
     shutil.unpack_archive(path, extract_dir=extract_dir)
     _restore_mtime_after_unpack(path, extract_dir=extract_dir)
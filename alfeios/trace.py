@@ -0,0 +1,126 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+MIN_FILE_SIZE = 1 << 24  # ie 16 MiB, smallest file whose hashing is traced
+MIN_DURATION = 0.001  # shortest directory walk traced, in seconds
+
+# Categories of the spans
+DIRECTORY = 'directory'  # listing and walk of a directory, with its children
+HASH = 'hash'            # hashing of a large file
+ARCHIVE = 'archive'      # unpacking and walk of a compressed file
+CACHE = 'cache'          # load of the previous indexes used as cache
+SERIALIZE = 'serialize'  # save of the index
+
+
+class Tracer:
+    """ Records the spans of an index run, to be opened in a trace viewer
+    (chrome://tracing or https://ui.perfetto.dev) where stalls show up: a
+    huge file, a slow compressed file, a directory with many entries
+
+    Spans are saved as complete events of the Chrome trace event format,
+    with their process and thread, so that the compressed files walked by
+    worker processes show up next to the walk.
+    Only the files larger than min_file_size and the directories longer than
+    min_duration to walk are recorded, to bound the size of the trace.
+
+    Args:
+        min_file_size (int): smallest file whose hashing is recorded,
+                             in bytes
+                             default is MIN_FILE_SIZE
+        min_duration (float): shortest directory walk recorded, in seconds
+                              default is MIN_DURATION
+    """
+
+    def __init__(self, min_file_size=MIN_FILE_SIZE, min_duration=MIN_DURATION):
+        self.min_file_size = min_file_size
+        self.min_duration_ns = int(min_duration * 1e9)
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.events = []
+        self.lock = threading.Lock()  # roots may be walked in threads
+
+    @staticmethod
+    def now():
+        """
+        Returns:
+            int: start time of a span, in ns - a clock shared by the worker
+                 processes
+        """
+
+        return time.perf_counter_ns()
+
+    def directory_walked(self, path, start, entries):
+        """ Records the walk of a directory started at start, if long enough
+        """
+
+        if self.now() - start >= self.min_duration_ns:
+            self.add(path.as_posix(), DIRECTORY, start, entries=entries)
+
+    def file_hashed(self, path, start, size):
+        """ Records the hashing of a file started at start, if large enough
+        """
+
+        if size >= self.min_file_size:
+            self.add(path.as_posix(), HASH, start, size=size)
+
+    def archive_walked(self, path, start, end=None, pid=None, files=0):
+        """ Records the walk of a compressed file, possibly by another
+        process
+        """
+
+        self.add(path.as_posix(), ARCHIVE, start, end, pid, files=files)
+
+    @contextlib.contextmanager
+    def span(self, name, category, **args):
+        """ Records the span of the block it wraps
+        """
+
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, **args)
+
+    def add(self, name, category, start, end=None, pid=None, **args):
+        """ Records a span from start to end (in ns), by default now
+        """
+
+        if end is None:
+            end = self.now()
+        event = {'name': name, 'cat': category, 'ph': 'X',
+                 'ts': (start - self.origin) / 1000,
+                 'dur': (end - start) / 1000,
+                 'pid': self.pid if pid is None else pid,
+                 'tid': threading.get_ident() if pid is None else pid,
+                 'args': args}
+        with self.lock:
+            self.events.append(event)
+
+    def save(self, file_path):
+        """ Saves the spans as a Chrome trace json file
+        """
+
+        pids = {e['pid'] for e in self.events} | {self.pid}
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid,
+                     'args': {'name': 'alfeios' if pid == self.pid
+                              else 'alfeios archive worker'}}
+                    for pid in sorted(pids)]
+        with open(file_path, mode='w') as file:
+            json.dump({'traceEvents': metadata + self.events,
+                       'displayTimeUnit': 'ms'}, file)
+
+
+def timed(function, *args, **kwargs):
+    """ Calls a function, typically in a worker process
+
+    Returns:
+        (result, int, int, int): the result of the function, its start and
+                                 end times in ns and the process id
+    """
+
+    start = time.perf_counter_ns()
+    result = function(*args, **kwargs)
+    return result, start, time.perf_counter_ns(), os.getpid()
@@ -0,0 +1,111 @@
+import collections
+import contextlib
+import hashlib
+
+import alfeios.listing as al
+import alfeios.walker as aw
+
+MAX_COMPARED = 4  # largest group of same size files compared byte by byte
+BLOCK_SIZE = 65536  # ie 64 KiB
+
+
+def get_duplicate(root, tree, min_size=0, max_compared=MAX_COMPARED,
+                  block_size=BLOCK_SIZE):
+    """ Finds the duplicate files of a tree indexed without hashing, only
+    reading the files that share their size with another one
+
+    - small groups of same size files are read in lockstep, block by block,
+      and split at the first differing block: files that differ in their
+      first block are read no further
+    - the md5 hash-code of each confirmed group is computed on the fly from
+      the blocks its files share, so that the listing has the same format as
+      when every file is hashed
+    - larger groups, and groups with files already hashed (from cache or
+      from inside compressed files), are hashed instead
+    - files that cannot be read are not reported
+
+    Args:
+        root (pathlib.Path): root directory the paths of the tree are
+                             relative to
+        tree (dict = {pathlib.Path: (hash-code, int, float)}): directory index
+                                                               where
+                                                               hash-code may
+                                                               be empty
+        min_size (int): size of the smallest files to consider
+                        default is 0
+        max_compared (int): size of the largest group compared byte by byte
+                            default is MAX_COMPARED
+        block_size (int): number of bytes compared at once
+                          default is BLOCK_SIZE
+
+    Returns:
+        duplicate : collections.defaultdict(set) =
+                    {(hash-code, int): {(pathlib.Path, float)}}
+                    sorted by decreasing content size
+        size_gain : int
+    """
+
+    by_size = collections.defaultdict(list)
+    for path, content in tree.items():
+        if content[aw.SIZE] >= min_size:
+            by_size[content[aw.SIZE]].append((path, content))
+
+    listing = collections.defaultdict(set)
+    for size, items in by_size.items():
+        if len(items) < 2:
+            continue  # a unique size cannot be duplicated
+        if len(items) <= max_compared \
+                and not any(c[aw.HASH] for _, c in items):
+            groups = _compare(root, size, items, block_size)
+        else:
+            groups = _hash(root, items)
+        for content, pointers in groups:
+            listing[content] |= pointers
+    return al.get_duplicate(listing)
+
+
+def _compare(root, size, items, block_size):
+    # yields the groups of identical files, at least 2 per group
+    with contextlib.ExitStack() as stack:
+        members = []
+        for path, content in items:
+            try:
+                file = stack.enter_context((root / path).open(mode='rb'))
+            except OSError:
+                continue
+            members.append((path, content[aw.MTIME], file))
+
+        groups = [(hashlib.md5(), members)]
+        while groups:
+            next_groups = []
+            for hasher, group in groups:
+                by_block = collections.defaultdict(list)
+                for member in group:
+                    try:
+                        by_block[member[2].read(block_size)].append(member)
+                    except OSError:
+                        continue
+                for block, sub_group in by_block.items():
+                    if len(sub_group) < 2:
+                        continue  # a unique file is read no further
+                    sub_hasher = hasher.copy()
+                    sub_hasher.update(block)
+                    if block:
+                        next_groups.append((sub_hasher, sub_group))
+                    else:  # end of files
+                        yield ((sub_hasher.hexdigest(), size),
+                               {(path, mtime) for path, mtime, _ in sub_group})
+            groups = next_groups
+
+
+def _hash(root, items):
+    for path, content in items:
+        if content[aw.HASH]:
+            yield (content[aw.HASH], content[aw.SIZE]), \
+                {(path, content[aw.MTIME])}
+            continue
+        try:
+            hash_code, size, mtime = aw.index_file(root / path)
+        except OSError:
+            continue
+        yield (hash_code, size), {(path, mtime)}
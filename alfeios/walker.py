@@ -1,19 +1,48 @@
+import collections
+import errno
 import hashlib
 import os
 import pathlib
-import shutil
-import tempfile
+import time
 
+import alfeios.exclusion as ax
 import alfeios.tool as at
+import alfeios.trace as atr
+
+# only loaded to walk compressed files, or with archive workers
+concurrent_futures = at.lazy_import('concurrent.futures')
+shutil = at.lazy_import('shutil')
+tempfile = at.lazy_import('tempfile')
 
 # Content data
 HASH = 0  # content md5 hashcode
 SIZE = 1  # content size in bytes
 MTIME = 2  # last modification time
 
+# Extended attribute caching the hash-code of a file, with the size and
+# modification time (in ns) it was computed for - Linux only
+XATTR_NAME = 'user.alfeios.md5'
+
+BLOCK_SIZE = 65536  # ie 64 KiB
+_ZEROS = bytes(16 * BLOCK_SIZE)  # fed to the hasher for the holes of files
+
+
+class StopWalk(Exception):
+    """ Raised by a checkpoint callback to stop a walk cleanly
+    """
+
+
+# Walk context shared by all the recursive calls of a walk
+_Context = collections.namedtuple('_Context', [
+    'root', 'tree', 'forbidden', 'cache', 'exclusion', 'should_unzip',
+    'should_hash', 'progress', 'checkpoint', 'use_xattr', 'archives',
+    'tracer', 'throttle'])
+
 
 def walk(path, exclusion=None, cache=None, should_unzip=True, should_hash=True,
-         pbar=None):
+         progress=None, tree=None, forbidden=None, checkpoint=None,
+         use_xattr=False, archive_workers=None, archive_space=None,
+         tracer=None, throttle=None):
     """ Recursively walks through a root directory to index its content
 
     It manages two data structures:
@@ -28,14 +57,56 @@ def walk(path, exclusion=None, cache=None, should_unzip=True, should_hash=True,
 
     Args:
         path (pathlib.Path): path to the root directory to parse
-        exclusion (set of str): set of directories and files not to parse
+        exclusion (Exclusion or iterable of str): exclusion rules of the
+            directories and files not to parse (see alfeios.exclusion) -
+            excluded directories are neither listed nor stat'ed
         cache (tree): previous result to be used as cache to avoid re-hashing
                       if path, mtime and size are unchanged
         should_unzip (bool): flag to unzip and walk compressed files or not
         should_hash (bool): flag to hash content or not
-        pbar (object): progress bar that must implement the interface:
-            * update()       - mandatory
-            * set_postfix()  - nice to have
+        progress (alfeios.progress.Progress): told once per file indexed,
+            from cache or hashed, and once per path that could not be
+            indexed - it publishes rate-limited events to its sinks
+            default is None meaning no progress reporting
+        tree (dict-like): mapping to fill with the tree items, for instance
+                          to spill them to disk instead of keeping them in
+                          memory - only item assignment is required
+                          default is None meaning a new dict
+        forbidden (dict): dict to fill with the forbidden items
+                          default is None meaning a new dict
+        checkpoint (callable): called after each file as
+                               checkpoint(hashed_size) where hashed_size is
+                               the number of bytes hashed for this file
+                               - it can raise StopWalk to stop the walk,
+                               leaving the partial tree and forbidden filled
+                               - it is ignored once the walk is over, while
+                               the last compressed files are merged
+        use_xattr (bool): flag to trust the hash-code cached in the extended
+                          attributes of a file when its size and mtime are
+                          unchanged, and to cache it there after hashing -
+                          so that it survives copies (cp -a, rsync -X) and
+                          is shared by all roots - ignored where extended
+                          attributes are not supported
+        archive_workers (int): number of processes unpacking and walking
+                               compressed files while the walk goes on -
+                               their trees are merged as they complete
+                               default is None meaning compressed files are
+                               walked one after the other by the walk itself
+        archive_space (int): maximum total size of the compressed files
+                             unpacked at the same time by the processes, in
+                             bytes, to bound the temp space used - a
+                             compressed file larger than it is still unpacked
+                             alone
+                             default is None meaning no size limit
+        tracer (alfeios.trace.Tracer): told the walk of each directory, the
+            hashing of each file and the walk of each compressed file, to
+            record the long ones as spans of a timeline
+            default is None meaning no tracing
+        throttle (alfeios.throttle.Throttle): told each file hashed and each
+            block read, to limit the I/O rate of the hashing by waiting -
+            compressed files unpacked by the archive workers are not
+            throttled
+            default is None meaning no limit
 
     Possible future args:
         - find previous result inside or outside root folder: Yes, No
@@ -49,108 +120,391 @@ def walk(path, exclusion=None, cache=None, should_unzip=True, should_hash=True,
         forbidden : dict = {pathlib.Path: Exception}
     """
 
-    if exclusion is None:
-        exclusion = set()
-    exclusion.update(['.alfeios', '.alfeios_expected'])
+    exclusion = ax.build_exclusion(exclusion).with_rules(ax.INTERNAL_RULES)
 
     if cache is None:  # todo check if this is pythonic
         cache = dict()
 
-    tree = dict()
-    forbidden = dict()
+    if tree is None:
+        tree = dict()
+    if forbidden is None:
+        forbidden = dict()
 
-    #    path = path.resolve()  # todo remove if not used (understand before)
-    path, original_cwd = at.change_dir_relative(path)  # todo understand better
-    _recursive_walk(path, tree, forbidden, cache, exclusion,
-                    should_unzip, should_hash, pbar)
-    os.chdir(original_cwd)  # todo understand better
+    # the walk never changes the current working directory: every file is
+    # accessed through its full path (root / relative path) and indexed
+    # under its relative path, so that several walks can run concurrently
+    archives = None
+    if archive_workers and should_unzip:
+        archives = _ArchivePool(archive_workers, archive_space,
+                                exclusion.rules_text, should_hash)
+    context = _Context(pathlib.Path(path), tree, forbidden, cache, exclusion,
+                       should_unzip, should_hash, progress, checkpoint,
+                       use_xattr, archives, tracer, throttle)
+    try:
+        _recursive_walk(context, pathlib.Path())
+        if archives is not None:
+            archives.join(context)
+    finally:
+        if archives is not None:
+            archives.shutdown()
 
     return tree, forbidden
 
 
-def _recursive_walk(path, tree, forbidden, cache, exclusion,
-                    should_unzip, should_hash, pbar):
+def index_file(path, use_xattr=False):
+    """
+    Args:
+        path (pathlib.Path): path to a file
+        use_xattr (bool): same as walk
+
+    Returns:
+        (hash-code, int, float): content of the file, as indexed by walk
+    """
+
+    tree = dict()
+    _hash_and_index_file(path, path, tree, should_hash=True,
+                         use_xattr=use_xattr)
+    return tree[path]
+
+
+def walk_archive(full_path, exclusion=None, should_hash=True, progress=None,
+                 throttle=None):
+    """ Unpacks a compressed file in a temp directory and walks through it,
+    with no cache
+
+    Args:
+        full_path (pathlib.Path): path to the compressed file
+        exclusion, should_hash, progress, throttle: same as walk
+
+    Returns:
+        tree      : dict = {pathlib.Path: (hash-code, int, int)}
+        forbidden : dict = {pathlib.Path: Exception}
+        with paths relative to the compressed file
+
+    Raises:
+        shutil.ReadError, OSError: if the file cannot be unpacked
+    """
+    temp_dir = pathlib.Path(tempfile.mkdtemp())
+    try:
+        at.unpack_archive_and_restore_mtime(full_path, extract_dir=temp_dir)
+        return walk(temp_dir, exclusion, cache=dict(), should_unzip=True,
+                    should_hash=should_hash, progress=progress,
+                    throttle=throttle)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def _recursive_walk(context, path):
+    full_path = context.root / path
 
     # CASE 1: path is a directory
     # --------------------------------------------------
-    if path.is_dir():
-        for child in path.iterdir():
-            try:
-                if child.name not in exclusion and not child.is_symlink():
-                    _recursive_walk(child, tree, forbidden, cache, exclusion,
-                                    should_unzip, should_hash, pbar)
-            except (PermissionError, Exception) as e:
-                forbidden[child] = type(e)
+    if full_path.is_dir():
+        start = context.tracer.now() if context.tracer is not None else 0
+        nb_entries = 0
+        with os.scandir(full_path) as entries:
+            for entry in entries:
+                nb_entries += 1
+                child = path / entry.name
+                try:
+                    if (not entry.is_symlink()
+                            and not context.exclusion.excludes(child, entry)):
+                        _recursive_walk(context, child)
+                except StopWalk:
+                    raise
+                except (PermissionError, Exception) as e:
+                    context.forbidden[child] = type(e)
+                    if context.progress is not None:
+                        context.progress.error(child)
+        if context.tracer is not None:
+            context.tracer.directory_walked(path, start, nb_entries)
 
     # CASE 2: path is a file
     # --------------------------------------------------
-    elif path.is_file():
-        if _has_same_file_in_cache(path, cache):
-            _fill_tree_from_cache(tree, path, cache)
+    elif full_path.is_file():
+        hashed_size = 0
+        from_cache = _has_same_file_in_cache(full_path, path, context.cache)
+        if from_cache:
+            _fill_tree_from_cache(context.tree, path, context.cache)
         else:
-            _hash_and_index_file(path, tree, should_hash=should_hash,
-                                 pbar=pbar)
-        if at.is_compressed_file(path) and should_unzip:
-            _walk_zip_file(tree, forbidden, path, exclusion, should_hash, pbar)
+            start = context.tracer.now() if context.tracer is not None else 0
+            hashed_size = _hash_and_index_file(
+                full_path, path, context.tree,
+                should_hash=context.should_hash,
+                use_xattr=context.use_xattr, progress=context.progress,
+                throttle=context.throttle)
+            if context.tracer is not None:
+                context.tracer.file_hashed(path, start, hashed_size)
+        if context.progress is not None:
+            context.progress.file_indexed(
+                path, _get_indexed_size(context, full_path, path, from_cache,
+                                        hashed_size),
+                hashed_size, from_cache)
+        if at.is_compressed_file(full_path) and context.should_unzip:
+            _walk_zip_file(context, full_path, path)
+        if context.checkpoint is not None:
+            context.checkpoint(hashed_size)
 
     # CASE 3: should not happen
     # --------------------------------------------------
     else:
-        forbidden[path] = Exception
+        context.forbidden[path] = Exception
 
 
 def _fill_tree_from_cache(tree, path, cache):
     tree[path] = cache[path]
 
 
-def _walk_zip_file(tree, forbidden, path, exclusion, should_hash, pbar):
-    temp_dir = pathlib.Path(tempfile.mkdtemp())
+def _get_indexed_size(context, full_path, path, from_cache, hashed_size):
+    # the tree may be write-only (spilled to disk): size is found elsewhere
+    if from_cache:
+        return context.cache[path][SIZE]
+    if context.should_hash and hashed_size:
+        return hashed_size
+    return full_path.stat().st_size  # not hashed or from extended attributes
+
+
+def _walk_zip_file(context, full_path, path):
+    if context.archives is not None:
+        context.archives.submit(context, full_path, path)
+        return
+    start = context.tracer.now() if context.tracer is not None else 0
     try:
-        at.unpack_archive_and_restore_mtime(path, extract_dir=temp_dir)
-        # calls the recursion one step above with no cache to create
-        # separate output that will be merged afterwards
-        zt, zf = walk(temp_dir, exclusion, cache=dict(),
-                      should_unzip=True,
-                      should_hash=should_hash, pbar=pbar)
-        _append_tree(tree, zt, path)
-        _append_tree(forbidden, zf, path)
+        # separate output that is merged afterwards
+        zt, zf = walk_archive(full_path, context.exclusion,
+                              should_hash=context.should_hash,
+                              progress=context.progress,
+                              throttle=context.throttle)
+        if context.tracer is not None:
+            context.tracer.archive_walked(path, start, files=len(zt))
+        _append_tree(context.tree, zt, path)
+        _append_tree(context.forbidden, zf, path)
     except (shutil.ReadError, OSError, Exception) as e:
-        forbidden[path] = type(e)
-    finally:
-        shutil.rmtree(temp_dir)
+        context.forbidden[path] = type(e)
+        if context.progress is not None:
+            context.progress.error(path)
+
+
+class _ArchivePool:
+    # compressed files unpacked and walked by worker processes, while the
+    # walk goes on - their trees are merged in the walk as they complete
+
+    def __init__(self, workers, space, rules, should_hash):
+        self.executor = concurrent_futures.ProcessPoolExecutor(workers)
+        self.workers = workers
+        self.space = space
+        self.rules = rules  # exclusion rules, as text to be pickled
+        self.should_hash = should_hash
+        self.pending = dict()  # {future: (path, size)}
+
+    def submit(self, context, full_path, path):
+        size = full_path.stat().st_size
+        # at most one compressed file per worker, within the space limit
+        while self.pending and (
+                len(self.pending) >= self.workers
+                or (self.space is not None
+                    and sum(s for _, s in self.pending.values()) + size
+                    > self.space)):
+            self._merge(context, concurrent_futures.FIRST_COMPLETED)
+        if context.tracer is not None:  # timed in the worker process
+            future = self.executor.submit(atr.timed, walk_archive, full_path,
+                                          self.rules,
+                                          should_hash=self.should_hash)
+        else:
+            future = self.executor.submit(walk_archive, full_path,
+                                          self.rules,
+                                          should_hash=self.should_hash)
+        self.pending[future] = (path, size)
+
+    def join(self, context):
+        while self.pending:
+            self._merge(context, concurrent_futures.ALL_COMPLETED,
+                        can_stop=False)
+
+    def shutdown(self):
+        # pending compressed files are abandoned when the walk is stopped
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _merge(self, context, return_when, can_stop=True):
+        done, _ = concurrent_futures.wait(self.pending,
+                                          return_when=return_when)
+        for future in done:
+            path, _ = self.pending.pop(future)
+            try:
+                if context.tracer is not None:
+                    (zt, zf), start, end, pid = future.result()
+                    context.tracer.archive_walked(path, start, end, pid,
+                                                  files=len(zt))
+                else:
+                    zt, zf = future.result()
+            except Exception as e:
+                context.forbidden[path] = type(e)
+                if context.progress is not None:
+                    context.progress.error(path)
+                continue
+            _append_tree(context.tree, zt, path)
+            _append_tree(context.forbidden, zf, path)
+            hashed_size = 0
+            for p, content in zt.items():
+                if self.should_hash:
+                    hashed_size += content[SIZE]
+                if context.progress is not None:
+                    context.progress.file_indexed(
+                        path / p, content[SIZE],
+                        content[SIZE] if self.should_hash else 0)
+            if context.checkpoint is not None:
+                try:
+                    context.checkpoint(hashed_size)
+                except StopWalk:
+                    # once the walk is over, stopping would throw away a
+                    # complete tree
+                    if can_stop:
+                        raise
 
 
-def _has_same_file_in_cache(path, cache):
+def _has_same_file_in_cache(full_path, path, cache):
     if path in cache:
         cached = cache[path]
-        stat = path.stat()
+        stat = full_path.stat()
         if stat.st_size == cached[SIZE] and stat.st_mtime == cached[MTIME]:
             return True
     return False
 
 
-def _hash_and_index_file(path, tree, should_hash, pbar):
-    block_size = 65536  # ie 64 KiB
+def _hash_and_index_file(full_path, path, tree, should_hash, use_xattr=False,
+                         progress=None, throttle=None):
+    use_xattr = use_xattr and should_hash and hasattr(os, 'setxattr')
+    if use_xattr:
+        stat_before = full_path.stat()
+        hash_code = _get_xattr_hash(full_path, stat_before)
+        if hash_code is not None:
+            tree[path] = (hash_code, stat_before.st_size, stat_before.st_mtime)
+            return 0
 
     if should_hash:
+        if throttle is not None:
+            throttle.file_started()
         file_hasher = hashlib.md5()
-        with path.open(mode='rb') as file_content:
-            content_stream = file_content.read(block_size)
-            while len(content_stream) > 0:
-                file_hasher.update(content_stream)
-                if pbar is not None:
-                    pbar.set_postfix(file=str(path)[-10:], refresh=False)
-                    pbar.update(len(content_stream))
-                content_stream = file_content.read(block_size)
+        with full_path.open(mode='rb') as file_content:
+            file_stat = os.fstat(file_content.fileno())
+            if _is_sparse(file_stat):
+                skipped_size = _hash_sparse_content(
+                    file_content, file_stat.st_size, file_hasher, throttle)
+                if progress is not None:
+                    progress.holes_skipped(skipped_size)
+            else:
+                _hash_content(file_content, file_hasher, throttle)
         hash_code = file_hasher.hexdigest()
     else:
-        if pbar is not None:
-            pbar.set_postfix(file=str(path)[-10:], refresh=False)
-            pbar.update(1)
         hash_code = ''
 
-    stat = path.stat()
+    stat = full_path.stat()
     tree[path] = (hash_code, stat.st_size, stat.st_mtime)
+    if use_xattr and _is_same_version(stat, stat_before):
+        _set_xattr_hash(full_path, hash_code, stat)
+    return stat.st_size if should_hash else 0
+
+
+def _hash_content(file_content, file_hasher, throttle=None):
+    content_stream = _read(file_content, BLOCK_SIZE, throttle)
+    while len(content_stream) > 0:
+        file_hasher.update(content_stream)
+        content_stream = _read(file_content, BLOCK_SIZE, throttle)
+
+
+def _read(file_content, size, throttle):
+    if throttle is None:
+        return file_content.read(size)
+    start = time.perf_counter()
+    content_stream = file_content.read(size)
+    throttle.block_read(len(content_stream), time.perf_counter() - start)
+    return content_stream
+
+
+def _is_sparse(stat):
+    # fewer blocks allocated than needed by its size: the file has holes
+    return (hasattr(os, 'SEEK_DATA') and hasattr(stat, 'st_blocks')
+            and stat.st_blocks * 512 < stat.st_size)
+
+
+def _hash_sparse_content(file_content, size, file_hasher, throttle=None):
+    # only reads the data extents of the file: its holes are read as zeros
+    # by the kernel, so they are hashed from a zero buffer without any I/O
+    # - extents are read with os.pread at their offset, as the lseeks move
+    # the file descriptor under the buffer of file_content
+    # - returns the number of bytes of holes skipped
+    fd = file_content.fileno()
+    offset = skipped_size = 0
+    while offset < size:
+        try:
+            data_start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno != errno.ENXIO:  # SEEK_DATA not supported
+                _hash_extent(fd, offset, None, file_hasher, throttle)
+                return skipped_size
+            data_start = size  # no data after offset: a hole up to the end
+        data_start = min(data_start, size)
+        _hash_zeros(data_start - offset, file_hasher)
+        skipped_size += data_start - offset
+        if data_start == size:
+            break
+        data_end = min(os.lseek(fd, data_start, os.SEEK_HOLE), size)
+        if not _hash_extent(fd, data_start, data_end, file_hasher, throttle):
+            return skipped_size  # truncated while hashed
+        offset = data_end
+    return skipped_size
+
+
+def _hash_extent(fd, start, end, file_hasher, throttle=None):
+    # hashes from start to end, or to the end of the file if end is None
+    # - returns False if the file ends before end
+    offset = start
+    while end is None or offset < end:
+        size = BLOCK_SIZE if end is None else min(BLOCK_SIZE, end - offset)
+        if throttle is None:
+            content_stream = os.pread(fd, size, offset)
+        else:
+            read_start = time.perf_counter()
+            content_stream = os.pread(fd, size, offset)
+            throttle.block_read(len(content_stream),
+                                time.perf_counter() - read_start)
+        if not content_stream:
+            return end is None
+        file_hasher.update(content_stream)
+        offset += len(content_stream)
+    return True
+
+
+def _hash_zeros(size, file_hasher):
+    zeros = memoryview(_ZEROS)
+    while size > 0:
+        file_hasher.update(zeros[:min(size, len(_ZEROS))])
+        size -= len(_ZEROS)
+
+
+def _get_xattr_hash(full_path, stat):
+    try:
+        hash_code, size, mtime_ns = os.getxattr(
+            full_path, XATTR_NAME).decode().split()
+        if int(size) == stat.st_size and int(mtime_ns) == stat.st_mtime_ns:
+            return hash_code
+    except (OSError, ValueError):  # no attribute, not supported or invalid
+        pass
+    return None
+
+
+def _set_xattr_hash(full_path, hash_code, stat):
+    value = f'{hash_code} {stat.st_size} {stat.st_mtime_ns}'
+    try:
+        os.setxattr(full_path, XATTR_NAME, value.encode())
+    except OSError:  # not supported, read-only or not owned
+        pass
+
+
+def _is_same_version(stat, other_stat):
+    # the file has not been modified while it was hashed
+    return (stat.st_size, stat.st_mtime_ns) == \
+        (other_stat.st_size, other_stat.st_mtime_ns)
 
 
 def _append_tree(tree, additional_tree, start_path):
@@ -1,6 +1,8 @@
 import datetime
 import json
 import os
+import pathlib
+import random
 import shutil
 import time
 
@@ -10,6 +12,10 @@ from pypdf import PdfReader, PdfWriter  # to modify MetaData (alt: pikepdf)
 
 import alfeios.tool as at
 
+# modification times of the files created by the tests
+DT_TUPLE1 = (2021, 1, 16, 11, 1, 0, 0, 0, -1)
+DT_TUPLE2 = (2022, 2, 17, 12, 2, 0, 0, 0, -1)
+
 
 def create_png(path, dt_tuple, colors, w=36, h=65):
     c1, c2, c3 = colors.split()
@@ -48,6 +54,29 @@ def create_pdf(path, dt_tuple, content):
     reset_time(path, dt_tuple)
 
 
+def create_tree(path, files, dt_tuple=DT_TUPLE1):
+    # files: {relative path: text content} - parent directories are created
+    path.mkdir(parents=True, exist_ok=True)
+    for name, content in files.items():
+        (path / name).parent.mkdir(parents=True, exist_ok=True)
+        create_txt(path / name, dt_tuple, content)
+    return path
+
+
+def random_tree(seed, n=2000, nb_contents=300):
+    # in-memory tree of n files sharing nb_contents contents
+    rng = random.Random(seed)
+    contents = [(f'{rng.getrandbits(128):032x}', rng.randrange(0, 10_000))
+                for _ in range(nb_contents)]
+    contents.append(('', 0))  # content of a walk without hashing
+    tree = dict()
+    for i in range(n):
+        h, s = rng.choice(contents)
+        mtime = rng.choice([1576878010.0, 1792426637.9034605 + i])
+        tree[pathlib.Path(f'folder{i % 7}/file{i}.txt')] = (h, s, mtime)
+    return tree
+
+
 def create_zip(path, dt_tuple, paths):
     shutil.make_archive(path, 'zip', paths)
     reset_time(path.parent / (path.name + ".zip"), dt_tuple)
@@ -81,11 +110,9 @@ def log_sorted_json_tree(file_path):
 
 
 def remove_last_json_tree(dir_path):
+    # the last tree is either a full snapshot or a delta
     cache_path = dir_path / '.alfeios'
-    times = []
-    for tree_path in cache_path.glob('*_tree.json'):
-        times.append(at.read_datetime_tag(tree_path.name[:19]))
-    max_time = max(times)
-    max_time_tag = at.build_datetime_tag(max_time)
-    last_json_tree = cache_path / (max_time_tag + '_tree.json')
+    tree_paths = list(cache_path.glob('*_tree.json'))
+    last_json_tree = max(
+        tree_paths, key=lambda p: at.read_datetime_tag(p.name[:19]))
     os.remove(last_json_tree)
@@ -0,0 +1,266 @@
+""" Memory and scaling regression harness of listing, columnar and
+serialize
+
+Trees are synthesised in memory, without touching the disk for the content
+of files, then each function is run twice: once to measure its wall time
+and once under tracemalloc to measure its peak memory. The columnar
+functions are measured next to the listing ones as they are the ones used
+by the duplicate and missing commands. Results are reported per entry and
+checked against budgets, so that memory blow-ups are caught before they
+hit real servers.
+
+Run it from the repository root, for example:
+    python tests/scaling.py 1M 10M 50M
+    python tests/scaling.py 100k --budgets my_budgets.json
+
+The budgets file is a json object like:
+    {"tree_to_listing": {"bytes_per_entry": 400, "seconds_per_entry": 2e-5}}
+The exit code is 1 when a budget is exceeded.
+"""
+
+import argparse
+import collections
+import contextlib
+import gc
+import io
+import json
+import pathlib
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import alfeios.columnar as ac
+import alfeios.listing as al
+import alfeios.serialize as asd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+Budget = collections.namedtuple('Budget', ['bytes_per_entry',
+                                           'seconds_per_entry'])
+
+Result = collections.namedtuple('Result', [
+    'function', 'entries', 'seconds', 'peak_bytes', 'max_rss_bytes'])
+
+# default budgets, with a safety margin over the measures of a reference run
+BUDGETS = {
+    'tree_to_listing': Budget(400, 1e-5),
+    'get_duplicate': Budget(200, 1e-5),
+    'get_missing': Budget(150, 5e-6),
+    'tree_to_columns': Budget(150, 5e-6),
+    'columnar_get_duplicate': Budget(700, 5e-5),
+    'columnar_get_missing': Budget(700, 5e-5),
+    'save_json_tree': Budget(1000, 1e-4),
+    'load_json_tree': Budget(1200, 5e-5),
+}
+
+
+def synthesize_tree(n, duplicate_ratio=0.5, seed=0):
+    """ Synthesises a tree of n entries without creating any file
+
+    Args:
+        n (int): number of entries
+        duplicate_ratio (float): ratio of entries sharing their content with
+                                 another entry
+        seed (int): seed of the random generator
+
+    Returns:
+        dict = {pathlib.Path: (hash-code, int, float)}
+    """
+
+    rng = random.Random(seed)
+    nb_contents = max(1, int(n * (1 - duplicate_ratio)))
+    contents = [(f'{rng.getrandbits(128):032x}', rng.randrange(1 << 24))
+                for _ in range(nb_contents)]
+    tree = dict()
+    for i in range(n):
+        hash_code, size = contents[i % nb_contents]
+        path = pathlib.Path(f'folder{i % 997}/sub{i % 31}/file{i}.jpg')
+        tree[path] = (hash_code, size, 1_600_000_000.0 + i)
+    return tree
+
+
+def measure(name, function, entries, *args):
+    """
+    Args:
+        name (str): name of the function in the results
+        function (callable): function to measure, called with args
+        entries (int): number of entries processed by the function
+
+    Returns:
+        Result
+    """
+
+    gc.collect()
+    start = time.perf_counter()
+    function(*args)
+    seconds = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return Result(name, entries, seconds, peak_bytes, _get_max_rss_bytes())
+
+
+def run(n, functions=None):
+    """ Measures the functions of listing, columnar and serialize on trees of
+    n entries
+
+    Args:
+        n (int): number of entries of the synthesised trees
+        functions (list of str): names of the functions to measure
+                                 default is None meaning all of them
+
+    Returns:
+        list of Result
+    """
+
+    functions = set(BUDGETS) if functions is None else set(functions)
+    results = []
+    tree = synthesize_tree(n)
+    listing = al.tree_to_listing(tree)
+    if 'tree_to_listing' in functions:
+        results.append(measure('tree_to_listing', al.tree_to_listing, n,
+                               tree))
+    if 'get_duplicate' in functions:
+        results.append(measure('get_duplicate', al.get_duplicate, n,
+                               listing))
+    if 'get_missing' in functions:
+        other_listing = al.tree_to_listing(synthesize_tree(n, seed=1))
+        results.append(measure('get_missing', al.get_missing, n, listing,
+                               other_listing))
+        del other_listing
+
+    columns = ac.tree_to_columns(tree)
+    if 'tree_to_columns' in functions:
+        results.append(measure('tree_to_columns', ac.tree_to_columns, n,
+                               tree))
+    if 'columnar_get_duplicate' in functions:
+        results.append(measure('columnar_get_duplicate', ac.get_duplicate, n,
+                               columns))
+    if 'columnar_get_missing' in functions:
+        other_columns = ac.tree_to_columns(synthesize_tree(n, seed=1))
+        results.append(measure('columnar_get_missing', ac.get_missing, n,
+                               columns, other_columns))
+        del other_columns
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if 'save_json_tree' in functions:
+            results.append(measure('save_json_tree', _save_json_tree, n,
+                                   temp_dir, tree))
+        if 'load_json_tree' in functions:
+            tree_path = _save_json_tree(temp_dir, tree)
+            results.append(measure('load_json_tree', asd.load_json_tree, n,
+                                   tree_path))
+    return results
+
+
+def check_budgets(results, budgets=None):
+    """
+    Args:
+        results (list of Result): measures
+        budgets (dict = {str: Budget}): budgets by function name
+                                        default is None meaning BUDGETS
+
+    Returns:
+        list of str: the budgets exceeded
+    """
+
+    budgets = BUDGETS if budgets is None else budgets
+    exceeded = []
+    for result in results:
+        budget = budgets.get(result.function)
+        if budget is None:
+            continue
+        bytes_per_entry = result.peak_bytes / result.entries
+        seconds_per_entry = result.seconds / result.entries
+        if (budget.bytes_per_entry is not None
+                and bytes_per_entry > budget.bytes_per_entry):
+            exceeded.append(f'{result.function} at {result.entries} entries:'
+                            f' {bytes_per_entry:.0f} bytes per entry >'
+                            f' {budget.bytes_per_entry}')
+        if (budget.seconds_per_entry is not None
+                and seconds_per_entry > budget.seconds_per_entry):
+            exceeded.append(f'{result.function} at {result.entries} entries:'
+                            f' {seconds_per_entry:.2e} seconds per entry >'
+                            f' {budget.seconds_per_entry}')
+    return exceeded
+
+
+def load_budgets(file_path):
+    json_budgets = json.loads(pathlib.Path(file_path).read_text())
+    return {name: Budget(b.get('bytes_per_entry'), b.get('seconds_per_entry'))
+            for name, b in json_budgets.items()}
+
+
+def format_results(results):
+    lines = [f'{"function":<24}{"entries":>12}{"seconds":>10}'
+             f'{"us/entry":>10}{"peak MiB":>10}{"B/entry":>9}'
+             f'{"max RSS MiB":>13}']
+    for r in results:
+        lines.append(f'{r.function:<24}{r.entries:>12}{r.seconds:>10.2f}'
+                     f'{1e6 * r.seconds / r.entries:>10.2f}'
+                     f'{r.peak_bytes / 2 ** 20:>10.1f}'
+                     f'{r.peak_bytes / r.entries:>9.0f}'
+                     f'{r.max_rss_bytes / 2 ** 20:>13.1f}')
+    return '\n'.join(lines)
+
+
+def parse_entries(text):
+    # '50000', '100k', '10M' or '1G' -> number of entries
+    multipliers = {'k': 10 ** 3, 'm': 10 ** 6, 'g': 10 ** 9}
+    text = text.strip().lower()
+    if text and text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+
+def _save_json_tree(temp_dir, tree):
+    # a new directory each time, so that a full snapshot is always saved
+    dir_path = pathlib.Path(tempfile.mkdtemp(dir=temp_dir))
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asd.save_json_tree(dir_path, tree)
+
+
+def _get_max_rss_bytes():
+    if resource is None:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sizes', nargs='+',
+                        help='numbers of entries, like 1M 10M 50M')
+    parser.add_argument('-f', '--function', action='append',
+                        dest='functions', choices=sorted(BUDGETS),
+                        help='function to measure - can be repeated'
+                             ' - default is all of them')
+    parser.add_argument('-b', '--budgets',
+                        help='json file of budgets, replacing the default'
+                             ' ones')
+    args = parser.parse_args()
+    budgets = BUDGETS if args.budgets is None else load_budgets(args.budgets)
+
+    exceeded = []
+    for size in args.sizes:
+        results = run(parse_entries(size), args.functions)
+        print(format_results(results), flush=True)
+        exceeded.extend(check_budgets(results, budgets))
+    for message in exceeded:
+        print(f'Budget exceeded: {message}', file=sys.stderr)
+    return 1 if exceeded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
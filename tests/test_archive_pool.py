@@ -0,0 +1,60 @@
+import pathlib
+import shutil
+
+import pytest
+
+import alfeios.api as aa
+import alfeios.serialize as asd
+import alfeios.walker as aw
+import helper as h
+
+
+def create_root(path):
+    for i in range(4):
+        folder = h.create_tree(path / 'content' / f'folder{i}',
+                               {'file.txt': f'content {i}',
+                                'same.txt': 'same content'})
+        h.create_zip(path / f'archive{i}', h.DT_TUPLE1, folder)
+    h.create_txt(path / 'broken.zip', h.DT_TUPLE1, 'not a zip file')
+    return path
+
+
+@pytest.mark.parametrize('archive_space', [None, 1])
+def test_archive_pool_is_serial_walk(tmp_path, archive_space):
+    root = create_root(tmp_path / 'root')
+    expected_tree, expected_forbidden = aw.walk(root)
+
+    tree, forbidden = aw.walk(root, archive_workers=2,
+                              archive_space=archive_space)
+
+    assert tree == expected_tree
+    assert forbidden == expected_forbidden
+    assert pathlib.Path('archive3.zip/file.txt') in tree
+    assert pathlib.Path('broken.zip') in forbidden
+
+
+def test_index_with_archive_workers(tmp_path):
+    root = create_root(tmp_path / 'root')
+    expected_tree, _ = aw.walk(root)
+
+    aa.index(root, archive_workers=2, archive_space='1KiB')
+
+    assert asd.load_last_json_tree(root) == expected_tree
+
+
+def test_join_does_not_stop_walk(tmp_path):
+    root = create_root(tmp_path / 'root')
+    shutil.rmtree(root / 'content')  # only compressed files left to walk
+    (root / 'broken.zip').unlink()
+    expected_tree, _ = aw.walk(root)
+
+    def checkpoint(hashed_size):
+        if hashed_size > 0:
+            raise aw.StopWalk
+
+    # compressed files from the cache are not hashed by the walk, but their
+    # content is hashed by the workers and merged once the walk is over
+    tree, _ = aw.walk(root, cache=expected_tree, checkpoint=checkpoint,
+                      archive_workers=4)
+
+    assert tree == expected_tree
@@ -0,0 +1,64 @@
+import pathlib
+
+import alfeios.api as aa
+import alfeios.cache as ach
+import alfeios.external as ae
+import alfeios.serialize as asd
+import alfeios.walker as aw
+import helper as h
+
+
+FILES = {'a.txt': 'a', '2019/b.txt': 'b', '2019/summer/c.txt': 'c',
+         '2020/d.txt': 'd'}
+
+
+def test_cache_from_ancestor(tmp_path):
+    root = h.create_tree(tmp_path / 'Pictures', FILES)
+    aa.index(root)
+
+    cache = ach.Cache(root / '2019')
+
+    expected_tree, _ = aw.walk(root / '2019')
+    assert dict(cache) == expected_tree
+
+
+def test_cache_on_disk(tmp_path):
+    root = h.create_tree(tmp_path / 'Pictures', FILES)
+    aa.index(root)
+
+    with ae.DiskDict() as entries:
+        cache = ach.Cache(root / '2019', entries=entries)
+
+        assert cache.entries is entries
+        assert dict(cache) == dict(ach.Cache(root / '2019'))
+    assert not entries.temp_dir.exists()
+
+
+def test_cache_from_descendants(tmp_path):
+    root = h.create_tree(tmp_path / 'Pictures', FILES)
+    aa.index(root / '2019')
+    aa.index(root / '2020')
+
+    cache = ach.Cache(root)
+    assert len(cache) == 0  # descendants are loaded lazily
+
+    expected_tree, _ = aw.walk(root)
+    for path, content in expected_tree.items():
+        if path != pathlib.Path('a.txt'):
+            assert cache[path] == content
+    assert pathlib.Path('a.txt') not in cache
+
+
+def test_index_reuses_ancestor_index(tmp_path, monkeypatch):
+    root = h.create_tree(tmp_path / 'Pictures', FILES)
+    aa.index(root)
+    expected_tree, _ = aw.walk(root / '2019' / 'summer')
+    calls = []
+    monkeypatch.setattr(aw, '_hash_and_index_file',
+                        lambda *args, **kwargs: calls.append(args))
+
+    aa.index(root / '2019' / 'summer')
+
+    assert calls == []
+    tree = asd.load_last_json_tree(root / '2019' / 'summer')
+    assert tree == expected_tree
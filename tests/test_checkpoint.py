@@ -0,0 +1,68 @@
+import alfeios.api as aa
+import alfeios.serialize as asd
+import alfeios.walker as aw
+import helper as h
+
+
+FILES = {f'file{i}.txt': f'content {i}' for i in range(10)}
+
+
+def test_stop_walk_keeps_partial_tree(tmp_path):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    tree, forbidden = dict(), dict()
+    calls = []
+
+    def checkpoint(hashed_size):
+        calls.append(hashed_size)
+        if len(calls) == 4:
+            raise aw.StopWalk
+
+    try:
+        aw.walk(root, tree=tree, forbidden=forbidden, checkpoint=checkpoint)
+    except aw.StopWalk:
+        pass
+
+    assert len(tree) == 4
+    assert calls == [len('content 0')] * 4
+
+
+def test_max_duration_then_resume(tmp_path, monkeypatch):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    expected_tree, _ = aw.walk(root)
+
+    aa.index(root, max_duration=0)
+    assert len(asd.load_last_json_checkpoint(root)) == 1
+    aa.index(root, max_duration=0, resume=True)
+    checkpoint = asd.load_last_json_checkpoint(root)
+    assert len(checkpoint) == 2
+
+    calls = []
+    original = aw._hash_and_index_file
+    monkeypatch.setattr(aw, '_hash_and_index_file',
+                        lambda *args, **kwargs: calls.append(args) or
+                        original(*args, **kwargs))
+    aa.index(root, resume=True)
+
+    assert len(calls) == 8
+    assert asd.load_last_json_tree(root) == expected_tree
+    assert asd.load_last_json_checkpoint(root) == {}
+
+
+def test_checkpoint_on_interrupt(tmp_path, monkeypatch):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    original = aw._hash_and_index_file
+    calls = []
+
+    def interrupt_at_third_file(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(aw, '_hash_and_index_file', interrupt_at_third_file)
+    try:
+        aa.index(root)
+    except KeyboardInterrupt:
+        pass
+
+    assert len(asd.load_last_json_checkpoint(root)) == 2
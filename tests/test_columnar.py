@@ -0,0 +1,52 @@
+import pytest
+
+import alfeios.columnar as ac
+import alfeios.listing as al
+import helper as h
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_tree_to_listing(seed):
+    tree = h.random_tree(seed)
+
+    listing = ac.tree_to_listing(tree)
+    expected_listing = al.tree_to_listing(tree)
+
+    assert listing == expected_listing
+    assert list(listing) == list(expected_listing)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_get_duplicate(seed):
+    tree = h.random_tree(seed)
+
+    duplicate, size_gain = ac.get_duplicate(ac.tree_to_columns(tree))
+    expected_duplicate, expected_size_gain = al.get_duplicate(
+        al.tree_to_listing(tree))
+
+    assert duplicate == expected_duplicate
+    assert list(duplicate) == list(expected_duplicate)
+    assert size_gain == expected_size_gain
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_get_missing(seed):
+    old_tree = h.random_tree(seed)
+    new_tree = h.random_tree(seed + 10, n=1000)
+    new_tree.update(h.random_tree(seed, n=500))
+
+    missing = ac.get_missing(ac.tree_to_columns(old_tree),
+                             ac.tree_to_columns(new_tree))
+    expected_missing = al.get_missing(al.tree_to_listing(old_tree),
+                                      al.tree_to_listing(new_tree))
+
+    assert missing == expected_missing
+    assert len(missing) > 0
+
+
+def test_empty_tree():
+    columns = ac.tree_to_columns(dict())
+
+    assert ac.tree_to_listing(dict()) == {}
+    assert ac.get_duplicate(columns) == ({}, 0)
+    assert ac.get_missing(columns, columns) == {}
@@ -0,0 +1,160 @@
+import os
+import pathlib
+import socket
+import stat as st
+import tempfile
+import threading
+import time
+
+import pytest
+
+import alfeios.api as aa
+import alfeios.columnar as ac
+import alfeios.daemon as adm
+import alfeios.serialize as asd
+import alfeios.walker as aw
+import helper as h
+
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'),
+                                reason='Unix sockets are not supported')
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    # a short path as Unix socket paths are limited to about 100 characters
+    socket_path = pathlib.Path('/tmp') / f'alfeios-test-{id(tmp_path)}.sock'
+    monkeypatch.setenv(adm.SOCKET_ENV, str(socket_path))
+    thread = threading.Thread(target=adm.serve,
+                              kwargs={'refresh_interval': 0.1})
+    thread.start()
+    while adm.request({'query': 'ping'}) is None:
+        time.sleep(0.01)
+    yield socket_path
+    assert adm.stop()
+    thread.join()
+    assert not socket_path.exists()
+
+
+def create_root(path):
+    h.create_tree(path, {'a.txt': 'a', 'sub/a.txt': 'a', 'b.txt': 'bb',
+                         'sub/b.txt': 'bb', 'c.txt': 'ccc'})
+    aa.index(path)
+    return asd.find_last_json_tree(path)
+
+
+def test_lookup():
+    tree = {pathlib.Path('a'): ('h1', 1, 0.0),
+            pathlib.Path('b'): ('h2', 2, 0.0),
+            pathlib.Path('c'): ('h1', 1, 1.0)}
+    columns = ac.tree_to_columns(tree)
+
+    result = ac.lookup(columns, ac.group(columns), [('h1', 1), ('h1', 2),
+                                                    ('h3', 3), ('h2', 2)])
+
+    assert list(result.items()) == [
+        (('h1', 1), {(pathlib.Path('a'), 0.0), (pathlib.Path('c'), 1.0)}),
+        (('h2', 2), {(pathlib.Path('b'), 0.0)})]
+
+
+def fail(*args, **kwargs):
+    raise AssertionError('should be answered by the daemon')
+
+
+def test_duplicate_is_answered_by_daemon(tmp_path, daemon, monkeypatch):
+    tree_path = create_root(tmp_path / 'root')
+    expected, _ = ac.get_duplicate(ac.tree_to_columns(
+        asd.load_json_tree(tree_path)))
+    monkeypatch.setattr(aa, '_load_or_index', fail)
+
+    aa.duplicate(tree_path)
+
+    [f] = (tmp_path / 'root' / '.alfeios').glob('*_duplicate.json')
+    assert asd.load_json_listing(f) == expected
+
+
+def test_missing_is_answered_by_daemon(tmp_path, daemon, monkeypatch):
+    old_tree_path = create_root(tmp_path / 'old')
+    h.create_tree(tmp_path / 'new', {'b.txt': 'bb'})
+    aa.index(tmp_path / 'new')
+    new_tree_path = asd.find_last_json_tree(tmp_path / 'new')
+    monkeypatch.setattr(aa, '_load_or_index_in_parallel', fail)
+
+    aa.missing(old_tree_path, new_tree_path)
+
+    [f] = (tmp_path / 'old' / '.alfeios').glob('*_missing.json')
+    assert set(asd.load_json_listing(f)) == {
+        ('0cc175b9c0f1b6a831c399e269772661', 1),
+        ('9df62e693988eb4e1e1444ece0578579', 3)}
+
+
+def test_new_snapshot_is_reloaded(tmp_path, daemon):
+    root = tmp_path / 'root'
+    create_root(root)
+    content = ('9df62e693988eb4e1e1444ece0578579', 3)
+    [(found, pointers)] = adm.query_lookup(root, [content])
+    assert pointers == {(pathlib.Path('c.txt'), aw.walk(root)[0][
+        pathlib.Path('c.txt')][aw.MTIME])}
+
+    (root / 'c.txt').rename(root / 'd.txt')
+    time.sleep(1)  # to avoid name collision
+    aa.index(root)
+
+    [(found, pointers)] = adm.query_lookup(root, [content])
+    assert {p for p, _ in pointers} == {pathlib.Path('d.txt')}
+
+
+def test_bad_query_does_not_stop_daemon(daemon):
+    assert adm.request({'query': 'unknown'}) is None
+    assert adm.query_lookup('/non/existing/path', []) is None
+    assert adm.request({'query': 'ping'}) == 'ping'
+
+
+def test_socket_is_private(daemon):
+    assert st.S_IMODE(daemon.stat().st_mode) & 0o077 == 0
+
+
+def test_socket_of_other_user_is_ignored(daemon, monkeypatch):
+    uid = os.getuid()
+    with monkeypatch.context() as m:  # undone before the daemon is stopped
+        m.setattr(os, 'getuid', lambda: uid + 1)
+
+        assert adm.request({'query': 'ping'}) is None
+
+
+def test_default_socket_path(monkeypatch):
+    monkeypatch.delenv(adm.SOCKET_ENV, raising=False)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', '/run/user/1000')
+    assert adm.get_socket_path() == pathlib.Path('/run/user/1000/alfeios.sock')
+
+    monkeypatch.delenv('XDG_RUNTIME_DIR')
+    socket_path = adm.get_socket_path()
+    assert socket_path.parent.parent == pathlib.Path(tempfile.gettempdir())
+    assert socket_path.name == 'alfeios.sock'
+
+
+def test_default_socket_dir_is_private(tmp_path, monkeypatch, capsys):
+    # a short temp directory as Unix socket paths are limited
+    temp_dir = pathlib.Path('/tmp') / f'alfeios-test-{id(tmp_path)}'
+    temp_dir.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(temp_dir))
+    monkeypatch.delenv(adm.SOCKET_ENV, raising=False)
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    socket_dir = adm.get_socket_path().parent
+    try:
+        socket_dir.mkdir(mode=0o777)
+        socket_dir.chmod(0o777)
+        adm.serve()  # returns at once
+        assert 'can be accessed by other users' in capsys.readouterr().err
+
+        socket_dir.rmdir()
+        thread = threading.Thread(target=adm.serve)
+        thread.start()
+        while adm.request({'query': 'ping'}) is None:
+            time.sleep(0.01)
+        assert st.S_IMODE(socket_dir.stat().st_mode) == 0o700
+        assert adm.stop()
+        thread.join()
+    finally:
+        socket_dir.rmdir()
+        temp_dir.rmdir()
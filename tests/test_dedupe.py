@@ -0,0 +1,130 @@
+import os
+import pathlib
+import shutil
+
+import pytest
+
+import alfeios.api as aa
+import alfeios.dedupe as add
+import alfeios.listing as al
+import alfeios.walker as aw
+import helper as h
+
+
+def create_root(path):
+    # the files of sub are more recent
+    h.create_tree(path / 'sub', {'a.txt': 'same content',
+                                 'b.txt': 'same content',
+                                 'c.txt': 'other content'}, h.DT_TUPLE2)
+    return h.create_tree(path, {'a.txt': 'same content',
+                                'c.txt': 'other content',
+                                'unique.txt': 'unique content'})
+
+
+def duplicate_groups(root):
+    tree, _ = aw.walk(root)
+    duplicate, _ = al.get_duplicate(al.tree_to_listing(tree))
+    return duplicate.items()
+
+
+def is_same_file(path, other_path):
+    return os.path.samestat(path.stat(), other_path.stat())
+
+
+def test_dry_run_changes_nothing(tmp_path):
+    root = create_root(tmp_path / 'root')
+
+    outcomes = list(add.iter_dedupe(root, duplicate_groups(root),
+                                    dry_run=True))
+
+    assert sorted(o.path for o in outcomes) == [
+        pathlib.Path('sub/a.txt'), pathlib.Path('sub/b.txt'),
+        pathlib.Path('sub/c.txt')]
+    assert {o.kind for o in outcomes} == {add.LINKABLE}
+    assert not is_same_file(root / 'a.txt', root / 'sub' / 'a.txt')
+
+
+def test_dedupe_keeps_oldest_file(tmp_path):
+    root = create_root(tmp_path / 'root')
+    expected_tree, _ = aw.walk(root)
+
+    outcomes = list(add.iter_dedupe(root, duplicate_groups(root),
+                                    workers=2, batch_size=1))
+
+    assert {o.kind for o in outcomes} <= {add.REFLINKED, add.HARDLINKED}
+    assert len(outcomes) == 3
+    tree, _ = aw.walk(root)
+    assert {p: c[:2] for p, c in tree.items()} == \
+        {p: c[:2] for p, c in expected_tree.items()}
+    assert tree[pathlib.Path('a.txt')] == expected_tree[pathlib.Path('a.txt')]
+    if outcomes[0].kind == add.HARDLINKED:
+        assert is_same_file(root / 'a.txt', root / 'sub' / 'b.txt')
+    assert not list(root.rglob('*.alfeios.tmp'))
+
+
+def test_dedupe_skips_changed_files(tmp_path):
+    root = create_root(tmp_path / 'root')
+    groups = list(duplicate_groups(root))
+    h.create_txt(root / 'sub' / 'a.txt', h.DT_TUPLE1, 'same content')
+    (root / 'c.txt').unlink()
+
+    outcomes = {o.path: o.kind for o in add.iter_dedupe(root, groups)}
+
+    assert outcomes[pathlib.Path('sub/a.txt')] == add.SKIPPED
+    assert outcomes[pathlib.Path('c.txt')] == add.SKIPPED
+    assert outcomes[pathlib.Path('sub/b.txt')] != add.SKIPPED
+    assert pathlib.Path('sub/c.txt') not in outcomes  # kept instead of c.txt
+
+
+def test_dedupe_already_linked(tmp_path):
+    root = create_root(tmp_path / 'root')
+    aa.dedupe(root / 'no_index')  # nothing to do
+    aa.index(root)
+    aa.dedupe(root, reflink_only=False)
+
+    outcomes = list(add.iter_dedupe(root, duplicate_groups(root)))
+
+    if all(o.kind == add.ALREADY_LINKED for o in outcomes):
+        assert len(outcomes) == 3
+    else:  # reflinks are separate files
+        assert {o.kind for o in outcomes} == {add.REFLINKED}
+
+
+class FakeFcntl:  # clones by copying, on any filesystem
+    @staticmethod
+    def ioctl(fd, request, source_fd):
+        with os.fdopen(os.dup(source_fd), 'rb') as s, \
+                os.fdopen(os.dup(fd), 'wb') as t:
+            shutil.copyfileobj(s, t)
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid') or os.getuid() != 0,
+                    reason='changing the owner of a file needs root')
+def test_reflink_keeps_owner(tmp_path, monkeypatch):
+    root = create_root(tmp_path / 'root')
+    target = root / 'sub' / 'a.txt'
+    os.chown(target, 1234, 5678)
+    monkeypatch.setattr(add, 'fcntl', FakeFcntl)
+
+    assert add._replace(root / 'a.txt', target, False) == (add.REFLINKED,
+                                                           None)
+    assert (target.stat().st_uid, target.stat().st_gid) == (1234, 5678)
+    assert target.read_text() == 'same content'
+
+
+def test_reflink_kept_when_metadata_is_not_copied(tmp_path, monkeypatch):
+    root = create_root(tmp_path / 'root')
+    target = root / 'sub' / 'a.txt'
+    monkeypatch.setattr(add, 'fcntl', FakeFcntl)
+
+    def copystat(source, target):
+        raise PermissionError('copystat')
+    monkeypatch.setattr(shutil, 'copystat', copystat)
+
+    kind, metadata_error = add._replace(root / 'a.txt', target, True)
+
+    assert kind == add.REFLINKED
+    assert isinstance(metadata_error, PermissionError)
+    assert target.stat().st_ino != (root / 'a.txt').stat().st_ino
+    assert target.read_text() == 'same content'
+    assert list((root / 'sub').glob('.*.alfeios.tmp')) == []
@@ -0,0 +1,77 @@
+import json
+
+import alfeios.api as aa
+import alfeios.diff as adf
+import alfeios.serialize as asd
+import helper as h
+
+
+def test_iter_diff():
+    old = {'a.txt': ('h1', 1, 0.0), 'b.txt': ('h2', 2, 0.0),
+           'c.txt': ('h3', 3, 0.0), 'd/e.txt': ('h4', 4, 0.0),
+           'f.txt': ('h5', 5, 0.0), 'g.txt': ('h6', 6, 0.0)}
+    new = {'a.txt': ('h1', 1, 9.0),  # touched only
+           'b.txt': ('h7', 7, 9.0),  # modified
+           'x/e.txt': ('h4', 4, 0.0),  # moved
+           'f.txt': ('h5', 5, 0.0), 'g2.txt': ('h6', 6, 0.0),  # copied
+           'z.txt': ('h8', 8, 0.0)}
+
+    changes = list(adf.iter_diff(adf.sort_items(old), adf.sort_items(new)))
+
+    assert changes == [
+        adf.Change(adf.MODIFIED, 'b.txt', ('h7', 7, 9.0), None,
+                   ('h2', 2, 0.0)),
+        adf.Change(adf.MOVED, 'g2.txt', ('h6', 6, 0.0), 'g.txt',
+                   ('h6', 6, 0.0)),
+        adf.Change(adf.MOVED, 'x/e.txt', ('h4', 4, 0.0), 'd/e.txt',
+                   ('h4', 4, 0.0)),
+        adf.Change(adf.REMOVED, None, None, 'c.txt', ('h3', 3, 0.0)),
+        adf.Change(adf.ADDED, 'z.txt', ('h8', 8, 0.0), None, None)]
+
+
+def test_iter_diff_pairs_same_contents_in_path_order():
+    old = {'a1': ('h', 1, 0.0), 'a2': ('h', 1, 0.0)}
+    new = {'b1': ('h', 1, 0.0), 'b2': ('h', 1, 0.0), 'b3': ('h', 1, 0.0)}
+
+    changes = list(adf.iter_diff(adf.sort_items(old), adf.sort_items(new)))
+
+    assert [(c.kind, c.old_path, c.path) for c in changes] == [
+        (adf.MOVED, 'a1', 'b1'), (adf.MOVED, 'a2', 'b2'),
+        (adf.ADDED, None, 'b3')]
+
+
+def test_diff_snapshot_and_live_root(tmp_path, capsys):
+    h.create_tree(tmp_path, {'a.txt': 'a', 'b.txt': 'b', 'd/c.txt': 'c',
+                             'node_modules/m.js': 'm'})
+    aa.index(tmp_path)
+    old_tree_path = asd.find_last_json_tree(tmp_path)
+    old_tree_path.rename(old_tree_path.with_name('old_tree.json'))
+    old_tree_path = old_tree_path.with_name('old_tree.json')
+    h.create_txt(tmp_path / 'b.txt', h.DT_TUPLE2, 'bb')
+    (tmp_path / 'd' / 'c.txt').rename(tmp_path / 'c.txt')
+    (tmp_path / 'a.txt').unlink()
+    h.create_txt(tmp_path / 'e.txt', h.DT_TUPLE1, 'e')
+    h.create_txt(tmp_path / 'node_modules' / 'n.js', h.DT_TUPLE1, 'n')
+    capsys.readouterr()
+
+    aa.diff(old_tree_path, tmp_path, exclusion=['node_modules/'])
+
+    out, err = capsys.readouterr()
+    changes = [json.loads(line) for line in out.splitlines()]
+    assert [(c['kind'], c.get('old_path'), c.get('path'))
+            for c in changes] == [
+        (adf.MODIFIED, None, 'b.txt'), (adf.MOVED, 'd/c.txt', 'c.txt'),
+        (adf.REMOVED, 'a.txt', None), (adf.ADDED, None, 'e.txt')]
+    assert '1 added, 1 removed, 1 modified, 1 moved' in err
+
+
+def test_diff_with_last_snapshot_by_default(tmp_path, capsys):
+    h.create_txt(tmp_path / 'a.txt', h.DT_TUPLE1, 'a')
+    aa.index(tmp_path)
+    capsys.readouterr()
+
+    aa.diff(tmp_path)
+
+    out, err = capsys.readouterr()
+    assert out == ''
+    assert '0 added, 0 removed, 0 modified, 0 moved' in err
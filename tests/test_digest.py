@@ -0,0 +1,80 @@
+import os
+import pathlib
+import time
+
+import pytest
+
+import alfeios.api as aa
+import alfeios.digest as adg
+import alfeios.listing as al
+import alfeios.serialize as asd
+import helper as h
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_find(seed, tmp_path):
+    tree = h.random_tree(seed)
+    listing = al.tree_to_listing(tree)
+    digest_path = tmp_path / 'tree.digest'
+    adg.save_digest_index(tree, digest_path)
+    contents = list(listing)[::3] + [('f' * 32, 1), ('0' * 32, 0)]
+
+    result = adg.find(digest_path, contents)
+
+    assert result == {c: listing[c] for c in contents
+                      if c in listing and c[0]}
+
+
+def test_find_in_empty_index(tmp_path):
+    digest_path = tmp_path / 'tree.digest'
+    adg.save_digest_index({}, digest_path)
+
+    assert adg.find(digest_path, [('f' * 32, 1)]) == {}
+
+
+def test_find_command(tmp_path, capsys):
+    root = tmp_path / 'root'
+    h.create_tree(root, {'a.txt': 'a', 'sub/a.txt': 'a', 'b.txt': 'b'})
+    h.create_tree(tmp_path / 'new', {'copy.txt': 'a', 'other.txt': 'c'})
+    aa.index(root)
+    digest_path = adg.get_digest_path(asd.find_last_json_tree(root))
+    assert digest_path.is_file()
+    capsys.readouterr()
+
+    aa.find([tmp_path / 'new'], root=root)
+
+    out = capsys.readouterr().out
+    assert f'{tmp_path / "new" / "copy.txt"} found as a.txt, ' \
+           f'{pathlib.Path("sub/a.txt")}' in out
+    assert f'{tmp_path / "new" / "other.txt"} not found' in out
+    assert '1 of 2 files found' in out
+
+
+def test_outdated_digest_index_is_rebuilt(tmp_path, capsys):
+    root = tmp_path / 'root'
+    h.create_tree(root, {'a.txt': 'a'})
+    aa.index(root)
+    tree_path = asd.find_last_json_tree(root)
+    digest_path = adg.get_digest_path(tree_path)
+    adg.save_digest_index({}, digest_path)
+    os.utime(digest_path, (0, 0))
+
+    aa.find([root / 'a.txt'], root=tree_path)
+
+    out, err = capsys.readouterr()
+    assert 'Building digest index' in err
+    assert '1 of 1 files found' in out
+
+
+def test_only_last_tree_has_digest_index(tmp_path):
+    root = tmp_path / 'root'
+    h.create_tree(root, {f'{i}.txt': str(i) for i in range(20)})
+    aa.index(root)
+    time.sleep(1)  # trees are tagged to the second
+    h.create_txt(root / 'new.txt', h.DT_TUPLE1, 'new')
+    aa.index(root)  # saved as a delta
+
+    tree_path = asd.find_last_json_tree(root)
+    assert tree_path.name.endswith(asd.DELTA_SUFFIX)
+    assert list((root / '.alfeios').glob('*' + adg.SUFFIX)) == [
+        adg.get_digest_path(tree_path)]
@@ -0,0 +1,110 @@
+import pathlib
+
+import alfeios.api as aa
+import alfeios.estimate as aes
+import alfeios.listing as al
+import alfeios.serialize as asd
+import alfeios.walker as aw
+import helper as h
+
+
+def create_root(path, nb_groups=40):
+    # in each group of 3 files sharing their size, 2 are equal
+    files = dict()
+    for i in range(nb_groups):
+        files[f'{i}_a.txt'] = files[f'{i}_b.txt'] = 'x' * (i + 1)
+        files[f'{i}_c.txt'] = 'y' * (i + 1)
+    return h.create_tree(path, files)
+
+
+def expected_size_gain(root):
+    tree, _ = aw.walk(root)
+    _, size_gain = al.get_duplicate(al.tree_to_listing(tree))
+    return size_gain
+
+
+def test_estimate_is_exact_within_sample_size(tmp_path):
+    root = create_root(tmp_path / 'root')
+    tree, _ = aw.walk(root, should_hash=False)
+
+    estimate = aes.get_estimate(root, tree)
+
+    assert estimate.size_gain == estimate.lower == estimate.upper \
+        == expected_size_gain(root)
+    assert estimate.hashed_groups == estimate.groups == 40
+    assert estimate.max_size_gain == 2 * estimate.size_gain
+    assert tree == aw.walk(root)[0]  # hash-codes written in the tree
+
+
+def test_estimate_from_sample(tmp_path):
+    root = create_root(tmp_path / 'root')
+    tree, _ = aw.walk(root, should_hash=False)
+
+    estimate = aes.get_estimate(root, tree, sample_size=100, seed=0)
+
+    assert estimate.hashed_groups < estimate.groups
+    assert estimate.hashed_size >= 100
+    # every group has the same ratio of actual to maximum gain
+    assert estimate.lower == estimate.size_gain == estimate.upper \
+        == expected_size_gain(root)
+    hashed = [p for p, c in tree.items() if c[aw.HASH]]
+    assert len(hashed) == 3 * estimate.hashed_groups
+
+
+def test_estimate_bounds(tmp_path):
+    root = create_root(tmp_path / 'root')
+    for i in range(0, 40, 2):  # half of the groups without duplicates
+        h.create_txt(root / f'{i}_b.txt', h.DT_TUPLE1, 'z' * (i + 1))
+    tree, _ = aw.walk(root, should_hash=False)
+
+    estimate = aes.get_estimate(root, tree, sample_size=100, seed=0)
+
+    assert estimate.lower <= estimate.size_gain <= estimate.upper
+    assert estimate.lower <= expected_size_gain(root) <= estimate.upper
+    assert estimate.upper <= estimate.max_size_gain
+
+
+def test_estimate_checkpoint_is_resumed(tmp_path):
+    root = create_root(tmp_path / 'root')
+    aa.duplicate(root, estimate=True, sample_size=100)
+
+    assert not list((root / '.alfeios').glob('*_listing.json'))
+    checkpoint = asd.load_last_json_checkpoint(root)
+    assert checkpoint
+    assert all(c[aw.HASH] for c in checkpoint.values())
+
+    aa.index(root, resume=True)
+    assert asd.load_last_json_checkpoint(root) == dict()
+    tree = asd.load_json_tree(asd.find_last_json_tree(root))
+    assert tree[pathlib.Path('0_a.txt')] == checkpoint.get(
+        pathlib.Path('0_a.txt'), tree[pathlib.Path('0_a.txt')])
+
+
+def test_estimate_checkpoint_is_duplicate_cache(tmp_path, monkeypatch):
+    root = create_root(tmp_path / 'root')
+    aa.duplicate(root, estimate=True, sample_size=100)
+    checkpoint = asd.load_last_json_checkpoint(root)
+    hashed = []
+    hash_and_index_file = aw._hash_and_index_file
+
+    def spy(full_path, path, *args, **kwargs):
+        hashed.append(path)
+        return hash_and_index_file(full_path, path, *args, **kwargs)
+    monkeypatch.setattr(aw, '_hash_and_index_file', spy)
+
+    aa.duplicate(root)
+
+    assert checkpoint and not set(checkpoint) & set(hashed)
+    assert len(hashed) == 3 * 40 - len(checkpoint)
+
+
+def test_estimate_without_cache_ignores_checkpoint(tmp_path):
+    root = create_root(tmp_path / 'root')
+    tree, _ = aw.walk(root)
+    # hash-codes that would make every file unique if they were reused
+    asd.save_json_checkpoint(root, {p: (f'{i:032x}',) + c[1:] for i, (p, c)
+                                    in enumerate(tree.items())}, dict())
+
+    aa.duplicate(root, estimate=True, no_cache=True)
+
+    assert asd.load_last_json_checkpoint(root) == tree
@@ -0,0 +1,109 @@
+import os
+import pathlib
+import time
+
+import pytest
+
+import alfeios.api as aa
+import alfeios.exclusion as ax
+import alfeios.serialize as asd
+import alfeios.walker as aw
+import helper as h
+
+
+@pytest.mark.parametrize('rule, path, is_dir, expected', [
+    ('Folder3', 'a/Folder3', True, True),
+    ('Folder3', 'a/Folder3', False, True),
+    ('Folder3', 'Folder33', True, False),
+    ('*.tmp', 'a/b/x.tmp', False, True),
+    ('*.tmp', 'a/b/x.tmp.txt', False, False),
+    ('node_modules/', 'a/node_modules', True, True),
+    ('node_modules/', 'a/node_modules', False, False),
+    ('/build', 'build', True, True),
+    ('/build', 'a/build', True, False),
+    ('doc/*.pdf', 'doc/x.pdf', False, True),
+    ('doc/*.pdf', 'doc/sub/x.pdf', False, False),
+    ('doc/**/*.pdf', 'doc/sub/x.pdf', False, True),
+    ('doc/**/*.pdf', 'doc/x.pdf', False, True),
+    ('**/cache/**', 'a/b/cache/c/d', False, True),
+    ('**/cache/**', 'a/b/cache', True, False),
+    ('file[0-4].txt', 'file3.txt', False, True),
+    ('file[!0-4].txt', 'file3.txt', False, False),
+    ('file[]].txt', 'file].txt', False, True),
+    ('file[!]].txt', 'file].txt', False, False),
+    ('file[].txt', 'file[].txt', False, True),
+    ('file[0.txt', 'file[0.txt', False, True),
+    ('file[0.txt', 'file0.txt', False, False),
+    ('re:\\.(jpe?g|png)$', 'a/b.JPG', False, False),
+    ('re:(?i)\\.(jpe?g|png)$', 'a/b.JPG', False, True),
+])
+def test_path_rules(rule, path, is_dir, expected):
+    exclusion = ax.Exclusion([rule])
+
+    assert exclusion.matches(pathlib.Path(path), is_dir) is expected
+
+
+def test_size_and_age_rules():
+    now = time.time()
+    exclusion = ax.Exclusion(['size<1k', 'age>30d'])
+
+    assert exclusion.matches('a', stat=ax.Stat(100, now))
+    assert not exclusion.matches('a', stat=ax.Stat(2048, now))
+    assert exclusion.matches('a', stat=ax.Stat(2048, now - 40 * 86400))
+    assert not exclusion.matches('a', is_dir=True, stat=ax.Stat(100, now))
+    assert not exclusion.matches('a')  # no stat: size and age rules skipped
+
+
+def test_negation_last_rule_wins():
+    exclusion = ax.Exclusion(['*.log', '!keep.log'])
+
+    assert exclusion.matches('a/x.log')
+    assert not exclusion.matches('a/keep.log')
+
+
+def test_exclude_from(tmp_path):
+    rules = tmp_path / 'rules.txt'
+    rules.write_text('# comment\n\n*.tmp\n  node_modules/\n')
+
+    exclusion = ax.build_exclusion(['Folder3'], exclude_from=rules)
+
+    assert exclusion.rules_text == ['Folder3', '*.tmp', 'node_modules/']
+
+
+def test_walk_prunes_excluded_directories(tmp_path, monkeypatch):
+    root = tmp_path / 'root'
+    h.create_tree(root, {'src/main.py': 'print()', 'src/main.tmp': 'print()',
+                         'big.bin': 'x' * 5000,
+                         'node_modules/pkg/index.js': ''})
+    listed = []
+    original_scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir',
+                        lambda p: listed.append(pathlib.Path(p)) or
+                        original_scandir(p))
+
+    tree, forbidden = aw.walk(root, exclusion=['node_modules/', '*.tmp',
+                                               'size>4k'])
+
+    assert set(tree) == {pathlib.Path('src/main.py')}
+    assert root / 'node_modules' not in listed
+    assert forbidden == {}
+
+
+@pytest.mark.parametrize('memory_budget', [None, '1MiB'])
+def test_missing_excludes_from_tree_json(tmp_path, memory_budget):
+    old_root = h.create_tree(tmp_path / 'old', {'a.txt': 'old content',
+                                                'b.tmp': 'old temp',
+                                                'cache/c.txt': 'old cache'})
+    # the only copy of a.txt in new is excluded
+    new_root = h.create_tree(tmp_path / 'new', {'a.tmp': 'old content'})
+    aa.index(old_root)
+    aa.index(new_root)
+
+    aa.missing(asd.find_last_json_tree(old_root),
+               asd.find_last_json_tree(new_root),
+               exclusion=['*.tmp', 'cache/'], memory_budget=memory_budget)
+
+    [listing_path] = (old_root / '.alfeios').glob('*_missing.json')
+    listing = asd.load_json_listing(listing_path)
+    assert [p for pointers in listing.values() for p, _ in pointers] == [
+        pathlib.Path('a.txt')]
@@ -0,0 +1,117 @@
+import pytest
+
+import alfeios.api as aa
+import alfeios.cache as ach
+import alfeios.external as ae
+import alfeios.listing as al
+import alfeios.serialize as asd
+import alfeios.walker as aw
+import helper as h
+
+
+@pytest.mark.parametrize('memory_budget', [1, 10_000, '1 GiB'])
+def test_duplicate(memory_budget):
+    tree = h.random_tree(0)
+
+    with ae.SortedRuns(memory_budget) as runs:
+        runs.update(tree.items())
+        duplicate = dict(ae.iter_duplicate(runs.sorted_records()))
+    expected_duplicate, _ = al.get_duplicate(al.tree_to_listing(tree))
+
+    assert duplicate == expected_duplicate
+    assert list(duplicate) == sorted(duplicate, key=lambda c: (-c[1], c[0]))
+
+
+@pytest.mark.parametrize('memory_budget', [1, 10_000, '1 GiB'])
+def test_missing(memory_budget):
+    old_tree = h.random_tree(1)
+    new_tree = h.random_tree(11, n=1000)
+    new_tree.update(h.random_tree(1, n=500))
+
+    with ae.SortedRuns(memory_budget) as old_runs, \
+            ae.SortedRuns(memory_budget) as new_runs:
+        old_runs.update(old_tree.items())
+        new_runs.update(new_tree.items())
+        missing = dict(ae.iter_missing(old_runs.sorted_records(),
+                                       new_runs.sorted_records()))
+    expected_missing = al.get_missing(al.tree_to_listing(old_tree),
+                                      al.tree_to_listing(new_tree))
+
+    assert missing == expected_missing
+
+
+def test_runs_are_removed():
+    with ae.SortedRuns(1) as runs:
+        runs.update(h.random_tree(2, n=10).items())
+        assert len(runs.run_paths) == 10
+        temp_dir = runs.temp_dir
+    assert not temp_dir.exists()
+
+
+def test_bounded_fan_in():
+    tree = h.random_tree(3, n=100)
+
+    with ae.SortedRuns(1, max_fan_in=4) as runs:
+        runs.update(tree.items())
+        assert len(runs.run_paths) == 100
+        records = list(runs.sorted_records())
+        assert len(runs.run_paths) < 4
+        assert len(list(runs.temp_dir.iterdir())) == len(runs.run_paths)
+    expected_records = sorted((-c[1], c[0], str(p), c[2])
+                              for p, c in tree.items())
+
+    assert records == expected_records
+
+
+def test_api_duplicate_same_as_in_memory(tmp_path):
+    path = tmp_path / 'root'
+    files = dict()
+    for i in range(6):
+        files[f'file{i}.txt'] = f'content {i % 3}'
+        files[f'sub/file{i}.txt'] = f'{i % 2}'
+    h.create_tree(path, files)
+
+    aa.duplicate(path, no_cache=True)
+    [f] = (path / '.alfeios').glob('*_listing_duplicate.json')
+    in_memory_path = f.rename(tmp_path / 'in_memory.json')
+    aa.duplicate(path, no_cache=True, memory_budget=1)
+    [out_of_core_path] = (path / '.alfeios').glob('*_listing_duplicate.json')
+
+    in_memory = asd.load_json_listing(in_memory_path)
+    out_of_core = asd.load_json_listing(out_of_core_path)
+    assert out_of_core == in_memory
+    assert len(out_of_core) == 5
+
+
+def test_disk_dict_setdefault(tmp_path):
+    with ae.DiskDict(tmp_path) as entries:
+        assert entries.setdefault('a.txt', ('h1', 1, 1.0)) == ('h1', 1, 1.0)
+        assert entries.setdefault('a.txt', ('h2', 2, 2.0)) == ('h1', 1, 1.0)
+        with pytest.raises(TypeError):
+            entries.setdefault('b.txt')
+        assert 'b.txt' not in entries
+
+
+def test_api_duplicate_cache_on_disk(tmp_path, monkeypatch):
+    path = tmp_path / 'root'
+    h.create_tree(path, {f'file{i}.txt': f'content {i % 3}'
+                         for i in range(6)})
+    aa.index(path)
+    calls, caches = [], []
+    monkeypatch.setattr(aw, '_hash_and_index_file',
+                        lambda *args, **kwargs: calls.append(args))
+    init = ach.Cache.__init__
+
+    def spy_init(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        caches.append(self)
+    monkeypatch.setattr(ach.Cache, '__init__', spy_init)
+
+    aa.duplicate(path, memory_budget=1)
+
+    assert calls == []  # all found in the cache
+    [cache] = caches
+    assert isinstance(cache.entries, ae.DiskDict)
+    assert not cache.entries.temp_dir.exists()
+    [f] = (path / '.alfeios').glob('*_listing_duplicate.json')
+    assert len(asd.load_json_listing(f)) == 3
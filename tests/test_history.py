@@ -0,0 +1,102 @@
+import datetime
+import itertools
+import json
+
+import pytest
+
+import alfeios.api as aa
+import alfeios.serialize as asd
+import alfeios.tool as at
+import alfeios.walker as aw
+import helper as h
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # one tag per save, one minute apart, ending now
+    start = datetime.datetime.now() - datetime.timedelta(hours=1)
+    minutes = itertools.count()
+    monkeypatch.setattr(at, 'build_current_datetime_tag', lambda: (
+        at.build_datetime_tag(
+            start + datetime.timedelta(minutes=next(minutes)))))
+
+
+FILES = {f'file{i}.txt': f'content{i}' for i in range(8)}
+
+
+def test_small_changes_are_saved_as_delta(tmp_path, clock):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    aa.index(root)
+    h.create_txt(root / 'file0.txt', h.DT_TUPLE2, 'modified')
+    (root / 'file1.txt').unlink()
+    h.create_txt(root / 'new.txt', h.DT_TUPLE1, 'new')
+
+    aa.index(root)
+
+    tree_path = asd.find_last_json_tree(root)
+    assert tree_path.name.endswith(asd.DELTA_SUFFIX)
+    delta = json.loads(tree_path.read_text())
+    assert set(delta['changed']) == {'file0.txt', 'new.txt'}
+    assert delta['removed'] == ['file1.txt']
+    expected_tree, _ = aw.walk(root)
+    assert asd.load_last_json_tree(root) == expected_tree
+    assert dict(asd.iter_json_tree(tree_path, chunk_size=7)) == expected_tree
+
+
+def test_large_changes_are_compacted(tmp_path, clock):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    aa.index(root)
+    for i in range(5):
+        h.create_txt(root / f'file{i}.txt', h.DT_TUPLE2, f'modified{i}')
+
+    aa.index(root)
+
+    tree_path = asd.find_last_json_tree(root)
+    assert not tree_path.name.endswith(asd.DELTA_SUFFIX)
+    assert asd.load_json_tree(tree_path) == aw.walk(root)[0]
+
+
+def test_find_last_json_tree_without_valid_manifest(tmp_path, clock):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    aa.index(root)
+    first_tree = asd.load_last_json_tree(root)
+    h.create_txt(root / 'file0.txt', h.DT_TUPLE2, 'modified')
+    aa.index(root)
+    (root / '.alfeios' / asd.MANIFEST_NAME).unlink()
+
+    assert asd.find_last_json_tree(root).name.endswith(asd.DELTA_SUFFIX)
+
+    aa.index(root)
+    h.remove_last_json_tree(root)  # the manifest now points at nothing
+
+    assert asd.find_last_json_tree(root).name.endswith(asd.DELTA_SUFFIX)
+    h.remove_last_json_tree(root)
+    assert asd.load_last_json_tree(root) == first_tree
+
+
+def test_prune_keeps_bases_of_kept_deltas(tmp_path, clock):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    for i in range(4):
+        h.create_txt(root / 'file0.txt', h.DT_TUPLE2, f'modified{i}')
+        aa.index(root)
+    expected_tree = asd.load_last_json_tree(root)
+
+    aa.index(root, keep=2)
+
+    tree_paths = sorted((root / '.alfeios').glob('*_tree.json'))
+    assert [p.name.endswith(asd.DELTA_SUFFIX) for p in tree_paths] == [
+        False, True, True]
+    assert asd.load_last_json_tree(root) == expected_tree
+
+
+def test_prune_by_age(tmp_path, clock):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    aa.index(root)
+    aa.index(root)
+    aa.index(root)
+
+    removed = asd.prune_json_trees(root, keep_for=at.parse_duration('58m'))
+
+    # saved 60, 59 and 58 minutes ago: the last one is kept as a delta base
+    assert removed == 1
+    assert len(list((root / '.alfeios').glob('*_tree.json'))) == 2
@@ -0,0 +1,82 @@
+import pathlib
+
+import pytest
+
+import alfeios.columnar as ac
+import alfeios.listing as al
+
+tree = {
+    pathlib.Path('a/big.iso'): ('b1', 1000, 1.0),
+    pathlib.Path('b/big.iso'): ('b1', 1000, 2.0),
+    pathlib.Path('a/medium.mp4'): ('m1', 300, 1.0),
+    pathlib.Path('b/medium.mp4'): ('m1', 300, 2.0),
+    pathlib.Path('c/medium.mp4'): ('m1', 300, 3.0),
+    pathlib.Path('a/.DS_Store'): ('d1', 10, 1.0),
+    pathlib.Path('b/.DS_Store'): ('d1', 10, 2.0),
+    pathlib.Path('a/x.tmp'): ('t1', 50, 1.0),
+    pathlib.Path('b/x.tmp'): ('t1', 50, 2.0),
+    pathlib.Path('a/unique.txt'): ('u1', 5000, 1.0),
+}
+
+
+def filtered_duplicate(**kwargs):
+    columns = ac.tree_to_columns(tree)
+    return al.get_filtered_duplicate(ac.iter_duplicate(columns), **kwargs)
+
+
+def test_no_filter_is_get_duplicate():
+    duplicate, size_gain = filtered_duplicate()
+    expected, expected_size_gain = al.get_duplicate(al.tree_to_listing(tree))
+
+    assert duplicate == expected
+    assert size_gain == expected_size_gain == 1000 + 600 + 10 + 50
+
+
+def test_top_by_reclaimable_size():
+    duplicate, size_gain = filtered_duplicate(top=2)
+
+    assert list(duplicate) == [('b1', 1000), ('m1', 300)]
+    assert size_gain == 1600
+
+
+@pytest.mark.parametrize('top', [0, -1])
+def test_top_must_be_positive(top):
+    with pytest.raises(ValueError):
+        filtered_duplicate(top=top)
+
+
+def test_min_size():
+    columns = ac.tree_to_columns(tree)
+    duplicate, size_gain = al.get_filtered_duplicate(
+        ac.iter_duplicate(columns, min_size=50))
+
+    assert set(duplicate) == {('b1', 1000), ('m1', 300), ('t1', 50)}
+    assert size_gain == 1650
+
+
+def test_include_exclude_patterns():
+    duplicate, size_gain = filtered_duplicate(exclude=['.DS_Store', '*.tmp',
+                                                       'c/*'])
+
+    assert set(duplicate) == {('b1', 1000), ('m1', 300)}
+    assert duplicate[('m1', 300)] == {(pathlib.Path('a/medium.mp4'), 1.0),
+                                      (pathlib.Path('b/medium.mp4'), 2.0)}
+    assert size_gain == 1300
+
+    duplicate, size_gain = filtered_duplicate(include=['b/*', 'c/*'])
+
+    assert set(duplicate) == {('m1', 300)}
+
+
+def test_directory_rules():
+    # directories are matched like in a walk, at any depth for a name
+    for rule in ['c', 'c/']:
+        duplicate, _ = filtered_duplicate(exclude=[rule])
+
+        assert duplicate[('m1', 300)] == {(pathlib.Path('a/medium.mp4'), 1.0),
+                                          (pathlib.Path('b/medium.mp4'), 2.0)}
+
+    duplicate, size_gain = filtered_duplicate(include=['b/', 'c/'])
+
+    assert set(duplicate) == {('m1', 300)}
+    assert size_gain == 300
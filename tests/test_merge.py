@@ -0,0 +1,62 @@
+import pathlib
+
+import alfeios.api as aa
+import alfeios.serialize as asd
+import alfeios.walker as aw
+import helper as h
+
+
+def create_shards(path):
+    h.create_tree(path / 'shard1', {'sub/a.txt': 'a', 'b.txt': 'b'})
+    h.create_tree(path / 'shard2', {'a.txt': 'a'})
+    aa.index(path / 'shard1')
+    aa.index(path / 'shard2')
+
+
+def test_merge_default_prefixes(tmp_path):
+    create_shards(tmp_path)
+
+    aa.merge([tmp_path / 'shard1', tmp_path / 'shard2'])
+
+    tree = asd.load_last_json_tree(tmp_path)
+    expected_tree, _ = aw.walk(tmp_path)
+    assert tree == expected_tree
+
+
+def test_merge_explicit_prefixes(tmp_path):
+    create_shards(tmp_path)
+    tree_paths = [asd.find_last_json_tree(tmp_path / s)
+                  for s in ['shard1', 'shard2']]
+
+    aa.merge(tree_paths, prefixes=['host1', 'host2/data'],
+             output=tmp_path / 'out')
+
+    tree = asd.load_last_json_tree(tmp_path / 'out')
+    assert set(tree) == {pathlib.Path('host1/sub/a.txt'),
+                         pathlib.Path('host1/b.txt'),
+                         pathlib.Path('host2/data/a.txt')}
+
+
+def test_merge_root_without_index(tmp_path, capsys):
+    create_shards(tmp_path)
+    (tmp_path / 'shard3').mkdir()
+
+    aa.merge([tmp_path / 'shard1', tmp_path / 'shard3'],
+             output=tmp_path / 'out')
+
+    assert 'No index found in' in capsys.readouterr().err
+    assert not (tmp_path / 'out').exists()
+
+
+def test_duplicate_with_several_trees(tmp_path):
+    create_shards(tmp_path)
+    tree_paths = [asd.find_last_json_tree(tmp_path / s)
+                  for s in ['shard1', 'shard2']]
+
+    aa.duplicate(tree_paths)
+
+    [f] = (tmp_path / '.alfeios').glob('*_listing_duplicate.json')
+    duplicate_listing = asd.load_json_listing(f)
+    [pointers] = duplicate_listing.values()
+    assert {pointer[0] for pointer in pointers} == {
+        pathlib.Path('shard1/sub/a.txt'), pathlib.Path('shard2/a.txt')}
@@ -0,0 +1,72 @@
+import json
+import pathlib
+
+import alfeios.api as aa
+import alfeios.listing as al
+import alfeios.online as ao
+import alfeios.serialize as asd
+import alfeios.walker as aw
+import helper as h
+
+
+FILES = {'a.txt': 'same content',
+         'sub/a.txt': 'same content',
+         'sub/b.txt': 'same content',
+         'c.txt': 'other content',
+         'sub/c.txt': 'other content',
+         'unique.txt': 'unique content',
+         'empty.txt': '',
+         'sub/empty.txt': ''}
+
+
+def test_online_duplicate_is_get_duplicate(tmp_path):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    events = []
+    detector = ao.OnlineDuplicate(events.append)
+
+    tree, _ = aw.walk(root, tree=detector)
+
+    assert tree is detector
+    assert dict(tree) == aw.walk(root)[0]
+    expected_duplicate, expected_size_gain = al.get_duplicate(
+        al.tree_to_listing(tree))
+    assert [e.kind for e in events].count(ao.FORMED) == 2  # not empty files
+    assert [e.kind for e in events].count(ao.GROWN) == 1
+    assert events[-1].size_gain == expected_size_gain
+    assert [e.size_gain for e in events] == sorted(e.size_gain
+                                                   for e in events)
+    groups = dict()
+    for event in events:
+        groups.setdefault((event.hash, event.size), set()).update(event.paths)
+        assert event.count == len(groups[(event.hash, event.size)])
+    assert groups == {content: {p for p, _ in pointers}
+                      for content, pointers in expected_duplicate.items()
+                      if content[al.SIZE]}
+
+
+def test_online_duplicate_min_size(tmp_path):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    events = []
+
+    aw.walk(root, tree=ao.OnlineDuplicate(events.append, min_size=13))
+
+    assert [(e.kind, e.size, e.count) for e in events] == [
+        (ao.FORMED, 13, 2)]
+
+
+def test_duplicate_online(tmp_path, capsys):
+    root = h.create_tree(tmp_path / 'root', FILES)
+
+    aa.duplicate(root, online=True, save_index=True)
+
+    out, err = capsys.readouterr()
+    events = [json.loads(line) for line in out.splitlines()]
+    assert len(events) == 3
+    assert events[-1]['size_gain'] == 2 * 12 + 13
+    assert all(isinstance(p, str) for e in events for p in e['paths'])
+    assert 'You can gain' in err
+    [listing_path] = (root / '.alfeios').glob('*_listing_duplicate.json')
+    assert pathlib.Path('sub/empty.txt') in {
+        p for pointers in asd.load_json_listing(listing_path).values()
+        for p, _ in pointers}
+    assert asd.load_last_json_tree(root) == aw.walk(root)[0]
@@ -0,0 +1,83 @@
+import json
+import os
+import pathlib
+
+import alfeios.api as aa
+import alfeios.progress as ap
+import alfeios.walker as aw
+import helper as h
+
+
+FILES = {'a.txt': 'a content', 'b.txt': 'other content',
+         'sub/c.txt': 'a content'}
+
+
+class FakeBar:
+    def __init__(self):
+        self.n = 0
+        self.postfix = None
+
+    def update(self, n):
+        self.n += n
+
+    def set_postfix(self, refresh=True, **kwargs):
+        self.postfix = kwargs
+
+
+def test_progress_is_rate_limited():
+    events = []
+    progress = ap.Progress([events.append], interval=3600)
+
+    for i in range(1000):
+        progress.file_indexed(pathlib.Path(f'file{i}'), 10, 10)
+    progress.error(pathlib.Path('locked'))
+    progress.close()
+
+    assert len(events) == 1
+    assert events[0].kind == ap.DONE
+    assert (events[0].files, events[0].bytes, events[0].errors) == \
+        (1000, 10000, 1)
+
+
+def test_walk_publishes_progress(tmp_path):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    tree, _ = aw.walk(root)
+    events = []
+    progress = ap.Progress([events.append], interval=0)
+
+    aw.walk(root, cache=tree, progress=progress)
+    progress.close()
+
+    assert [e.kind for e in events] == [ap.PROGRESS] * 3 + [ap.DONE]
+    done = events[-1]
+    assert done.files == 3
+    assert done.cache_hits == 3
+    assert done.hashed_bytes == 0
+    assert done.bytes == sum(c[aw.SIZE] for c in tree.values())
+
+
+def test_tqdm_sink_updates_by_difference():
+    bar = FakeBar()
+    progress = ap.Progress([ap.TqdmSink(bar, 'bytes')], interval=0)
+
+    progress.file_indexed(pathlib.Path('a'), 5, 5)
+    progress.file_indexed(pathlib.Path('sub/b'), 7, 7)
+    progress.close()
+
+    assert bar.n == 12
+    assert bar.postfix == {'file': str(pathlib.Path('sub/b'))}
+
+
+def test_index_writes_json_progress(tmp_path):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    read_fd, write_fd = os.pipe()
+    try:
+        aa.index(root, progress_fd=write_fd)
+    finally:
+        os.close(write_fd)
+    with open(read_fd) as file:
+        events = [json.loads(line) for line in file]
+
+    assert events[-1]['kind'] == ap.DONE
+    assert events[-1]['files'] == 3
+    assert events[-1]['hashed_bytes'] == events[-1]['bytes'] > 0
@@ -0,0 +1,33 @@
+import scaling
+
+
+def test_synthesize_tree():
+    tree = scaling.synthesize_tree(1000, duplicate_ratio=0.25)
+
+    assert len(tree) == 1000
+    assert len({(c[0], c[1]) for c in tree.values()}) == 750
+
+
+def test_memory_budgets():
+    # wall time budgets are not checked as they depend on the machine
+    budgets = {name: budget._replace(seconds_per_entry=None)
+               for name, budget in scaling.BUDGETS.items()}
+
+    results = scaling.run(20_000)
+
+    assert [r.function for r in results] == list(scaling.BUDGETS)
+    assert scaling.check_budgets(results, budgets) == []
+
+
+def test_exceeded_budget_is_reported():
+    results = scaling.run(1000, functions=['tree_to_listing'])
+
+    [message] = scaling.check_budgets(
+        results, {'tree_to_listing': scaling.Budget(1, None)})
+    assert message.startswith('tree_to_listing at 1000 entries')
+
+
+def test_parse_entries():
+    assert scaling.parse_entries('50000') == 50_000
+    assert scaling.parse_entries('100k') == 100_000
+    assert scaling.parse_entries('1.5M') == 1_500_000
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import pathlib
+
+import pytest
+
+import alfeios.progress as ap
+import alfeios.walker as aw
+
+MiB = 2 ** 20
+
+
+def create_sparse(path, extents, size):
+    # extents: {offset: data} written in a file of the given size
+    with path.open(mode='wb') as file:
+        file.truncate(size)
+        for offset, data in extents.items():
+            file.seek(offset)
+            file.write(data)
+    content = bytearray(size)
+    for offset, data in extents.items():
+        content[offset:offset + len(data)] = data
+    return hashlib.md5(content).hexdigest()
+
+
+@pytest.mark.parametrize('extents', [
+    {},
+    {0: b'start'},
+    {3 * MiB: b'middle' * 1000},
+    {0: b'a' * 70000, 5 * MiB: b'b', 8 * MiB - 3: b'end'},
+])
+def test_sparse_hash_is_md5(tmp_path, extents):
+    path = tmp_path / 'image.img'
+    expected = create_sparse(path, extents, 8 * MiB)
+
+    hasher = hashlib.md5()
+    with path.open(mode='rb') as file:
+        aw._hash_sparse_content(file, 8 * MiB, hasher)
+
+    assert hasher.hexdigest() == expected
+
+
+def test_walk_skips_holes(tmp_path):
+    root = tmp_path / 'root'
+    root.mkdir()
+    expected = create_sparse(root / 'image.img', {4 * MiB: b'data'}, 16 * MiB)
+    if not aw._is_sparse(os.stat(root / 'image.img')):
+        pytest.skip('sparse files are not supported here')
+    events = []
+    progress = ap.Progress([events.append])
+
+    tree, _ = aw.walk(root, progress=progress)
+    progress.close()
+
+    assert tree[pathlib.Path('image.img')][aw.HASH] == expected
+    assert events[-1].skipped_bytes >= 8 * MiB
+    assert events[-1].hashed_bytes == 16 * MiB
+
+
+@pytest.mark.parametrize('buffering', [128 * 1024, MiB])
+def test_sparse_hash_with_large_buffer(tmp_path, buffering):
+    # many small extents and holes within one buffer of the file object,
+    # whose size is picked by Python from st_blksize (ZFS recordsize...)
+    path = tmp_path / 'image.img'
+    create_sparse(path, {i * 64 * 1024: b'data' * 1000 for i in range(64)},
+                  4 * MiB)
+
+    hasher = hashlib.md5()
+    with path.open(mode='rb', buffering=buffering) as file:
+        aw._hash_sparse_content(file, 4 * MiB, hasher)
+
+    assert hasher.hexdigest() == hashlib.md5(path.read_bytes()).hexdigest()
@@ -0,0 +1,66 @@
+import subprocess
+import sys
+
+# modules that must only be loaded by the commands that use them
+HEAVY_MODULES = ['numpy', 'tqdm', 'socketserver', 'sqlite3', 'statistics',
+                 'concurrent.futures', 'tempfile', 'shutil', 'zipfile',
+                 'alfeios.columnar', 'alfeios.digest', 'alfeios.daemon',
+                 'alfeios.summary', 'alfeios.throttle', 'alfeios.estimate',
+                 'alfeios.external', 'alfeios.dedupe']
+
+# cumulative import time of the command-line interface, in microseconds,
+# with a safety margin over the measure of a reference run (~45 ms)
+BUDGET_US = 150_000
+
+
+def import_times(module):
+    """ Imports a module in a new interpreter with -X importtime
+
+    Returns:
+        dict = {str: int}: cumulative import time in microseconds of each
+                           module imported
+    """
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    times = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_does_not_import_heavy_modules():
+    times = import_times('alfeios.cli')
+
+    assert 'alfeios.api' in times
+    assert [m for m in HEAVY_MODULES if m in times] == []
+
+
+def test_cli_import_time_budget():
+    # best of 3 runs, to be robust to a busy machine
+    cli_time = min(import_times('alfeios.cli')['alfeios.cli']
+                   for _ in range(3))
+
+    assert cli_time < BUDGET_US
+
+
+def test_lazy_import_from_threads():
+    # first accesses racing in several threads, as in missing
+    code = ('import concurrent.futures, threading\n'
+            'import alfeios.tool as at\n'
+            "adg = at.lazy_import('alfeios.digest')\n"
+            'barrier = threading.Barrier(8)\n'
+            'def first_access(_):\n'
+            '    barrier.wait()\n'
+            '    return adg.get_digest_path\n'
+            'with concurrent.futures.ThreadPoolExecutor(8) as executor:\n'
+            '    print(len(set(executor.map(first_access, range(8)))))')
+
+    result = subprocess.run([sys.executable, '-c', code],
+                            capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == '1'
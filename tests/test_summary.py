@@ -0,0 +1,86 @@
+import hashlib
+import pathlib
+import random
+
+import pytest
+
+import alfeios.api as aa
+import alfeios.serialize as asd
+import alfeios.summary as asm
+import helper as h
+
+
+def synthesize_tree(n, seed):
+    rng = random.Random(seed)
+    return {pathlib.Path(f'file{i}'): (
+        hashlib.md5(str(rng.random()).encode()).hexdigest(),
+        rng.randrange(1000), 1.0) for i in range(n)}
+
+
+@pytest.fixture
+def trees():
+    old = synthesize_tree(2000, seed=0)
+    new = synthesize_tree(1000, seed=1)
+    # half of the old contents are in the new tree, under other paths
+    shared = list(old.values())[:1000]
+    new.update({pathlib.Path(f'copy{i}'): c for i, c in enumerate(shared)})
+    new[pathlib.Path('not_hashed')] = ('', 10, 1.0)
+    return old, new
+
+
+def test_exact_summary(tmp_path, trees):
+    old, new = trees
+    asm.save_summary(new, tmp_path / asm.SUFFIX)
+
+    missing = asm.get_missing(old.items(), tmp_path / asm.SUFFIX)
+
+    assert set(missing) == {(c[0], c[1]) for c in list(old.values())[1000:]}
+    assert (tmp_path / asm.SUFFIX).stat().st_size == \
+        asm.HEADER.size + 2000 * asm.KEY_SIZE
+
+
+def test_bloom_summary(tmp_path, trees):
+    old, new = trees
+    asm.save_summary(new, tmp_path / asm.SUFFIX, false_positive_rate=0.01)
+
+    missing = asm.get_missing(old.items(), tmp_path / asm.SUFFIX)
+
+    expected = {(c[0], c[1]) for c in list(old.values())[1000:]}
+    assert set(missing) <= expected  # no false negative
+    assert len(missing) > 0.95 * len(expected)
+    assert (tmp_path / asm.SUFFIX).stat().st_size < 2000 * 2
+
+
+@pytest.mark.parametrize('rate', [0, 1, 1.5, -0.01, float('nan')])
+def test_bloom_rate_must_be_between_0_and_1(tmp_path, trees, rate):
+    _, new = trees
+
+    with pytest.raises(ValueError):
+        asm.save_summary(new, tmp_path / asm.SUFFIX, false_positive_rate=rate)
+    assert not (tmp_path / asm.SUFFIX).exists()
+
+
+def test_empty_summary(tmp_path, trees):
+    old, _ = trees
+    asm.save_summary({}, tmp_path / asm.SUFFIX, false_positive_rate=0.01)
+
+    assert len(asm.get_missing(old.items(), tmp_path / asm.SUFFIX)) == 2000
+    assert not asm.is_summary(tmp_path / 'absent.bin')
+
+
+def test_missing_against_summary(tmp_path):
+    old_root = tmp_path / 'old'
+    new_root = tmp_path / 'new'
+    h.create_tree(old_root, {'a.txt': 'shared content',
+                             'b.txt': 'old content'})
+    h.create_tree(new_root, {'c.txt': 'shared content'})
+    aa.index(new_root)
+    aa.summary(new_root)
+    [summary_path] = (new_root / '.alfeios').glob('*' + asm.SUFFIX)
+
+    aa.missing(old_root, summary_path)
+
+    [listing_path] = (old_root / '.alfeios').glob('*_missing.json')
+    listing = asd.load_json_listing(listing_path)
+    assert [p for pointers in listing.values() for p, _ in pointers] == [
+        pathlib.Path('b.txt')]
@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import alfeios.api as aa
+import alfeios.serialize as asd
+import alfeios.throttle as athr
+import alfeios.walker as aw
+import helper as h
+
+
+FILES = {f'{i}.txt': str(i) * 50_000 for i in range(4)}
+
+
+def test_token_bucket_rate():
+    bucket = athr._TokenBucket(1000, burst=0.01)
+
+    start = time.monotonic()
+    for _ in range(20):
+        bucket.take(10)
+
+    # 200 tokens at 1000 per second, after a burst of 10
+    assert time.monotonic() - start >= 0.15
+
+
+@pytest.mark.parametrize('options, field', [
+    (dict(bytes_per_second=1_000_000), 'bytes'),  # 200 kB
+    (dict(files_per_second=20), 'files')])  # 4 files
+def test_walk_is_throttled(tmp_path, options, field):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    throttle = athr.Throttle(**options)
+    getattr(throttle, field).tokens = 0  # no initial burst
+
+    start = time.monotonic()
+    tree, _ = aw.walk(root, throttle=throttle)
+
+    assert time.monotonic() - start >= 0.15
+    assert tree == aw.walk(root)[0]
+
+
+def test_backoff():
+    throttle = athr.Throttle(max_latency=0.5)
+
+    backoffs = []
+    for latency in [1, 1, 1, 0, 0, 0, 0, 0]:
+        throttle.block_read(athr.MIN_BACKOFF, latency)
+        backoffs.append(throttle.backoff)
+
+    assert backoffs == [0.01, 0.02, 0.04, 0.02, 0.01, 0, 0, 0]
+
+
+def test_index_throttled(tmp_path):
+    root = h.create_tree(tmp_path / 'root', FILES)
+    expected_tree, _ = aw.walk(root)
+
+    aa.index(root, max_rate='100MiB', max_files=1000, max_latency='1s')
+
+    assert asd.load_last_json_tree(root) == expected_tree
+
+
+def test_lower_priority():
+    # in another process not to slow down the tests
+    result = subprocess.run(
+        [sys.executable, '-c', 'import os, alfeios.throttle as athr;'
+         ' athr.lower_priority(); print(os.nice(0))'],
+        capture_output=True, text=True, check=True)
+
+    if hasattr(os, 'nice'):
+        assert result.stdout.strip() == '19'
@@ -0,0 +1,58 @@
+import json
+import os
+
+import pytest
+
+import alfeios.api as aa
+import alfeios.trace as atr
+import alfeios.walker as aw
+import helper as h
+
+
+def create_root(path):
+    h.create_tree(path / 'folder', {'small.txt': 'small content',
+                                    'large.txt': 'x' * 4096})
+    h.create_zip(path / 'archive', h.DT_TUPLE1, path / 'folder')
+    return path
+
+
+def spans(tracer, category):
+    return {e['name']: e for e in tracer.events if e['cat'] == category}
+
+
+@pytest.mark.parametrize('archive_workers', [None, 2])
+def test_walk_spans(tmp_path, archive_workers):
+    root = create_root(tmp_path / 'root')
+    tracer = atr.Tracer(min_file_size=1024, min_duration=0)
+
+    tree, _ = aw.walk(root, tracer=tracer, archive_workers=archive_workers)
+
+    assert set(spans(tracer, atr.HASH)) == {'folder/large.txt'}
+    assert spans(tracer, atr.HASH)['folder/large.txt']['args'] == {
+        'size': 4096}
+    assert set(spans(tracer, atr.DIRECTORY)) == {'.', 'folder'}
+    assert spans(tracer, atr.DIRECTORY)['.']['args'] == {'entries': 2}
+    archive = spans(tracer, atr.ARCHIVE)['archive.zip']
+    assert archive['args'] == {'files': 2}
+    assert (archive['pid'] == os.getpid()) == (archive_workers is None)
+    root_span = spans(tracer, atr.DIRECTORY)['.']
+    for event in tracer.events:  # nested in the walk of the root
+        assert event['dur'] >= 0
+        assert root_span['ts'] <= event['ts']
+    assert tree == aw.walk(root)[0]
+
+
+def test_index_trace(tmp_path):
+    root = create_root(tmp_path / 'root')
+    trace_path = tmp_path / 'trace.json'
+
+    aa.index(root, trace=trace_path)
+
+    trace = json.loads(trace_path.read_text())
+    events = trace['traceEvents']
+    assert {e['cat'] for e in events if e['ph'] == 'X'} >= {
+        atr.CACHE, atr.ARCHIVE, atr.SERIALIZE}
+    assert [e['args']['name'] for e in events if e['ph'] == 'M'] == [
+        'alfeios']
+    assert all({'name', 'ts', 'dur', 'pid', 'tid'} <= e.keys()
+               for e in events if e['ph'] == 'X')
@@ -0,0 +1,73 @@
+import pathlib
+
+import alfeios.api as aa
+import alfeios.listing as al
+import alfeios.serialize as asd
+import alfeios.verify as av
+import alfeios.walker as aw
+import helper as h
+
+
+contents = {
+    'a.txt': 'aaaa',
+    'b.txt': 'aaab',
+    'sub/b.txt': 'aaab',
+    'sub/c.txt': 'baaa',
+    'sub/d.txt': 'aaaa',
+    'e.txt': 'unique content',
+    'f.txt': '',
+    'sub/f.txt': '',
+}
+
+
+def expected_duplicate(root):
+    tree, _ = aw.walk(root)
+    return al.get_duplicate(al.tree_to_listing(tree))
+
+
+def test_compare_is_get_duplicate(tmp_path):
+    root = h.create_tree(tmp_path / 'root', contents)
+    tree, _ = aw.walk(root, should_hash=False)
+
+    # block_size=1 splits groups at each byte
+    for max_compared in (0, 2, 8):
+        assert av.get_duplicate(root, tree, max_compared=max_compared,
+                                block_size=1) == expected_duplicate(root)
+
+
+def test_compare_with_hashed_files(tmp_path):
+    root = h.create_tree(tmp_path / 'root', contents)
+    tree, _ = aw.walk(root, should_hash=False)
+    tree[pathlib.Path('a.txt')] = aw.index_file(root / 'a.txt')
+
+    assert av.get_duplicate(root, tree) == expected_duplicate(root)
+
+
+def test_compare_min_size(tmp_path):
+    root = h.create_tree(tmp_path / 'root', contents)
+    tree, _ = aw.walk(root, should_hash=False)
+
+    duplicate, size_gain = av.get_duplicate(root, tree, min_size=1)
+
+    assert {size for _, size in duplicate} == {4}
+    assert size_gain == 8
+
+
+def test_duplicate_compare(tmp_path):
+    root = h.create_tree(tmp_path / 'root', contents)
+    h.create_zip(root / 'archive', h.DT_TUPLE1, root / 'sub')
+    aa.duplicate(root)
+    expected = asd.load_json_listing(_pop_duplicate_listing(root))
+
+    aa.duplicate(root, compare=True)
+
+    listing = asd.load_json_listing(_pop_duplicate_listing(root))
+    assert listing == expected
+    assert any('archive.zip' in str(p) for pointers in listing.values()
+               for p, _ in pointers)
+
+
+def _pop_duplicate_listing(root):
+    # renamed so that the next listing does not collide with it
+    [path] = (root / '.alfeios').glob('*_listing_duplicate.json')
+    return path.rename(path.with_suffix('.done'))
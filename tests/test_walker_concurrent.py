@@ -0,0 +1,49 @@
+import concurrent.futures
+import os
+import pathlib
+
+import alfeios.walker as aw
+import helper as h
+
+
+def create_folder(path, nb_files):
+    files = dict()
+    for i in range(nb_files):
+        files[f'file{i}.txt'] = f'content {i}'
+        files[f'sub/file{i}.txt'] = f'other {i}'
+    h.create_tree(path, files)
+
+
+def test_walk_does_not_change_cwd(tmp_path):
+    create_folder(tmp_path / 'root', 3)
+    cwd = os.getcwd()
+
+    tree, forbidden = aw.walk(tmp_path / 'root')
+
+    assert os.getcwd() == cwd
+    assert set(tree) == {pathlib.Path(f'file{i}.txt') for i in range(3)} | {
+        pathlib.Path(f'sub/file{i}.txt') for i in range(3)}
+    assert forbidden == {}
+
+
+def test_walk_does_not_mutate_exclusion(tmp_path):
+    create_folder(tmp_path / 'root', 2)
+    exclusion = {'sub'}
+
+    tree, forbidden = aw.walk(tmp_path / 'root', exclusion=exclusion)
+
+    assert exclusion == {'sub'}
+    assert set(tree) == {pathlib.Path('file0.txt'), pathlib.Path('file1.txt')}
+
+
+def test_concurrent_walks(tmp_path):
+    create_folder(tmp_path / 'old', 20)
+    create_folder(tmp_path / 'new', 30)
+    expected_old = aw.walk(tmp_path / 'old')
+    expected_new = aw.walk(tmp_path / 'new')
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        old = executor.submit(aw.walk, tmp_path / 'old')
+        new = executor.submit(aw.walk, tmp_path / 'new')
+        assert old.result() == expected_old
+        assert new.result() == expected_new
@@ -0,0 +1,65 @@
+import os
+import pathlib
+import shutil
+
+import pytest
+
+import alfeios.walker as aw
+import helper as h
+
+
+@pytest.fixture
+def root(tmp_path):
+    path = tmp_path / 'root'
+    h.create_tree(path, {'a.txt': 'a content', 'b.txt': 'b content'})
+    try:
+        os.setxattr(path / 'a.txt', 'user.test', b'1')
+        os.removexattr(path / 'a.txt', 'user.test')
+    except (AttributeError, OSError):
+        pytest.skip('extended attributes are not supported here')
+    return path
+
+
+def count_reads(monkeypatch):
+    reads = []
+    original = pathlib.Path.open
+
+    def open_and_count(self, *args, **kwargs):
+        reads.append(self.name)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(pathlib.Path, 'open', open_and_count)
+    return reads
+
+
+def test_xattr_is_used_from_another_root(root, tmp_path, monkeypatch):
+    expected_tree, _ = aw.walk(root)
+    aw.walk(root, use_xattr=True)
+    copy = tmp_path / 'copy'
+    shutil.copytree(root, copy)  # copies extended attributes and mtimes
+
+    reads = count_reads(monkeypatch)
+    tree, _ = aw.walk(copy, use_xattr=True)
+
+    assert tree == expected_tree
+    assert reads == []
+
+
+def test_xattr_is_ignored_when_file_changed(root, monkeypatch):
+    aw.walk(root, use_xattr=True)
+    h.create_txt(root / 'a.txt', h.DT_TUPLE2, 'a new content')
+    expected_tree, _ = aw.walk(root)
+
+    reads = count_reads(monkeypatch)
+    tree, _ = aw.walk(root, use_xattr=True)
+
+    assert tree == expected_tree
+    assert reads == ['a.txt']
+    assert os.getxattr(root / 'a.txt', aw.XATTR_NAME).split()[0] == \
+        tree[pathlib.Path('a.txt')][aw.HASH].encode()
+
+
+def test_xattr_is_not_written_by_default(root):
+    aw.walk(root)
+
+    assert aw.XATTR_NAME not in os.listxattr(root / 'a.txt')